@@ -0,0 +1,443 @@
+import argparse
+import json
+import logging
+import os
+import sys
+from typing import Optional, List
+
+# Add src to python path so `services.*` imports work when run directly
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.insert(0, current_dir)
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+def cmd_convert(args) -> int:
+    from services.convert_service import ConvertOnnxModel
+    converter = ConvertOnnxModel()
+    success = converter.convert(
+        args.input, args.output, args.framework, args.shapes, args.opset, not args.no_optimize,
+        exporter=args.exporter, dynamic=args.dynamic
+    )
+    print(json.dumps(converter.last_report, indent=2, default=str))
+    return 0 if success else 1
+
+
+def cmd_matrix(args) -> int:
+    from services.export_matrix_service import ExportMatrix
+    shape_variants = {}
+    for item in args.shapes or []:
+        name, _, spec = item.partition("=")
+        shape_variants[name] = {"input_shapes": spec or None}
+    if args.dynamic:
+        base = next(iter(shape_variants.values()), {})
+        shape_variants["dynamic"] = {"input_shapes": base.get("input_shapes"), "dynamic": True}
+
+    matrix = ExportMatrix()
+    rows = matrix.run(args.input, args.output_dir, args.opsets, shape_variants or None, args.quant,
+                      exporter=args.exporter, calibration_data_path=args.calib_data,
+                      max_workers=args.workers, benchmark=not args.no_benchmark,
+                      seq_len=args.seq_len, iterations=args.iterations)
+    print(ExportMatrix.format_table(rows))
+    return 0 if all(r["status"] == "ok" for r in rows) else 1
+
+
+def cmd_compact(args) -> int:
+    from services.compact_service import ModelCompactor
+    report = ModelCompactor().compact(args.model, args.output, share_transposed=args.share_tied)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+def cmd_quantize(args) -> int:
+    from services.quantize_service import QuantizeModel
+    success = QuantizeModel().quantize(
+        args.input, args.output, args.strategy, args.method, args.type, args.per_channel, args.calib_data,
+        args.calib_workers, not args.no_calib_table
+    )
+    return 0 if success else 1
+
+
+def cmd_hf_export(args) -> int:
+    from services.transformers_service import TransformersService
+    return 0 if TransformersService().convert_from_hub(args.model_id, args.output, args.task) else 1
+
+
+def cmd_optimize_ort(args) -> int:
+    from services.ort_export_service import OptimizedModelExporter
+    manifest = OptimizedModelExporter().export(args.model, optimization_level=args.level,
+                                               save_ort_format=args.ort_format)
+    print(json.dumps(manifest, indent=2))
+    return 0
+
+
+def cmd_fuse(args) -> int:
+    from services.fusion_service import DecoderFusion, FUSION_STAGES
+    report = DecoderFusion().fuse(args.model, args.output, args.config, tuple(args.stages or FUSION_STAGES),
+                                  verify=not args.no_verify, atol=args.atol)
+    print(json.dumps(report, indent=2, default=str))
+    return 0
+
+
+def cmd_tune(args) -> int:
+    from services.autotune_service import SessionTuner
+    result = SessionTuner().tune(args.model, args.batch_size, args.seq_len, args.input_spec,
+                                 objective=args.objective, save=not args.no_save)
+    print(json.dumps(result, indent=2, default=str))
+    return 0
+
+
+def cmd_benchmark(args) -> int:
+    from services.benchmark_service import BenchmarkModel
+    from services.profiling_service import OpProfiler
+    result = BenchmarkModel().benchmark(args.model, args.batch_size, args.seq_len, args.input_spec,
+                                        warmup=args.warmup, iterations=args.iterations,
+                                        profile_ops=args.profile_ops)
+    report = result.pop("op_report", None)
+    print(json.dumps(result, indent=2, default=str))
+    if report:
+        print(OpProfiler.format_table(report["by_op_type"]))
+        print(f"Q/DQ overhead: {report['quantization_overhead_pct']:.1f}%, "
+              f"quantized compute: {report['quantized_compute_pct']:.1f}%")
+        if args.op_report:
+            OpProfiler().export(report, args.op_report)
+    return 0
+
+
+def cmd_analyze(args) -> int:
+    from services.analyzer_service import ModelAnalyzer
+    analyzer = ModelAnalyzer()
+    reports = [analyzer.analyze(path, args.batch_size, args.seq_len) for path in args.models]
+    for report in reports:
+        print(f"\n{report['model_path']}")
+        print(ModelAnalyzer.format_table(report["by_op_type"]))
+    if len(reports) > 1:
+        print()
+        print(ModelAnalyzer.compare(reports))
+    if args.output:
+        analyzer.export(reports[0] if len(reports) == 1 else {"models": reports}, args.output)
+    return 0
+
+
+def cmd_generate(args) -> int:
+    from services.generation_service import GenerationService
+    generator = GenerationService()
+    generator.load(args.model)
+    if args.draft:
+        generator.load_draft(args.draft)
+    if generator.tokenizer is None:
+        raise ValueError("No tokenizer found next to the model.")
+
+    prompt_ids = generator.tokenizer(args.prompt)["input_ids"]
+    result = generator.generate(prompt_ids, args.max_new_tokens, generator.tokenizer.eos_token_id,
+                                args.temperature, args.top_k,
+                                num_draft_tokens=args.num_draft_tokens if args.draft else 0)
+    print(generator.tokenizer.decode(result["tokens"], skip_special_tokens=True))
+    stats = {k: v for k, v in result.items() if k != "tokens"}
+    print(json.dumps(stats, indent=2), file=sys.stderr)
+    return 0
+
+
+def cmd_bulk(args) -> int:
+    from services.bulk_inference_service import BulkInference
+    options = {"text_field": args.text_field, "id_field": args.id_field, "batch_size": args.batch_size,
+               "max_new_tokens": args.max_new_tokens, "prefix_cache_mb": args.prefix_cache_mb}
+    if args.top_k is not None:
+        options["top_k"] = args.top_k
+    summary = BulkInference().run(args.input, args.output, args.model, args.task, args.workers,
+                                  args.threads_per_worker, args.chunk_size, resume=not args.restart,
+                                  options=options)
+    print(json.dumps(summary, indent=2))
+    return 0 if summary["errors"] == 0 else 2
+
+
+def _read_lines(path: str) -> List[str]:
+    with open(path, "r") as f:
+        return [line.rstrip("\n") for line in f]
+
+
+def cmd_index(args) -> int:
+    from services.embedding_service import EmbeddingService
+    if os.path.exists(os.path.join(args.store, "meta.json")):
+        raise ValueError(f"A vector store already exists at {args.store}")
+    service = EmbeddingService()
+    service.load(args.model, pooling=args.pooling)
+    # Ids are line numbers of the input, so search results map back to it
+    lines = _read_lines(args.input)
+    ids = [i for i, line in enumerate(lines) if line.strip()]
+    store = service.index([lines[i] for i in ids], ids=ids, batch_size=args.batch_size,
+                          store_path=args.store, store_dtype=args.dtype)
+    if args.ivf_lists:
+        store.build_ivf(args.ivf_lists)
+    store.save()
+    print(json.dumps({"store": args.store, "vectors": len(store), "dim": store.dim,
+                      "ivf_lists": args.ivf_lists or None}, indent=2))
+    return 0
+
+
+def cmd_search(args) -> int:
+    from services.embedding_service import EmbeddingService
+    from services.vector_store import VectorStore
+    service = EmbeddingService()
+    service.load(args.model, pooling=args.pooling)
+    store = VectorStore.load(args.store, mode="r")
+    lines = _read_lines(args.texts) if args.texts else None
+    scores, ids = service.search(store, args.queries, args.k, args.nprobe)
+    results = []
+    for query, row_scores, row_ids in zip(args.queries, scores, ids):
+        hits = [{"id": int(i), "score": float(s), **({"text": lines[i]} if lines else {})}
+                for s, i in zip(row_scores, row_ids) if i >= 0]
+        results.append({"query": query, "results": hits})
+    print(json.dumps(results, indent=2))
+    return 0
+
+
+def cmd_train(args) -> int:
+    from services.train_service import TrainModel
+    trainer = TrainModel()
+    trainer.train(args.input, args.output, args.mode, args.data, args.shapes, args.steps, args.lr,
+                  args.batch_size, args.calibration_steps, exclude=args.exclude, lora_rank=args.lora_rank,
+                  lora_alpha=args.lora_alpha, lora_dropout=args.lora_dropout, lora_targets=args.lora_targets,
+                  opset_version=args.opset, exporter=args.exporter, dynamic=args.dynamic)
+    print(json.dumps(trainer.last_report, indent=2, default=str))
+    return 0
+
+
+def cmd_plan(args) -> int:
+    from services.planner_service import BatchPlanner
+    plan = BatchPlanner().plan(args.model, args.mode, args.memory_mb, args.seq_lens, args.shapes,
+                               args.max_batch_size, args.iterations, save=not args.no_save)
+    for seq_len, entry in plan[args.mode]["seq_lens"].items():
+        print(f"seq_len={seq_len}: max batch {entry['max_batch_size']}, "
+              f"recommended {entry['recommended_batch_size']}")
+    print(json.dumps(plan, indent=2, default=str))
+    return 0
+
+
+def cmd_serve(args) -> int:
+    from services.inference_server import main as serve_main
+    serve_main(args.server_args)
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="model-forge-cli", description="ModelForge command line interface.")
+    parser.add_argument("--trace", default=None, help="Append stage timing/memory events to this JSON-lines file.")
+    parser.add_argument("--quiet", action="store_true", help="Do not print stage events to stderr.")
+    parser.add_argument("--torch-logs", default=None, help="Value for TORCH_LOGS (e.g. 'onnx') during export.")
+    parser.add_argument("--log-level", default="INFO")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("convert", help="Convert a PyTorch/TensorFlow model to ONNX.")
+    p.add_argument("input")
+    p.add_argument("output")
+    p.add_argument("--framework", default="PyTorch")
+    p.add_argument("--shapes", default=None, help='Input shapes, e.g. "int64[1,128],int64[1,128]".')
+    p.add_argument("--opset", type=int, default=17)
+    p.add_argument("--no-optimize", action="store_true")
+    p.add_argument("--exporter", default="legacy", choices=["legacy", "dynamo", "auto"])
+    p.add_argument("--dynamic", action="store_true", help="Dynamic batch (and sequence) dimensions.")
+    p.set_defaults(func=cmd_convert)
+
+    p = sub.add_parser("matrix", help="Export all opset/shape/quantization variants from one model load.")
+    p.add_argument("input")
+    p.add_argument("output_dir")
+    p.add_argument("--opsets", type=int, nargs="+", default=[18, 16, 15])
+    p.add_argument("--shapes", nargs="*", metavar="NAME=SPEC",
+                   help='Static shape variants, e.g. b1="int64[1,128]" b8="int64[8,128]".')
+    p.add_argument("--dynamic", action="store_true", help="Add a dynamic batch/sequence variant.")
+    p.add_argument("--quant", nargs="*", default=["dynamic-int8"],
+                   help="Quantization presets applied to every export (see QUANT_PRESETS).")
+    p.add_argument("--exporter", default="legacy", choices=["legacy", "dynamo", "auto"])
+    p.add_argument("--calib-data", default=None)
+    p.add_argument("--workers", type=int, default=None)
+    p.add_argument("--no-benchmark", action="store_true")
+    p.add_argument("--seq-len", type=int, default=128)
+    p.add_argument("--iterations", type=int, default=20)
+    p.set_defaults(func=cmd_matrix)
+
+    p = sub.add_parser("compact", help="Deduplicate and strip initializers of an ONNX model.")
+    p.add_argument("model")
+    p.add_argument("--output", default=None, help="Write to a new file instead of rewriting in place.")
+    p.add_argument("--share-tied", action="store_true",
+                   help="Replace transposed (tied) weights with a Transpose node; blocks quantizing them.")
+    p.set_defaults(func=cmd_compact)
+
+    p = sub.add_parser("quantize", help="Quantize an ONNX model.")
+    p.add_argument("input")
+    p.add_argument("output")
+    p.add_argument("--strategy", default="Dynamic", choices=["Dynamic", "Static"])
+    p.add_argument("--method", default="MinMax", choices=["MinMax", "Entropy", "Percentile"])
+    p.add_argument("--type", default="INT8", choices=["INT8", "UINT8", "QDQ"])
+    p.add_argument("--per-channel", action="store_true")
+    p.add_argument("--calib-data", default=None, help="Calibration data (.npz, .npy, .json or .txt).")
+    p.add_argument("--calib-workers", type=int, default=0,
+                   help="Sharded calibration over N worker processes (0 = single process).")
+    p.add_argument("--no-calib-table", action="store_true",
+                   help="Always recalibrate instead of reusing <model>.calibration/ entries.")
+    p.set_defaults(func=cmd_quantize)
+
+    p = sub.add_parser("hf-export", help="Download and export a Hugging Face model.")
+    p.add_argument("model_id")
+    p.add_argument("output")
+    p.add_argument("--task", default=None)
+    p.set_defaults(func=cmd_hf_export)
+
+    p = sub.add_parser("optimize-ort", help="Save the ORT-optimized graph next to a model.")
+    p.add_argument("model")
+    p.add_argument("--level", default="extended", choices=["basic", "extended", "all"])
+    p.add_argument("--ort-format", action="store_true")
+    p.set_defaults(func=cmd_optimize_ort)
+
+    p = sub.add_parser("fuse", help="Fuse RMSNorm/rotary/attention of a decoder into ORT contrib ops.")
+    p.add_argument("model")
+    p.add_argument("--output", default=None, help="Defaults to <model>.fused.onnx.")
+    p.add_argument("--config", default=None, help="HF config.json (defaults to the one next to the model).")
+    p.add_argument("--stages", nargs="*", choices=["rmsnorm", "rotary", "gqa"], default=None)
+    p.add_argument("--no-verify", action="store_true", help="Skip the onnxruntime comparison with the unfused graph.")
+    p.add_argument("--atol", type=float, default=1e-3)
+    p.set_defaults(func=cmd_fuse)
+
+    for name, func in (("tune", cmd_tune), ("benchmark", cmd_benchmark)):
+        p = sub.add_parser(name)
+        p.add_argument("model")
+        p.add_argument("--batch-size", type=int, default=1, help="0 = the model's planned batch size.")
+        p.add_argument("--seq-len", type=int, default=128)
+        p.add_argument("--input-spec", default=None)
+        p.set_defaults(func=func)
+        if name == "tune":
+            p.add_argument("--objective", default="latency", choices=["latency", "throughput"])
+            p.add_argument("--no-save", action="store_true")
+        else:
+            p.add_argument("--warmup", type=int, default=5)
+            p.add_argument("--iterations", type=int, default=50)
+            p.add_argument("--profile-ops", action="store_true")
+            p.add_argument("--op-report", default=None, help="Write the hot-op report to .csv or .json.")
+
+    p = sub.add_parser("analyze", help="Static FLOPs/parameter/activation-memory estimate (no model run).")
+    p.add_argument("models", nargs="+", help="One or more .onnx files, e.g. original, optimized and quantized.")
+    p.add_argument("--batch-size", type=int, default=1)
+    p.add_argument("--seq-len", type=int, default=128)
+    p.add_argument("--output", default=None, help="Write the report(s) to a JSON file.")
+    p.set_defaults(func=cmd_analyze)
+
+    p = sub.add_parser("generate", help="Generate text with an ONNX decoder (optionally speculative).")
+    p.add_argument("model")
+    p.add_argument("prompt")
+    p.add_argument("--max-new-tokens", type=int, default=64)
+    p.add_argument("--temperature", type=float, default=0.0)
+    p.add_argument("--top-k", type=int, default=0)
+    p.add_argument("--draft", default=None, help="Draft decoder for speculative decoding.")
+    p.add_argument("--num-draft-tokens", type=int, default=4)
+    p.set_defaults(func=cmd_generate)
+
+    p = sub.add_parser("bulk", help="Score a JSONL file offline with worker processes (resumable).")
+    p.add_argument("model")
+    p.add_argument("input", help="JSONL input, one JSON object per line.")
+    p.add_argument("output", help="JSONL output; <output>.checkpoint.json tracks progress.")
+    p.add_argument("--task", default="embed", choices=["embed", "classify", "generate", "raw"])
+    p.add_argument("--workers", type=int, default=0, help="Worker processes (0 = half the CPUs).")
+    p.add_argument("--threads-per-worker", type=int, default=0, help="ORT intra-op threads (0 = CPUs / workers).")
+    p.add_argument("--chunk-size", type=int, default=256, help="Records per work item and checkpoint.")
+    p.add_argument("--text-field", default="text")
+    p.add_argument("--id-field", default="id")
+    p.add_argument("--batch-size", type=int, default=32)
+    p.add_argument("--top-k", type=int, default=None)
+    p.add_argument("--max-new-tokens", type=int, default=32)
+    p.add_argument("--prefix-cache-mb", type=float, default=0.0)
+    p.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint and start over.")
+    p.set_defaults(func=cmd_bulk)
+
+    p = sub.add_parser("index", help="Embed a text file (one text per line) into a memory-mapped vector store.")
+    p.add_argument("model", help="Exported feature-extraction model (.onnx or export directory).")
+    p.add_argument("input", help="Text file; vector ids are line numbers, empty lines are skipped.")
+    p.add_argument("store", help="Directory of the new vector store.")
+    p.add_argument("--pooling", default="mean", choices=["mean", "cls"])
+    p.add_argument("--batch-size", type=int, default=32)
+    p.add_argument("--dtype", default="float32", choices=["float32", "float16"])
+    p.add_argument("--ivf-lists", type=int, default=0, help="Build an IVF index with this many lists (0 = brute force).")
+    p.set_defaults(func=cmd_index)
+
+    p = sub.add_parser("search", help="Find the nearest indexed texts for queries.")
+    p.add_argument("model", help="The model the store was built with.")
+    p.add_argument("store")
+    p.add_argument("queries", nargs="+")
+    p.add_argument("--pooling", default="mean", choices=["mean", "cls"])
+    p.add_argument("--k", type=int, default=10)
+    p.add_argument("--nprobe", type=int, default=None, help="IVF lists to scan (default: brute force).")
+    p.add_argument("--texts", default=None, help="The indexed text file, to print the matching lines.")
+    p.set_defaults(func=cmd_search)
+
+    p = sub.add_parser("train", help="Fine-tune a PyTorch model and export it (qat: QDQ ONNX with trained scales, "
+                                            "lora: adapters merged before export).")
+    p.add_argument("input")
+    p.add_argument("output")
+    p.add_argument("--mode", default="qat", choices=["qat", "lora"])
+    p.add_argument("--data", default=None, help=".pt/.npy/.npz training inputs; a 'labels' entry enables a supervised loss.")
+    p.add_argument("--shapes", default=None, help='Input shapes when no data is given, e.g. "int64[1,128]".')
+    p.add_argument("--steps", type=int, default=200)
+    p.add_argument("--lr", type=float, default=1e-5)
+    p.add_argument("--batch-size", type=int, default=8, help="0 = the model's planned training batch size.")
+    p.add_argument("--calibration-steps", type=int, default=16)
+    p.add_argument("--exclude", nargs="*", default=[], help="Module name substrings left untouched.")
+    p.add_argument("--lora-rank", type=int, default=8)
+    p.add_argument("--lora-alpha", type=float, default=16.0)
+    p.add_argument("--lora-dropout", type=float, default=0.0)
+    p.add_argument("--lora-targets", nargs="*", default=None, help="Projection names to adapt (default: attention/MLP).")
+    p.add_argument("--opset", type=int, default=17)
+    p.add_argument("--exporter", default="legacy", choices=["legacy", "dynamo", "auto"],
+                   help="Exporter for lora (qat always uses legacy).")
+    p.add_argument("--dynamic", action="store_true")
+    p.set_defaults(func=cmd_train)
+
+    p = sub.add_parser("plan", help="Probe batch sizes under a memory budget and save <model>.plan.json.")
+    p.add_argument("model", help=".onnx (inference) or PyTorch model (inference or training).")
+    p.add_argument("--mode", default="inference", choices=["inference", "training"])
+    p.add_argument("--memory-mb", type=float, default=None, help="Peak RSS budget (default: 80%% of available memory).")
+    p.add_argument("--seq-lens", type=int, nargs="+", default=[128])
+    p.add_argument("--shapes", default=None, help='Input spec/shapes, e.g. "int64[1,128]" (batch axis is searched).')
+    p.add_argument("--max-batch-size", type=int, default=1024)
+    p.add_argument("--iterations", type=int, default=5)
+    p.add_argument("--no-save", action="store_true")
+    p.set_defaults(func=cmd_plan)
+
+    p = sub.add_parser("serve", help="Run the inference server (arguments are passed through).")
+    p.add_argument("server_args", nargs=argparse.REMAINDER)
+    p.set_defaults(func=cmd_serve)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=getattr(logging, args.log_level.upper(), logging.INFO),
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    if args.torch_logs:
+        # Must be set before torch is imported by the services
+        os.environ["TORCH_LOGS"] = args.torch_logs
+
+    from services.instrumentation import tracer, JsonLinesSink, console_sink
+    unsubscribers = []
+    sink = None
+    if args.trace:
+        sink = JsonLinesSink(args.trace)
+        unsubscribers.append(tracer.subscribe(sink))
+    if not args.quiet:
+        unsubscribers.append(tracer.subscribe(console_sink))
+
+    try:
+        return args.func(args)
+    except Exception as e:
+        logger.error(f"{args.command} failed: {e}")
+        return 1
+    finally:
+        for unsubscribe in unsubscribers:
+            unsubscribe()
+        if sink is not None:
+            sink.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,281 @@
+import json
+import logging
+import os
+from collections import defaultdict
+from typing import Optional, Dict, List, Any, Tuple
+
+import numpy as np
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+MATMUL_OPS = {"MatMul", "MatMulInteger", "QLinearMatMul", "MatMulIntegerToFloat", "DynamicQuantizeMatMul",
+              "MatMulNBits", "FusedMatMul"}
+CONV_OPS = {"Conv", "ConvInteger", "QLinearConv", "FusedConv"}
+ATTENTION_OPS = {"Attention", "MultiHeadAttention", "GroupQueryAttention"}
+# Ops that only move or reinterpret data
+ZERO_COST_OPS = {"Reshape", "Squeeze", "Unsqueeze", "Flatten", "Identity", "Shape", "Constant",
+                 "ConstantOfShape", "Gather", "Slice", "Concat", "Split", "Transpose", "Cast", "Expand"}
+
+Shape = Optional[List[int]]
+
+
+def _prod(dims) -> int:
+    return int(np.prod(dims, dtype=np.int64)) if dims else 1
+
+
+class ModelAnalyzer:
+    """
+    Service to estimate compute and memory of an ONNX graph without running it.
+
+    Symbolic dimensions are pinned to the requested batch/sequence length,
+    shapes are propagated with symbolic shape inference, and every node is
+    costed (MACs, FLOPs, parameter bytes). Peak activation memory is found by
+    replaying the graph in order and freeing tensors after their last use.
+    """
+
+    def analyze(self, model_path: str, batch_size: int = 1, seq_len: int = 128, top_nodes: int = 50) -> Dict[str, Any]:
+        """
+        Analyze an ONNX model.
+
+        Args:
+            model_path: Path to the .onnx model.
+            batch_size: Value for symbolic batch dimensions.
+            seq_len: Value for symbolic sequence dimensions.
+            top_nodes: Number of most expensive nodes to keep in the report.
+
+        Returns:
+            Dict with totals (macs, flops, params, param_bytes, peak_activation_bytes),
+            `by_op_type` and `by_node` tables sorted by FLOPs.
+        """
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"Model not found: {model_path}")
+        try:
+            import onnx
+        except ImportError:
+            logger.error("onnx is not installed.")
+            raise ImportError("onnx dependency missing.")
+
+        # Tensor data is never read; only initializer dims/types matter
+        model = onnx.load(model_path, load_external_data=False)
+        self._pin_input_dims(model, batch_size, seq_len)
+        model = self._infer_shapes(model)
+        graph = model.graph
+
+        shapes, itemsizes = self._collect_shapes(graph)
+        initializers = {init.name: (list(init.dims), self._itemsize(init.data_type)) for init in graph.initializer}
+
+        nodes = []
+        by_type: Dict[str, Dict[str, float]] = defaultdict(lambda: {"count": 0, "macs": 0, "flops": 0, "param_bytes": 0})
+        for i, node in enumerate(graph.node):
+            macs, flops = self._node_cost(node, shapes)
+            param_bytes = sum(_prod(initializers[n][0]) * initializers[n][1] for n in node.input if n in initializers)
+            entry = {"node": node.name or f"{node.op_type}_{i}", "op_type": node.op_type,
+                     "macs": macs, "flops": flops, "param_bytes": param_bytes,
+                     "output_shapes": [shapes.get(o) for o in node.output]}
+            nodes.append(entry)
+            stats = by_type[node.op_type]
+            stats["count"] += 1
+            stats["macs"] += macs
+            stats["flops"] += flops
+            stats["param_bytes"] += param_bytes
+
+        total_flops = sum(n["flops"] for n in nodes)
+        op_rows = [{"op_type": op, **{k: int(v) for k, v in s.items()},
+                    "percent": 100.0 * s["flops"] / total_flops if total_flops else 0.0}
+                   for op, s in by_type.items()]
+        op_rows.sort(key=lambda r: r["flops"], reverse=True)
+        node_rows = sorted(nodes, key=lambda n: n["flops"], reverse=True)[:top_nodes]
+
+        peak_bytes, peak_node, unknown = self._peak_activation(graph, shapes, itemsizes, set(initializers))
+        report = {
+            "model_path": model_path,
+            "batch_size": batch_size,
+            "seq_len": seq_len,
+            "nodes": len(graph.node),
+            "macs": sum(n["macs"] for n in nodes),
+            "flops": total_flops,
+            "params": sum(_prod(dims) for dims, _size in initializers.values()),
+            "param_bytes": sum(_prod(dims) * size for dims, size in initializers.values()),
+            "peak_activation_bytes": peak_bytes,
+            "peak_node": peak_node,
+            "unknown_shapes": unknown,
+            "by_op_type": op_rows,
+            "by_node": node_rows,
+        }
+        logger.info(f"Analyzed {model_path}: {report['flops'] / 1e9:.2f} GFLOPs, {report['params'] / 1e6:.1f}M params, "
+                    f"peak activations {peak_bytes / (1024 * 1024):.1f} MB")
+        return report
+
+    def _pin_input_dims(self, model, batch_size: int, seq_len: int):
+        # Analyze the prefill step: the past_* KV inputs are empty, so every other
+        # sequence dim (including attention_mask's past + seq) is just seq_len
+        for value in model.graph.input:
+            is_past = "past" in value.name
+            dims = value.type.tensor_type.shape.dim
+            for axis, dim in enumerate(dims):
+                if dim.HasField("dim_value"):
+                    continue
+                name = dim.dim_param.lower()
+                if axis == 0 or "batch" in name:
+                    dim.dim_value = batch_size
+                elif is_past:
+                    dim.dim_value = 0
+                else:
+                    # Sequence-like names and anything unnamed
+                    dim.dim_value = seq_len
+
+    def _infer_shapes(self, model):
+        try:
+            from onnxruntime.tools.symbolic_shape_infer import SymbolicShapeInference
+            return SymbolicShapeInference.infer_shapes(model, auto_merge=True, guess_output_rank=True)
+        except Exception as e:
+            logger.warning(f"Symbolic shape inference failed ({e}); falling back to onnx shape inference")
+        import onnx
+        return onnx.shape_inference.infer_shapes(model)
+
+    @staticmethod
+    def _itemsize(elem_type: int) -> int:
+        from onnx import helper
+        try:
+            return np.dtype(helper.tensor_dtype_to_np_dtype(elem_type)).itemsize
+        except (KeyError, TypeError, ValueError):
+            return 4
+
+    def _collect_shapes(self, graph) -> Tuple[Dict[str, Shape], Dict[str, int]]:
+        shapes: Dict[str, Shape] = {}
+        itemsizes: Dict[str, int] = {}
+        for value in list(graph.input) + list(graph.value_info) + list(graph.output):
+            tensor_type = value.type.tensor_type
+            if not tensor_type.HasField("shape"):
+                continue
+            dims = [d.dim_value if d.HasField("dim_value") else None for d in tensor_type.shape.dim]
+            shapes[value.name] = None if any(d is None for d in dims) else dims
+            itemsizes[value.name] = self._itemsize(tensor_type.elem_type)
+        for init in graph.initializer:
+            shapes[init.name] = list(init.dims)
+            itemsizes[init.name] = self._itemsize(init.data_type)
+        return shapes, itemsizes
+
+    def _node_cost(self, node, shapes: Dict[str, Shape]) -> Tuple[int, int]:
+        """Return (MACs, FLOPs); FLOPs count a MAC as two operations."""
+        out = shapes.get(node.output[0]) if node.output else None
+        op = node.op_type
+
+        if op in MATMUL_OPS:
+            a = shapes.get(node.input[0])
+            if out is None or not a:
+                return 0, 0
+            macs = _prod(out) * a[-1]
+            return macs, 2 * macs
+
+        if op == "Gemm":
+            a = shapes.get(node.input[0])
+            if out is None or not a:
+                return 0, 0
+            trans_a = next((attr.i for attr in node.attribute if attr.name == "transA"), 0)
+            k = a[0] if trans_a else a[-1]
+            macs = _prod(out) * k
+            return macs, 2 * macs + (_prod(out) if len(node.input) > 2 else 0)
+
+        weight_index = 3 if op == "QLinearConv" else 1
+        if op in CONV_OPS or op == "ConvTranspose":
+            w = shapes.get(node.input[weight_index]) if len(node.input) > weight_index else None
+            if out is None or not w:
+                return 0, 0
+            if op == "ConvTranspose":
+                x = shapes.get(node.input[0])
+                macs = _prod(x) * _prod(w[1:]) if x else 0
+            else:
+                macs = _prod(out) * _prod(w[1:])
+            return macs, 2 * macs
+
+        if op in ATTENTION_OPS:
+            q = shapes.get(node.input[0])
+            if out is None or not q or len(out) != 3:
+                return 0, 0
+            batch, seq, hidden = out
+            kv_seq = seq
+            key = shapes.get(node.input[1]) if len(node.input) > 1 and node.input[1] else None
+            if op != "Attention" and key and len(key) >= 2:
+                kv_seq = key[1] if len(key) == 3 else key[2]
+            # Q.K^T and softmax(QK).V; the contrib Attention op also owns the QKV projection
+            macs = 2 * batch * seq * kv_seq * hidden
+            if op == "Attention":
+                w = shapes.get(node.input[1])
+                if w:
+                    macs += batch * seq * _prod(w)
+            return macs, 2 * macs + 5 * batch * seq * kv_seq
+
+        if op in ZERO_COST_OPS or out is None:
+            return 0, 0
+
+        # Elementwise, normalization, activation and reduction ops: ~1 op per element,
+        # normalizations a handful more.
+        per_element = 5 if "Norm" in op or op == "Softmax" else 1
+        reduce_in = shapes.get(node.input[0]) if op.startswith("Reduce") and node.input else None
+        return 0, per_element * _prod(reduce_in or out)
+
+    def _peak_activation(self, graph, shapes: Dict[str, Shape], itemsizes: Dict[str, int],
+                         initializer_names) -> Tuple[int, Optional[str], int]:
+        last_use: Dict[str, int] = {}
+        for i, node in enumerate(graph.node):
+            for name in node.input:
+                last_use[name] = i
+        end = len(graph.node)
+        for value in graph.output:
+            last_use[value.name] = end
+
+        unknown = set()
+
+        def size(name: str) -> int:
+            dims = shapes.get(name)
+            if dims is None:
+                unknown.add(name)
+                return 0
+            return _prod(dims) * itemsizes.get(name, 4)
+
+        live: Dict[str, int] = {v.name: size(v.name) for v in graph.input if v.name not in initializer_names}
+        current = sum(live.values())
+        peak, peak_node = current, None
+
+        for i, node in enumerate(graph.node):
+            for name in node.output:
+                if name:
+                    live[name] = size(name)
+                    current += live[name]
+            if current > peak:
+                peak, peak_node = current, node.name or f"{node.op_type}_{i}"
+            for name in set(node.input) | set(node.output):
+                if name in live and last_use.get(name, -1) <= i:
+                    current -= live.pop(name)
+
+        return peak, peak_node, len(unknown)
+
+    def export(self, report: Dict[str, Any], output_path: str) -> str:
+        """Write the full analysis report as JSON."""
+        output_dir = os.path.dirname(output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        with open(output_path, "w") as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Analysis report written to {output_path}")
+        return output_path
+
+    @staticmethod
+    def format_table(rows: List[Dict[str, Any]], limit: Optional[int] = 20) -> str:
+        """Plain-text table of op type rows, for logs and the CLI."""
+        lines = [f"{'op_type':<28}{'count':>8}{'GFLOPs':>12}{'params_MB':>12}{'%':>8}"]
+        for r in rows[:limit]:
+            lines.append(f"{r['op_type']:<28}{r['count']:>8}{r['flops'] / 1e9:>12.3f}"
+                         f"{r['param_bytes'] / (1024 * 1024):>12.2f}{r['percent']:>8.1f}")
+        return "\n".join(lines)
+
+    @staticmethod
+    def compare(reports: List[Dict[str, Any]]) -> str:
+        """One line per analyzed model (e.g. original vs optimized vs quantized)."""
+        lines = [f"{'model':<44}{'GFLOPs':>10}{'params_M':>10}{'weights_MB':>12}{'peak_act_MB':>13}"]
+        for r in reports:
+            lines.append(f"{os.path.basename(r['model_path']):<44}{r['flops'] / 1e9:>10.3f}{r['params'] / 1e6:>10.2f}"
+                         f"{r['param_bytes'] / (1024 * 1024):>12.2f}{r['peak_activation_bytes'] / (1024 * 1024):>13.2f}")
+        return "\n".join(lines)
@@ -0,0 +1,144 @@
+import json
+import logging
+import os
+import platform
+from typing import Optional, Dict, List, Any
+
+from services.benchmark_service import BenchmarkModel
+from services.inference_service import InferenceService, session_profile_path
+from services.planner_service import planned_batch_size
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class SessionTuner:
+    """
+    Service to find the fastest onnxruntime SessionOptions for a model on this host.
+
+    The sweep is staged (graph level -> intra-op threads -> execution mode and
+    inter-op threads -> memory arena), keeping the best value of each stage
+    before moving on. This covers the settings that matter in a handful of
+    runs instead of the full cross product.
+    """
+
+    def __init__(self):
+        self.benchmark = BenchmarkModel()
+
+    def tune(self,
+             model_path: str,
+             batch_size: int = 1,
+             seq_len: int = 128,
+             input_spec: Optional[str] = None,
+             objective: str = "latency",
+             warmup: int = 3,
+             iterations: int = 20,
+             save: bool = True) -> Dict[str, Any]:
+        """
+        Sweep SessionOptions for a model and optionally save the winner next to it.
+
+        Args:
+            model_path: Path to the .onnx model.
+            batch_size: Batch size of the tuning input (0 = the model's planned batch size, else 1).
+            seq_len: Sequence length of the tuning input.
+            input_spec: Explicit input spec (e.g. "int64[1,128],int64[1,128]").
+            objective: 'latency' (minimise p50) or 'throughput' (maximise samples/s).
+            warmup: Untimed runs per configuration.
+            iterations: Timed runs per configuration.
+            save: Write the best profile to <model>.session_profile.json.
+
+        Returns:
+            Dict with the best profile and all measured results.
+        """
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"Model file not found: {model_path}")
+        if objective not in ("latency", "throughput"):
+            raise ValueError(f"Unknown objective: {objective}")
+        if not batch_size:
+            batch_size = planned_batch_size(model_path, "inference", seq_len) or 1
+
+        cores = os.cpu_count() or 1
+        thread_counts = sorted({1, max(1, cores // 4), max(1, cores // 2), cores})
+        inter_counts = sorted({2, max(2, cores // 4)})
+
+        results: List[Dict[str, Any]] = []
+        best = {
+            "intra_op_num_threads": 0,
+            "inter_op_num_threads": 0,
+            "execution_mode": "sequential",
+            "graph_optimization_level": "all",
+            "enable_cpu_mem_arena": True,
+        }
+        best_score = self._evaluate(model_path, best, batch_size, seq_len, input_spec, objective, warmup, iterations, results)
+
+        stages = [
+            [{"graph_optimization_level": lvl} for lvl in ("basic", "extended", "all")],
+            [{"intra_op_num_threads": n} for n in thread_counts],
+            [{"execution_mode": "sequential", "inter_op_num_threads": 0}] +
+            [{"execution_mode": "parallel", "inter_op_num_threads": n} for n in inter_counts],
+            [{"enable_cpu_mem_arena": flag} for flag in (True, False)],
+        ]
+
+        for stage in stages:
+            for change in stage:
+                candidate = {**best, **change}
+                if candidate == best:
+                    continue
+                score = self._evaluate(model_path, candidate, batch_size, seq_len, input_spec, objective, warmup, iterations, results)
+                if score is not None and (best_score is None or score < best_score):
+                    best, best_score = candidate, score
+
+        if best_score is None:
+            raise RuntimeError(f"No session configuration could run {model_path}")
+
+        measured = next(r for r in results if r["profile"] == best)
+        profile = {
+            **best,
+            "objective": objective,
+            "latency_p50_ms": measured["latency_p50_ms"],
+            "throughput": measured["throughput"],
+            "tuned_for": self._host_info(batch_size, seq_len, input_spec),
+        }
+
+        if save:
+            path = session_profile_path(model_path)
+            with open(path, "w") as f:
+                json.dump(profile, f, indent=2)
+            logger.info(f"Saved session profile to {path}")
+
+        return {"best": profile, "results": results}
+
+    def _evaluate(self, model_path, profile, batch_size, seq_len, input_spec, objective, warmup, iterations, results):
+        try:
+            service = InferenceService()
+            # Tune against the source graph: a pre-optimized artifact would turn every
+            # graph level into 'disable' and make the level stage meaningless
+            service.load(model_path, profile=profile, prefer_optimized=False)
+            feed = service.build_feed(batch_size, seq_len, input_spec)
+            measured = self.benchmark.measure(service, feed, warmup, iterations)
+        except Exception as e:
+            logger.warning(f"Configuration failed {profile}: {e}")
+            return None
+
+        results.append({"profile": dict(profile), **measured})
+        logger.info(f"Tuning {profile}: p50={measured['latency_p50_ms']:.2f}ms "
+                    f"throughput={measured['throughput']:.1f}/s")
+        # Lower is better for both objectives.
+        return measured["latency_p50_ms"] if objective == "latency" else -measured["throughput"]
+
+    @staticmethod
+    def _host_info(batch_size, seq_len, input_spec) -> Dict[str, Any]:
+        try:
+            import onnxruntime as ort
+            ort_version = ort.__version__
+        except ImportError:
+            ort_version = None
+        return {
+            "host": platform.node(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "onnxruntime": ort_version,
+            "batch_size": batch_size,
+            "seq_len": seq_len,
+            "input_spec": input_spec,
+        }
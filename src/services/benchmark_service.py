@@ -0,0 +1,88 @@
+import logging
+import time
+from typing import Optional, Dict, List, Any
+
+import numpy as np
+
+from services.inference_service import InferenceService
+from services.planner_service import planned_batch_size
+from services.profiling_service import OpProfiler
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class BenchmarkModel:
+    """
+    Service to measure latency and throughput of ONNX models with onnxruntime.
+    """
+
+    def benchmark(self,
+                  model_path: str,
+                  batch_size: int = 1,
+                  seq_len: int = 128,
+                  input_spec: Optional[str] = None,
+                  warmup: int = 5,
+                  iterations: int = 50,
+                  profile: Optional[Dict[str, Any]] = None,
+                  use_saved_profile: bool = True,
+                  profile_ops: bool = False) -> Dict[str, Any]:
+        """
+        Benchmark an ONNX model on synthetic inputs.
+
+        Args:
+            model_path: Path to the .onnx model.
+            batch_size: Batch size for symbolic batch dimensions (0 = the model's planned batch size, else 1).
+            seq_len: Sequence length for symbolic sequence dimensions.
+            input_spec: Explicit input spec (e.g. "int64[1,128],int64[1,128]").
+            warmup: Untimed runs before measuring.
+            iterations: Timed runs.
+            profile: SessionOptions profile; the saved tuned profile is used when None.
+            use_saved_profile: Whether to pick up <model>.session_profile.json.
+            profile_ops: Enable ORT's profiler and attach a hot-op report
+                (`op_report`); profiling adds overhead to the measured latency.
+
+        Returns:
+            Dict with latency percentiles (ms) and throughput (samples/s).
+        """
+        if not batch_size:
+            batch_size = planned_batch_size(model_path, "inference", seq_len) or 1
+        service = InferenceService()
+        service.load(model_path, profile=profile, use_saved_profile=use_saved_profile,
+                     enable_profiling=profile_ops)
+        feed = service.build_feed(batch_size, seq_len, input_spec)
+        result = self.measure(service, feed, warmup, iterations)
+        result["model_path"] = model_path
+        result["profile"] = service.profile
+        if profile_ops:
+            result["op_report"] = OpProfiler().parse_trace(service.end_profiling())
+        logger.info(f"Benchmark {model_path}: p50={result['latency_p50_ms']:.2f}ms "
+                    f"throughput={result['throughput']:.1f}/s")
+        return result
+
+    def measure(self,
+                service: InferenceService,
+                feed: Dict[str, np.ndarray],
+                warmup: int = 5,
+                iterations: int = 50) -> Dict[str, Any]:
+        """Time repeated runs of an already loaded session."""
+        for _ in range(warmup):
+            service.run(feed)
+
+        timings: List[float] = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            service.run(feed)
+            timings.append(time.perf_counter() - start)
+
+        first = next(iter(feed.values()))
+        rows = first.shape[0] if first.ndim else 1
+        latencies = np.array(timings) * 1000.0
+        return {
+            "batch_size": rows,
+            "iterations": iterations,
+            "latency_mean_ms": float(latencies.mean()),
+            "latency_p50_ms": float(np.percentile(latencies, 50)),
+            "latency_p95_ms": float(np.percentile(latencies, 95)),
+            "throughput": float(rows * iterations / sum(timings)),
+        }
@@ -0,0 +1,266 @@
+import json
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Dict, List, Any, Callable, Tuple
+
+from services.instrumentation import tracer
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+BULK_TASKS = ("embed", "classify", "generate", "raw")
+CHECKPOINT_SUFFIX = ".checkpoint.json"
+
+# Per-process model state, set by _init_worker
+_WORKER: Dict[str, Any] = {}
+
+
+def _init_worker(model_path: str, task: str, options: Dict[str, Any], threads: int):
+    """Load the model once per worker process with its own ORT thread budget."""
+    logging.basicConfig(level=logging.WARNING)
+    if task == "embed":
+        from services.embedding_service import EmbeddingService
+        service = EmbeddingService(cache_size=0)
+        service.load(model_path, options.get("pooling", "mean"), options.get("normalize", True),
+                     options.get("max_length", 512), intra_op_num_threads=threads)
+    elif task == "classify":
+        from services.classification_service import ClassificationService
+        service = ClassificationService()
+        service.load(model_path, options.get("max_length", 512), intra_op_num_threads=threads)
+    elif task == "generate":
+        from services.generation_service import GenerationService
+        service = GenerationService()
+        service.load(model_path, intra_op_num_threads=threads)
+        if options.get("prefix_cache_mb"):
+            service.enable_prefix_cache(int(options["prefix_cache_mb"] * 1024 * 1024))
+    else:
+        from services.inference_service import InferenceService
+        service = InferenceService()
+        service.load(model_path, intra_op_num_threads=threads)
+    _WORKER.update(task=task, service=service, options=options)
+
+
+def _run_records(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Score one chunk of parsed records in a worker; failures become per-record errors."""
+    task, service, options = _WORKER["task"], _WORKER["service"], _WORKER["options"]
+    text_field = options.get("text_field", "text")
+    valid = [r for r in records if "error" not in r]
+    results: Dict[int, Dict[str, Any]] = {}
+
+    if task in ("embed", "classify") and valid:
+        try:
+            texts = [str(r["record"][text_field]) for r in valid]
+            batch_size = options.get("batch_size", 32)
+            if task == "embed":
+                outputs = [{"embedding": v.tolist()} for v in service.embed(texts, batch_size)]
+            else:
+                outputs = [{"labels": labels} for labels in service.classify(texts, batch_size, options.get("top_k", 1))]
+            results = {id(r): out for r, out in zip(valid, outputs)}
+        except Exception as e:
+            # Fall through to per-record scoring so one bad row cannot sink the chunk
+            logger.warning(f"Batched scoring failed ({e}); retrying records one by one")
+
+    output = []
+    for r in records:
+        if "error" in r:
+            output.append({"line": r["line"], "error": r["error"]})
+            continue
+        try:
+            result = results.get(id(r)) or _run_one(task, service, options, r["record"])
+        except Exception as e:
+            result = {"error": str(e)}
+        output.append({"line": r["line"], "id": r["record"].get(options.get("id_field", "id"), r["line"]), **result})
+    return output
+
+
+def _run_one(task: str, service, options: Dict[str, Any], record: Dict[str, Any]) -> Dict[str, Any]:
+    import numpy as np
+    text_field = options.get("text_field", "text")
+    if task == "embed":
+        return {"embedding": service.embed([str(record[text_field])])[0].tolist()}
+    if task == "classify":
+        return {"labels": service.classify([str(record[text_field])], top_k=options.get("top_k", 1))[0]}
+    if task == "generate":
+        prompt_ids = record.get("input_ids") or service.tokenizer(record[text_field])["input_ids"]
+        eos = service.tokenizer.eos_token_id if service.tokenizer is not None else None
+        result = service.generate(prompt_ids, options.get("max_new_tokens", 32), eos,
+                                  options.get("temperature", 0.0), options.get("top_k", 0))
+        output = {"tokens": result["tokens"]}
+        if service.tokenizer is not None:
+            output["text"] = service.tokenizer.decode(result["tokens"], skip_special_tokens=True)
+        return output
+    dtypes = {name: dtype for name, _shape, dtype in service.input_specs()}
+    inputs = record.get("inputs", {})
+    feeds = {name: np.asarray(inputs[name], dtype=dtype) for name, dtype in dtypes.items()}
+    return {"outputs": {k: v.tolist() for k, v in service.run(feeds).items()}}
+
+
+class BulkInference:
+    """
+    Service to score JSONL files offline with a pool of ORT worker processes.
+
+    Records are streamed from the input in chunks, scored by spawned
+    workers (each loading the model once with its share of the CPU
+    threads) and written to the output JSONL in input order. After every
+    chunk the byte offsets of both files are checkpointed, so an
+    interrupted job resumes at the last completed chunk.
+    """
+
+    def checkpoint_path(self, output_path: str) -> str:
+        return output_path + CHECKPOINT_SUFFIX
+
+    def _load_checkpoint(self, output_path: str, job: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        path = self.checkpoint_path(output_path)
+        if not os.path.exists(path) or not os.path.exists(output_path):
+            return None
+        try:
+            with open(path) as f:
+                checkpoint = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable checkpoint {path}: {e}")
+            return None
+        if any(checkpoint.get(k) != v for k, v in job.items()):
+            logger.warning(f"Checkpoint {path} belongs to a different job; starting over")
+            return None
+        return checkpoint
+
+    def _save_checkpoint(self, output_path: str, checkpoint: Dict[str, Any]):
+        path = self.checkpoint_path(output_path)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp, path)
+
+    def _read_chunks(self, handle, start_line: int, chunk_size: int):
+        """Yield (records, end_offset, last_line) chunks; unparsable lines become error records."""
+        line_no = emitted = start_line
+        chunk: List[Dict[str, Any]] = []
+        for raw in iter(handle.readline, b""):
+            line_no += 1
+            if raw.strip():
+                try:
+                    record = json.loads(raw)
+                    if not isinstance(record, dict):
+                        raise ValueError("record is not a JSON object")
+                    chunk.append({"line": line_no, "record": record})
+                except ValueError as e:
+                    chunk.append({"line": line_no, "error": f"Invalid JSON: {e}"})
+            if len(chunk) >= chunk_size:
+                yield chunk, handle.tell(), line_no
+                chunk, emitted = [], line_no
+        if line_no > emitted:
+            yield chunk, handle.tell(), line_no
+
+    def run(self,
+            input_path: str,
+            output_path: str,
+            model_path: str,
+            task: str = "embed",
+            workers: int = 0,
+            threads_per_worker: int = 0,
+            chunk_size: int = 256,
+            resume: bool = True,
+            options: Optional[Dict[str, Any]] = None,
+            progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """
+        Score every record of a JSONL file.
+
+        Args:
+            input_path: JSONL input; one JSON object per line (`text`, `input_ids` or `inputs`).
+            output_path: JSONL output, one result per input record in input order.
+            model_path: Exported .onnx model (or export directory for embed/classify).
+            task: 'embed', 'classify', 'generate' or 'raw' (feeds taken from record["inputs"]).
+            workers: Worker processes (0 = half the CPUs).
+            threads_per_worker: ORT intra-op threads per worker (0 = CPUs / workers).
+            chunk_size: Records per work item and per checkpoint.
+            resume: Continue from <output>.checkpoint.json when it matches this job.
+            options: Task options (text_field, id_field, batch_size, top_k, max_length,
+                pooling, normalize, max_new_tokens, temperature, prefix_cache_mb).
+            progress_callback: Called after each written chunk with the running summary.
+
+        Returns:
+            Summary with records, errors, records_per_second and resumed_from.
+        """
+        if task not in BULK_TASKS:
+            raise ValueError(f"Unknown task: {task}. Expected one of {BULK_TASKS}")
+        if not os.path.exists(input_path):
+            raise FileNotFoundError(f"Input file not found: {input_path}")
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"Model not found: {model_path}")
+
+        options = dict(options or {})
+        cpus = os.cpu_count() or 1
+        workers = workers or max(1, cpus // 2)
+        # Oversubscribing threads across processes thrashes; split the cores instead
+        threads = threads_per_worker or max(1, cpus // workers)
+
+        # Options change the results, so they are part of the job; the JSON round trip
+        # normalizes them the way the saved checkpoint will read back
+        job = {"input_path": os.path.abspath(input_path), "model_path": os.path.abspath(model_path), "task": task,
+               "options": json.loads(json.dumps(options, sort_keys=True))}
+        checkpoint = self._load_checkpoint(output_path, job) if resume else None
+        if checkpoint is None:
+            checkpoint = {**job, "input_offset": 0, "output_offset": 0, "lines": 0, "records": 0, "errors": 0,
+                          "completed": False}
+        elif checkpoint.get("completed"):
+            logger.info(f"Bulk job already completed: {output_path}")
+            return {**checkpoint, "resumed_from": checkpoint["lines"], "records_per_second": 0.0}
+        resumed_from = checkpoint["lines"]
+
+        output_dir = os.path.dirname(output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        input_size = os.path.getsize(input_path)
+        start = time.perf_counter()
+        done_now = 0
+
+        context = multiprocessing.get_context("spawn")
+        with tracer.span("bulk_inference", task=task, workers=workers, threads=threads, resumed_from=resumed_from), \
+                open(input_path, "rb") as source, \
+                open(output_path, "r+b" if checkpoint["output_offset"] else "wb") as sink, \
+                ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                    initargs=(model_path, task, options, threads)) as pool:
+            # Drop anything written after the last checkpoint
+            source.seek(checkpoint["input_offset"])
+            sink.seek(checkpoint["output_offset"])
+            sink.truncate()
+
+            pending: "deque[Tuple[Any, int, int]]" = deque()
+
+            def drain(limit: int):
+                nonlocal done_now
+                while len(pending) > limit:
+                    future, input_offset, lines = pending.popleft()
+                    results = future.result()
+                    sink.write("".join(json.dumps(r) + "\n" for r in results).encode("utf-8"))
+                    sink.flush()
+                    os.fsync(sink.fileno())
+                    errors = sum(1 for r in results if "error" in r)
+                    checkpoint.update(input_offset=input_offset, output_offset=sink.tell(), lines=lines,
+                                      records=checkpoint["records"] + len(results),
+                                      errors=checkpoint["errors"] + errors)
+                    self._save_checkpoint(output_path, checkpoint)
+                    done_now += len(results)
+                    if progress_callback:
+                        elapsed = time.perf_counter() - start
+                        progress_callback({**checkpoint, "fraction": input_offset / input_size if input_size else 1.0,
+                                           "records_per_second": done_now / elapsed if elapsed > 0 else 0.0})
+
+            for chunk, input_offset, lines in self._read_chunks(source, checkpoint["lines"], chunk_size):
+                # Bounded in-flight work keeps memory flat on arbitrarily large inputs
+                pending.append((pool.submit(_run_records, chunk), input_offset, lines))
+                drain(2 * workers)
+            drain(0)
+
+        checkpoint["completed"] = True
+        self._save_checkpoint(output_path, checkpoint)
+        elapsed = time.perf_counter() - start
+        summary = {**checkpoint, "resumed_from": resumed_from,
+                   "records_per_second": done_now / elapsed if elapsed > 0 else 0.0}
+        logger.info(f"Bulk {task} finished: {checkpoint['records']} records ({checkpoint['errors']} errors) "
+                    f"-> {output_path} at {summary['records_per_second']:.1f} records/s")
+        return summary
@@ -0,0 +1,505 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+import zipfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Dict, List, Any, Tuple
+
+import numpy as np
+
+from services.hashing import file_sha256
+from services.inference_service import load_tokenizer
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+CALIBRATION_METHODS = ("MinMax", "Entropy", "Percentile")
+
+# ONNX TensorProto element types -> NumPy dtypes for model inputs
+ONNX_TO_NUMPY = {1: np.float32, 2: np.uint8, 3: np.int8, 6: np.int32, 7: np.int64, 9: np.bool_, 10: np.float16, 11: np.float64}
+ONNX_FLOAT = 1
+
+InputSpec = Tuple[str, Any, int]
+Ranges = Dict[str, Tuple[float, float]]
+
+
+def model_inputs(model_path: str) -> List[InputSpec]:
+    """(name, numpy dtype, rank) for each real graph input (initializers excluded)."""
+    import onnx
+    model = onnx.load(model_path, load_external_data=False)
+    initializers = {init.name for init in model.graph.initializer}
+    specs = []
+    for value in model.graph.input:
+        if value.name in initializers:
+            continue
+        tensor_type = value.type.tensor_type
+        specs.append((value.name, ONNX_TO_NUMPY.get(tensor_type.elem_type, np.float32), len(tensor_type.shape.dim)))
+    return specs
+
+
+def load_calibration_samples(data_path: str,
+                             specs: List[InputSpec],
+                             model_path: Optional[str] = None,
+                             start: int = 0,
+                             stop: Optional[int] = None) -> List[Dict[str, np.ndarray]]:
+    """
+    Load calibration samples as ORT feeds (batch size 1 unless the file is batched).
+
+    Supported formats:
+        .npz: one array per input name, samples along axis 0.
+        .npy: samples along axis 0 (single-input models).
+        .json: list of {input_name: nested list} objects.
+        .txt: one text per line, tokenized with the tokenizer saved next to the model.
+
+    Args:
+        data_path: Calibration data file.
+        specs: Model inputs from model_inputs().
+        model_path: Model path, used to find the tokenizer for .txt data.
+        start, stop: Sample slice, so workers only materialize their shard.
+    """
+    if not os.path.exists(data_path):
+        raise FileNotFoundError(f"Calibration data not found: {data_path}")
+
+    names = [name for name, _dtype, _rank in specs]
+    ext = os.path.splitext(data_path)[1].lower()
+    columns: Dict[str, Any]
+
+    if ext == ".npz":
+        archive = np.load(data_path)
+        if all(name in archive for name in names):
+            columns = {name: archive[name] for name in names}
+        elif len(names) == 1 and len(archive.files) == 1:
+            columns = {names[0]: archive[archive.files[0]]}
+        else:
+            raise ValueError(f"{data_path} must contain arrays named {names}")
+    elif ext == ".npy":
+        if len(names) != 1:
+            raise ValueError(f"A .npy file can only calibrate single-input models; inputs are {names}")
+        columns = {names[0]: np.load(data_path, mmap_mode="r")}
+    elif ext == ".json":
+        with open(data_path, "r") as f:
+            records = json.load(f)
+        if isinstance(records, dict):
+            records = [records]
+        records = records[start:stop]
+        start, stop = 0, None
+        columns = {name: [r[name] for r in records] for name in names}
+    elif ext == ".txt":
+        tokenizer = load_tokenizer(model_path) if model_path else None
+        if tokenizer is None:
+            raise ValueError("Text calibration data needs a tokenizer saved next to the model.")
+        with open(data_path, "r") as f:
+            texts = [line.strip() for line in f if line.strip()][start:stop]
+        start, stop = 0, None
+        encoded = [tokenizer(text, truncation=True, max_length=512, return_tensors="np") for text in texts]
+        columns = {}
+        for name in names:
+            if name == "token_type_ids" and name not in encoded[0]:
+                columns[name] = [np.zeros_like(e["input_ids"]) for e in encoded]
+            else:
+                columns[name] = [e[name] for e in encoded]
+    else:
+        raise ValueError(f"Unsupported calibration data format: {ext}")
+
+    samples = []
+    count = len(next(iter(columns.values()))) if columns else 0
+    for i in range(start, count if stop is None else min(stop, count)):
+        feed = {}
+        for name, dtype, rank in specs:
+            array = np.asarray(columns[name][i], dtype=dtype)
+            if array.ndim == rank - 1:
+                array = array[None]
+            feed[name] = array
+        samples.append(feed)
+    return samples
+
+
+def count_calibration_samples(data_path: str, specs: List[InputSpec]) -> int:
+    """
+    Number of samples load_calibration_samples would return, without materializing them.
+
+    Reads array headers for .npz/.npy, the record count for .json and the
+    non-empty line count for .txt.
+    """
+    if not os.path.exists(data_path):
+        raise FileNotFoundError(f"Calibration data not found: {data_path}")
+
+    names = [name for name, _dtype, _rank in specs]
+    ext = os.path.splitext(data_path)[1].lower()
+    if ext == ".npz":
+        with zipfile.ZipFile(data_path) as archive:
+            members = [m[:-len(".npy")] for m in archive.namelist() if m.endswith(".npy")]
+            if all(name in members for name in names):
+                member = names[0]
+            elif len(names) == 1 and len(members) == 1:
+                member = members[0]
+            else:
+                raise ValueError(f"{data_path} must contain arrays named {names}")
+            with archive.open(member + ".npy") as f:
+                major, _minor = np.lib.format.read_magic(f)
+                header = np.lib.format.read_array_header_1_0 if major == 1 else np.lib.format.read_array_header_2_0
+                shape = header(f)[0]
+        return shape[0] if shape else 0
+    if ext == ".npy":
+        if len(names) != 1:
+            raise ValueError(f"A .npy file can only calibrate single-input models; inputs are {names}")
+        return len(np.load(data_path, mmap_mode="r"))
+    if ext == ".json":
+        with open(data_path, "r") as f:
+            records = json.load(f)
+        return 1 if isinstance(records, dict) else len(records)
+    if ext == ".txt":
+        with open(data_path, "r") as f:
+            return sum(1 for line in f if line.strip())
+    raise ValueError(f"Unsupported calibration data format: {ext}")
+
+
+class SampleDataReader:
+    """CalibrationDataReader over in-memory feeds (ORT only needs get_next)."""
+
+    def __init__(self, samples: List[Dict[str, np.ndarray]]):
+        self.samples = samples
+        self._index = 0
+
+    def get_next(self) -> Optional[Dict[str, np.ndarray]]:
+        if self._index >= len(self.samples):
+            return None
+        sample = self.samples[self._index]
+        self._index += 1
+        return sample
+
+    def rewind(self):
+        self._index = 0
+
+    def __len__(self):
+        return len(self.samples)
+
+
+def _calibration_worker(task: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    One shard of one calibration pass, run in a worker process.
+
+    'minmax' returns {tensor: [min, max]}; 'histogram' returns
+    {tensor: counts} over the fixed edges shared by all workers, so the
+    partial results merge exactly (min of mins, max of maxes, sum of counts).
+    """
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = task["threads"]
+    options.inter_op_num_threads = 1
+    session = ort.InferenceSession(task["augmented_path"], options, providers=["CPUExecutionProvider"])
+    tensors = task["tensors"]
+    # Graph inputs are read from the feed; everything else is fetched from the session
+    input_names = {name for name, _dtype, _rank in task["specs"]}
+    fetch = [name for name in tensors if name not in input_names]
+    samples = load_calibration_samples(task["data_path"], task["specs"], task["model_path"],
+                                       task["start"], task["stop"])
+
+    partial: Dict[str, Any] = {}
+    edges = task.get("edges")
+    for feed in samples:
+        values = dict(zip(fetch, session.run(fetch, feed)))
+        values.update({name: feed[name] for name in tensors if name in feed})
+        for name, value in values.items():
+            value = np.asarray(value, dtype=np.float32).ravel()
+            value = value[np.isfinite(value)]
+            if value.size == 0:
+                continue
+            if edges is None:
+                lo, hi = float(value.min()), float(value.max())
+                if name in partial:
+                    partial[name] = [min(partial[name][0], lo), max(partial[name][1], hi)]
+                else:
+                    partial[name] = [lo, hi]
+            elif name in edges:
+                counts, _ = np.histogram(value, bins=edges[name])
+                partial[name] = partial[name] + counts if name in partial else counts.astype(np.int64)
+    return {"samples": len(samples), "partial": partial}
+
+
+def _threshold_worker(args) -> Tuple[str, Tuple[float, float]]:
+    name, method, hist, edges, min_max, percentile, num_quantized_bins = args
+    if method == "Entropy":
+        return name, entropy_threshold(hist, edges, min_max, num_quantized_bins)
+    return name, percentile_threshold(hist, edges, min_max, percentile)
+
+
+def percentile_threshold(hist: np.ndarray, edges: np.ndarray, min_max: Tuple[float, float],
+                         percentile: float = 99.999) -> Tuple[float, float]:
+    """Two-sided percentile range: cut (100 - percentile) / 2 percent of the mass on each side."""
+    total = hist.sum()
+    if total == 0:
+        return min_max
+    cdf = np.cumsum(hist) / total
+    cut = (100.0 - percentile) / 200.0
+    left = int(np.searchsorted(cdf, cut))
+    right = int(np.searchsorted(cdf, 1.0 - cut))
+    return max(float(edges[left]), min_max[0]), min(float(edges[min(right + 1, len(edges) - 1)]), min_max[1])
+
+
+def entropy_threshold(hist: np.ndarray, edges: np.ndarray, min_max: Tuple[float, float],
+                      num_quantized_bins: int = 128) -> Tuple[float, float]:
+    """
+    Symmetric range minimizing KL(P || Q) between the clipped distribution P
+    and its num_quantized_bins re-quantization Q (histogram centered on zero).
+    """
+    num_bins = hist.size
+    zero_bin = num_bins // 2
+    half = num_quantized_bins // 2
+    hist = hist.astype(np.float64)
+    best_kl, best = np.inf, (float(edges[0]), float(edges[-1]))
+
+    for i in range(half, zero_bin + 1):
+        start, end = zero_bin - i, min(zero_bin + i + 1, num_bins)
+        p = hist[start:end].copy()
+        # Clipped outliers are folded into the edge bins
+        p[0] += hist[:start].sum()
+        p[-1] += hist[end:].sum()
+        if p.sum() == 0:
+            continue
+
+        nonzero = p > 0
+        chunk = (np.arange(p.size) * num_quantized_bins) // p.size
+        sums = np.bincount(chunk, weights=hist[start:end], minlength=num_quantized_bins)
+        used = np.bincount(chunk, weights=nonzero, minlength=num_quantized_bins)
+        q = np.where(nonzero, (sums / np.maximum(used, 1))[chunk], 0.0)
+        if q.sum() == 0:
+            continue
+
+        p_norm, q_norm = p / p.sum(), q / q.sum()
+        mask = (p_norm > 0) & (q_norm > 0)
+        kl = float(np.sum(p_norm[mask] * np.log(p_norm[mask] / q_norm[mask])))
+        if kl < best_kl:
+            best_kl, best = kl, (float(edges[start]), float(edges[end]))
+
+    return max(best[0], min_max[0]), min(best[1], min_max[1])
+
+
+class ShardedCalibrator:
+    """
+    Service to calibrate activation ranges over a process pool.
+
+    Pass 1 collects per-tensor min/max on every shard and merges them
+    exactly. For Entropy and Percentile, pass 2 histograms every shard over
+    fixed edges derived from the merged min/max, so per-shard counts simply
+    add up; thresholds are then computed from the merged histograms.
+    """
+
+    def __init__(self, workers: Optional[int] = None, num_bins: int = 2048,
+                 percentile: float = 99.999, num_quantized_bins: int = 128):
+        self.workers = workers or os.cpu_count() or 1
+        self.num_bins = num_bins
+        self.percentile = percentile
+        self.num_quantized_bins = num_quantized_bins
+        self.last_stats: Dict[str, Any] = {}
+        # Merged pass-2 histograms {tensor: (counts, edges)}, kept for the calibration table
+        self.last_histograms: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self.last_min_max: Ranges = {}
+
+    def calibrate(self, model_path: str, data_path: str, method: str = "MinMax") -> Ranges:
+        """
+        Compute activation ranges for static quantization.
+
+        Args:
+            model_path: Float ONNX model.
+            data_path: Calibration data (see load_calibration_samples for formats).
+            method: 'MinMax', 'Entropy' or 'Percentile'.
+
+        Returns:
+            {tensor_name: (low, high)} for every float activation in the graph.
+        """
+        if method not in CALIBRATION_METHODS:
+            raise ValueError(f"Unknown calibration method: {method}")
+        try:
+            import onnx  # noqa: F401
+            import onnxruntime  # noqa: F401
+        except ImportError:
+            logger.error("onnxruntime is not installed.")
+            raise ImportError("onnxruntime dependency missing.")
+
+        specs = model_inputs(model_path)
+        total = count_calibration_samples(data_path, specs)
+        if total == 0:
+            raise ValueError(f"No calibration samples in {data_path}")
+
+        workers = max(1, min(self.workers, total))
+        bounds = np.linspace(0, total, workers + 1).astype(int)
+        # Spread the cores over the workers instead of oversubscribing them
+        threads = max(1, (os.cpu_count() or 1) // workers)
+
+        work_dir = tempfile.mkdtemp(prefix="calibration_")
+        try:
+            augmented_path, tensors = self._augment(model_path, work_dir)
+            base = {"augmented_path": augmented_path, "model_path": model_path, "data_path": data_path,
+                    "specs": specs, "tensors": tensors, "threads": threads}
+            tasks = [{**base, "start": int(bounds[i]), "stop": int(bounds[i + 1])} for i in range(workers)]
+
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+                min_max: Dict[str, List[float]] = {}
+                for result in pool.map(_calibration_worker, tasks):
+                    for name, (lo, hi) in result["partial"].items():
+                        if name in min_max:
+                            min_max[name] = [min(min_max[name][0], lo), max(min_max[name][1], hi)]
+                        else:
+                            min_max[name] = [lo, hi]
+
+                ranges: Ranges = {name: (lo, hi) for name, (lo, hi) in min_max.items()}
+                self.last_min_max = dict(ranges)
+                self.last_histograms = {}
+                if method != "MinMax":
+                    edges = {name: self._edges(method, lo, hi) for name, (lo, hi) in min_max.items() if hi > lo}
+                    hists: Dict[str, np.ndarray] = {}
+                    for result in pool.map(_calibration_worker, [{**t, "edges": edges} for t in tasks]):
+                        for name, counts in result["partial"].items():
+                            hists[name] = hists[name] + counts if name in hists else counts
+
+                    jobs = [(name, method, hists[name], edges[name], ranges[name], self.percentile,
+                             self.num_quantized_bins) for name in hists]
+                    ranges.update(dict(pool.map(_threshold_worker, jobs, chunksize=max(1, len(jobs) // (4 * workers)))))
+                    self.last_histograms = {name: (hists[name], edges[name]) for name in hists}
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        self.last_stats = {"samples": total, "workers": workers, "tensors": len(ranges), "method": method}
+        logger.info(f"Calibrated {len(ranges)} tensors on {total} samples with {workers} workers ({method})")
+        return ranges
+
+    def _edges(self, method: str, lo: float, hi: float) -> np.ndarray:
+        if method == "Entropy":
+            # Entropy search is symmetric around zero
+            bound = max(abs(lo), abs(hi))
+            return np.linspace(-bound, bound, self.num_bins + 1, dtype=np.float64)
+        return np.linspace(lo, hi, self.num_bins + 1, dtype=np.float64)
+
+    def _augment(self, model_path: str, work_dir: str) -> Tuple[str, List[str]]:
+        """Copy of the model exposing every float activation as a graph output."""
+        import onnx
+
+        model = onnx.load(model_path)
+        try:
+            model = onnx.shape_inference.infer_shapes(model)
+        except Exception as e:
+            logger.warning(f"Shape inference failed during calibration ({e}); using declared types only")
+
+        graph = model.graph
+        initializers = {init.name for init in graph.initializer}
+        existing = {o.name for o in graph.output}
+        tensors = [v.name for v in graph.input if v.name not in initializers and v.type.tensor_type.elem_type == ONNX_FLOAT]
+        for value in graph.value_info:
+            if value.type.tensor_type.elem_type == ONNX_FLOAT and value.name not in initializers:
+                tensors.append(value.name)
+                if value.name not in existing:
+                    graph.output.append(value)
+        tensors += [o.name for o in graph.output if o.type.tensor_type.elem_type == ONNX_FLOAT and o.name not in tensors]
+
+        augmented_path = os.path.join(work_dir, "augmented.onnx")
+        external = model.ByteSize() > 2 * 1024 ** 3
+        onnx.save_model(model, augmented_path, save_as_external_data=external,
+                        location="augmented.onnx.data" if external else None)
+        return augmented_path, tensors
+
+
+class CalibrationTable:
+    """
+    Persisted calibration results for one model, reusable across quantization formats.
+
+    Entries live in `<model>.calibration/` and are keyed by the model hash,
+    the calibration data hash, the method and the calibrator settings that
+    change the result. Activation ranges do not depend on QDQ vs QOperator,
+    INT8 vs UINT8 or per-channel weights, so every such variant reuses them.
+    Histogram methods also keep the merged histograms, so a different
+    percentile or quantized bin count is recomputed without re-running the model.
+    """
+
+    def __init__(self, model_path: str, table_dir: Optional[str] = None):
+        self.model_path = model_path
+        self.table_dir = table_dir or os.path.splitext(model_path)[0] + ".calibration"
+        self.model_sha256 = file_sha256(model_path)
+
+    def _key(self, data_sha256: str, method: str, engine: str, num_bins: int) -> str:
+        import hashlib
+        raw = f"{self.model_sha256}|{data_sha256}|{method}|{engine}|{num_bins if method != 'MinMax' else 0}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+    def lookup(self, data_path: str, method: str, engine: str, num_bins: int = 2048,
+               percentile: float = 99.999, num_quantized_bins: int = 128) -> Optional[Ranges]:
+        """Return stored ranges for this model/data/method, or None on a miss."""
+        key = self._key(file_sha256(data_path), method, engine, num_bins)
+        meta_path = os.path.join(self.table_dir, f"{key}.json")
+        if not os.path.exists(meta_path):
+            return None
+        try:
+            with open(meta_path, "r") as f:
+                entry = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable calibration table {meta_path}: {e}")
+            return None
+
+        ranges = {name: (lo, hi) for name, (lo, hi) in entry["ranges"].items()}
+        params = entry.get("params", {})
+        hist_path = os.path.join(self.table_dir, f"{key}.npz")
+        stale = (method == "Percentile" and params.get("percentile") != percentile) or \
+                (method == "Entropy" and params.get("num_quantized_bins") != num_quantized_bins)
+        if stale:
+            if not os.path.exists(hist_path):
+                return None
+            ranges = self._recompute(entry, hist_path, method, percentile, num_quantized_bins)
+            logger.info(f"Recomputed {method} thresholds from stored histograms ({key})")
+        logger.info(f"Reusing calibration table {key} ({len(ranges)} tensors)")
+        return ranges
+
+    def store(self, data_path: str, method: str, engine: str, ranges: Ranges,
+              num_bins: int = 2048, percentile: float = 99.999, num_quantized_bins: int = 128,
+              min_max: Optional[Ranges] = None,
+              histograms: Optional[Dict[str, Tuple[np.ndarray, np.ndarray]]] = None) -> str:
+        """Persist ranges (and merged histograms, if any); returns the entry key."""
+        import time
+
+        data_sha256 = file_sha256(data_path)
+        key = self._key(data_sha256, method, engine, num_bins)
+        os.makedirs(self.table_dir, exist_ok=True)
+
+        names = sorted(histograms) if histograms else []
+        if names:
+            arrays = {}
+            for i, name in enumerate(names):
+                arrays[f"hist_{i}"], arrays[f"edges_{i}"] = histograms[name]
+            np.savez_compressed(os.path.join(self.table_dir, f"{key}.npz"), **arrays)
+
+        entry = {
+            "model_sha256": self.model_sha256,
+            "data_sha256": data_sha256,
+            "data_path": os.path.abspath(data_path),
+            "method": method,
+            "engine": engine,
+            "params": {"num_bins": num_bins, "percentile": percentile, "num_quantized_bins": num_quantized_bins},
+            "created": time.time(),
+            "ranges": {name: [float(lo), float(hi)] for name, (lo, hi) in ranges.items()},
+            "min_max": {name: [float(lo), float(hi)] for name, (lo, hi) in (min_max or {}).items()},
+            "histogram_tensors": names,
+        }
+        meta_path = os.path.join(self.table_dir, f"{key}.json")
+        tmp_path = meta_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, meta_path)
+        logger.info(f"Calibration table saved: {meta_path}")
+        return key
+
+    def _recompute(self, entry: Dict[str, Any], hist_path: str, method: str,
+                   percentile: float, num_quantized_bins: int) -> Ranges:
+        ranges = {name: tuple(v) for name, v in entry["ranges"].items()}
+        with np.load(hist_path) as arrays:
+            for i, name in enumerate(entry["histogram_tensors"]):
+                hist, edges = arrays[f"hist_{i}"], arrays[f"edges_{i}"]
+                min_max = tuple(entry["min_max"][name])
+                if method == "Entropy":
+                    ranges[name] = entropy_threshold(hist, edges, min_max, num_quantized_bins)
+                else:
+                    ranges[name] = percentile_threshold(hist, edges, min_max, percentile)
+        return ranges
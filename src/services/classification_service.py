@@ -0,0 +1,86 @@
+import json
+import logging
+import os
+from typing import Optional, Dict, List, Any
+
+import numpy as np
+
+from services.inference_service import InferenceService
+from services.length_batching import LengthBucketBatcher
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class ClassificationService:
+    """
+    Service to classify texts with exported `text-classification` models.
+
+    Texts run in length-bucketed batches; logits are turned into
+    probabilities in NumPy and mapped to the labels in the export's
+    config.json (id2label) when present.
+    """
+
+    def __init__(self):
+        self.inference = InferenceService()
+        self.batcher = LengthBucketBatcher(self.inference)
+        self.labels: Dict[int, str] = {}
+        self.multi_label = False
+
+    def load(self, model_path: str, max_length: int = 512, intra_op_num_threads: int = 0) -> bool:
+        """
+        Load an exported text-classification model.
+
+        Args:
+            model_path: The .onnx file or the export directory containing model.onnx.
+            max_length: Truncation length for tokenization.
+            intra_op_num_threads: ORT threads per operator (0 keeps the default).
+
+        Returns:
+            True if the model was loaded.
+        """
+        if os.path.isdir(model_path):
+            model_path = os.path.join(model_path, "model.onnx")
+        self.inference.load(model_path, intra_op_num_threads=intra_op_num_threads)
+        if self.inference.tokenizer is None:
+            raise ValueError(f"No tokenizer found next to {model_path}")
+
+        self.labels, self.multi_label = {}, False
+        config_path = os.path.join(os.path.dirname(os.path.abspath(model_path)), "config.json")
+        if os.path.exists(config_path):
+            with open(config_path) as f:
+                config = json.load(f)
+            self.labels = {int(k): v for k, v in config.get("id2label", {}).items()}
+            self.multi_label = config.get("problem_type") == "multi_label_classification"
+
+        self.batcher.max_length = max_length
+        logger.info(f"Classification model loaded ({len(self.labels) or 'unknown'} labels): {model_path}")
+        return True
+
+    def probabilities(self, logits: np.ndarray) -> np.ndarray:
+        logits = logits.astype(np.float32, copy=False)
+        if self.multi_label:
+            return 1.0 / (1.0 + np.exp(-logits))
+        shifted = np.exp(logits - logits.max(axis=-1, keepdims=True))
+        return shifted / shifted.sum(axis=-1, keepdims=True)
+
+    def predict_proba(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        """Return [len(texts), num_labels] probabilities in input order."""
+        if self.inference.session is None:
+            raise RuntimeError("No model loaded. Call load() first.")
+        self.batcher.batch_size = batch_size
+        return self.batcher.run(texts, lambda outputs, _mask: self.probabilities(next(iter(outputs.values()))))
+
+    def classify(self, texts: List[str], batch_size: int = 32, top_k: int = 1) -> List[List[Dict[str, Any]]]:
+        """
+        Classify texts.
+
+        Returns:
+            Per text, the top_k {"label", "score"} entries sorted by score.
+        """
+        probs = self.predict_proba(texts, batch_size)
+        results = []
+        for row in probs:
+            best = np.argsort(row)[::-1][:top_k]
+            results.append([{"label": self.labels.get(int(i), str(int(i))), "score": float(row[i])} for i in best])
+        return results
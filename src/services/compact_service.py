@@ -0,0 +1,183 @@
+import hashlib
+import logging
+import os
+from typing import Optional, Dict, List, Any, Set
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Protobuf cannot serialize a single file beyond 2GB
+PROTOBUF_LIMIT = 2 * 1024 ** 3
+
+
+class ModelCompactor:
+    """
+    Service to shrink exported ONNX files without changing their numerics.
+
+    Identical initializers are collapsed into one tensor and unused
+    initializers and doc strings are removed. Optionally, initializers that
+    are the transpose of another 2D initializer (tied embedding / LM head)
+    are replaced by a Transpose node; this is off by default because the
+    rewritten weight is no longer a constant MatMul input, so quantizers
+    skip it, and compacting after quantization is the better order.
+    """
+
+    def compact(self,
+                model_path: str,
+                output_path: Optional[str] = None,
+                share_transposed: bool = False,
+                strip_doc_strings: bool = True) -> Dict[str, Any]:
+        """
+        Compact an ONNX model.
+
+        Args:
+            model_path: Path to the .onnx model.
+            output_path: Destination; the model is rewritten in place when None.
+            share_transposed: Replace initializers equal to the transpose of another
+                initializer with a Transpose node (tied weights exported twice).
+            strip_doc_strings: Drop model, graph and node doc strings.
+
+        Returns:
+            Report with bytes_before, bytes_after, bytes_saved and per-pass counts.
+        """
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"Model not found: {model_path}")
+        try:
+            import onnx
+            from onnx import numpy_helper, helper
+        except ImportError:
+            logger.error("onnx is not installed.")
+            raise ImportError("onnx dependency missing.")
+
+        output_path = output_path or model_path
+        bytes_before = os.path.getsize(model_path)
+        model = onnx.load(model_path)
+        graph = model.graph
+
+        protected = {i.name for i in graph.input} | {o.name for o in graph.output}
+        canonical: Dict[tuple, str] = {}
+        transposed: Dict[tuple, str] = {}
+        renames: Dict[str, str] = {}
+        dropped: Set[str] = set()
+        transpose_nodes = []
+        tensor_bytes_saved = 0
+
+        for init in graph.initializer:
+            if init.name in protected:
+                continue
+            array = numpy_helper.to_array(init)
+            key = (init.data_type, tuple(array.shape), hashlib.sha256(array.tobytes()).hexdigest())
+            if key in canonical:
+                renames[init.name] = canonical[key]
+                dropped.add(init.name)
+                tensor_bytes_saved += array.nbytes
+                continue
+            if share_transposed and array.ndim == 2 and key in transposed:
+                transpose_nodes.append(helper.make_node(
+                    "Transpose", [transposed[key]], [init.name], perm=[1, 0], name=f"{init.name}_tied_transpose"
+                ))
+                # The name now comes from the Transpose node's output
+                dropped.add(init.name)
+                tensor_bytes_saved += array.nbytes
+                continue
+            canonical[key] = init.name
+            if share_transposed and array.ndim == 2 and array.shape[0] != array.shape[1]:
+                t_key = (init.data_type, tuple(array.shape[::-1]), hashlib.sha256(array.T.tobytes()).hexdigest())
+                transposed.setdefault(t_key, init.name)
+
+        self._rename_inputs(graph, renames)
+
+        kept = [init for init in graph.initializer if init.name not in dropped]
+        if transpose_nodes:
+            nodes = transpose_nodes + list(graph.node)
+            del graph.node[:]
+            graph.node.extend(nodes)
+
+        used = self._used_names(graph)
+        unused = [init for init in kept if init.name not in used and init.name not in protected]
+        for init in unused:
+            tensor_bytes_saved += numpy_helper.to_array(init).nbytes
+        unused_names = {init.name for init in unused}
+        kept = [init for init in kept if init.name not in unused_names]
+
+        del graph.initializer[:]
+        graph.initializer.extend(kept)
+        removed = dropped | unused_names
+        value_info = [v for v in graph.value_info if v.name not in removed]
+        del graph.value_info[:]
+        graph.value_info.extend(value_info)
+
+        doc_strings = self._strip_doc_strings(model) if strip_doc_strings else 0
+
+        output_dir = os.path.dirname(output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        external = model.ByteSize() > PROTOBUF_LIMIT
+        onnx.save_model(model, output_path, save_as_external_data=external,
+                        location=os.path.basename(output_path) + ".data" if external else None)
+
+        bytes_after = os.path.getsize(output_path)
+        report = {
+            "model_path": output_path,
+            "bytes_before": bytes_before,
+            "bytes_after": bytes_after,
+            "bytes_saved": bytes_before - bytes_after,
+            "tensor_bytes_saved": tensor_bytes_saved,
+            "duplicates_removed": len(renames),
+            "tied_transposes": len(transpose_nodes),
+            "unused_removed": len(unused_names),
+            "doc_strings_stripped": doc_strings,
+        }
+        logger.info(f"Compacted {output_path}: saved {report['bytes_saved'] / (1024 * 1024):.2f} MB "
+                    f"({report['duplicates_removed']} duplicates, {report['tied_transposes']} tied, "
+                    f"{report['unused_removed']} unused)")
+        return report
+
+    def _subgraphs(self, node) -> List[Any]:
+        from onnx import AttributeProto
+        graphs = []
+        for attr in node.attribute:
+            if attr.type == AttributeProto.GRAPH:
+                graphs.append(attr.g)
+            elif attr.type == AttributeProto.GRAPHS:
+                graphs.extend(attr.graphs)
+        return graphs
+
+    def _rename_inputs(self, graph, renames: Dict[str, str]):
+        # Subgraphs (If/Loop/Scan bodies) may capture outer-scope initializers
+        if not renames:
+            return
+        for node in graph.node:
+            for i, name in enumerate(node.input):
+                if name in renames:
+                    node.input[i] = renames[name]
+            for sub in self._subgraphs(node):
+                self._rename_inputs(sub, renames)
+
+    def _used_names(self, graph) -> Set[str]:
+        used = {o.name for o in graph.output}
+        for node in graph.node:
+            used.update(node.input)
+            for sub in self._subgraphs(node):
+                used |= self._used_names(sub)
+        return used
+
+    def _strip_doc_strings(self, model) -> int:
+        count = 0
+
+        def strip(obj):
+            nonlocal count
+            if obj.doc_string:
+                obj.doc_string = ""
+                count += 1
+
+        def walk(graph):
+            strip(graph)
+            for node in graph.node:
+                strip(node)
+                for sub in self._subgraphs(node):
+                    walk(sub)
+
+        strip(model)
+        walk(model.graph)
+        return count
@@ -0,0 +1,346 @@
+import logging
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Optional, Dict, List, Any, Tuple
+
+import numpy as np
+
+from services.fusion_service import FUSED_OPS_METADATA
+from services.generation_service import GenerationService
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class PagedKVCache:
+    """
+    KV cache stored in fixed-size pages carved from one preallocated pool.
+
+    Each past tensor name owns a pool of shape [num_pages, heads, page_size,
+    head_dim]; a sequence is a page table plus a length. Pages are returned
+    to the free list when a sequence retires, so memory never fragments and
+    the total footprint is fixed up front.
+    """
+
+    def __init__(self,
+                 names: List[str],
+                 num_heads: int,
+                 head_dim: int,
+                 dtype,
+                 page_size: int = 16,
+                 num_pages: int = 1024):
+        self.names = list(names)
+        self.num_heads = num_heads
+        self.head_dim = head_dim
+        self.page_size = page_size
+        self.num_pages = num_pages
+        self.pools = {n: np.zeros((num_pages, num_heads, page_size, head_dim), dtype=dtype) for n in self.names}
+        # Pop from the end so low page ids are handed out first
+        self.free_pages: List[int] = list(range(num_pages - 1, -1, -1))
+        self.page_tables: Dict[int, List[int]] = {}
+        self.lengths: Dict[int, int] = {}
+
+    @property
+    def nbytes(self) -> int:
+        return sum(pool.nbytes for pool in self.pools.values())
+
+    @property
+    def pages_in_use(self) -> int:
+        return self.num_pages - len(self.free_pages)
+
+    def pages_for(self, tokens: int) -> int:
+        return math.ceil(tokens / self.page_size)
+
+    def can_allocate(self, tokens: int) -> bool:
+        return self.pages_for(tokens) <= len(self.free_pages)
+
+    def add_sequence(self, seq_id: int):
+        self.page_tables[seq_id] = []
+        self.lengths[seq_id] = 0
+
+    def needs_page(self, seq_id: int, tokens: int = 1) -> int:
+        """Number of new pages required to append `tokens` positions."""
+        return self.pages_for(self.lengths[seq_id] + tokens) - len(self.page_tables[seq_id])
+
+    def append(self, seq_id: int, kv: Dict[str, np.ndarray]) -> bool:
+        """
+        Append positions to a sequence.
+
+        Args:
+            seq_id: Sequence id from add_sequence().
+            kv: {name: [heads, n, head_dim]} new positions for every past tensor.
+
+        Returns:
+            False (and writes nothing) when the pool has too few free pages.
+        """
+        n = kv[self.names[0]].shape[1]
+        needed = self.needs_page(seq_id, n)
+        if needed > len(self.free_pages):
+            return False
+        table = self.page_tables[seq_id]
+        for _ in range(needed):
+            table.append(self.free_pages.pop())
+
+        length = self.lengths[seq_id]
+        written = 0
+        while written < n:
+            pos = length + written
+            page, slot = table[pos // self.page_size], pos % self.page_size
+            take = min(self.page_size - slot, n - written)
+            for name in self.names:
+                self.pools[name][page, :, slot:slot + take] = kv[name][:, written:written + take]
+            written += take
+        self.lengths[seq_id] = length + n
+        return True
+
+    def gather(self, seq_ids: List[int]) -> Tuple[Dict[str, np.ndarray], np.ndarray]:
+        """
+        Assemble a left-padded batch for the model.
+
+        Returns:
+            ({name: [batch, heads, max_len, head_dim]}, attention mask [batch, max_len]).
+        """
+        max_len = max(self.lengths[s] for s in seq_ids)
+        batch = len(seq_ids)
+        past = {name: np.zeros((batch, self.num_heads, max_len, self.head_dim), dtype=pool.dtype)
+                for name, pool in self.pools.items()}
+        mask = np.zeros((batch, max_len), dtype=np.int64)
+        for b, seq_id in enumerate(seq_ids):
+            length = self.lengths[seq_id]
+            if not length:
+                continue
+            table = self.page_tables[seq_id]
+            offset = max_len - length
+            for name, pool in self.pools.items():
+                # [pages, heads, page, dim] -> [heads, pages * page, dim]
+                blocks = pool[table].transpose(1, 0, 2, 3).reshape(self.num_heads, -1, self.head_dim)
+                past[name][b, :, offset:] = blocks[:, :length]
+            mask[b, offset:] = 1
+        return past, mask
+
+    def free(self, seq_id: int):
+        self.free_pages.extend(reversed(self.page_tables.pop(seq_id, [])))
+        self.lengths.pop(seq_id, None)
+
+
+class _GenerationRequest:
+    __slots__ = ("prompt_ids", "max_new_tokens", "eos_token_id", "temperature", "top_k",
+                 "future", "tokens", "seq_id", "enqueued", "first_token_at", "preemptions")
+
+    def __init__(self, prompt_ids, max_new_tokens, eos_token_id, temperature, top_k):
+        self.prompt_ids = list(prompt_ids)
+        self.max_new_tokens = max_new_tokens
+        self.eos_token_id = eos_token_id
+        self.temperature = temperature
+        self.top_k = top_k
+        self.future: Future = Future()
+        self.tokens: List[int] = []
+        self.seq_id: Optional[int] = None
+        self.enqueued = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.preemptions = 0
+
+    @property
+    def finished(self) -> bool:
+        return bool(self.tokens) and (self.tokens[-1] == self.eos_token_id or len(self.tokens) >= self.max_new_tokens)
+
+
+class ContinuousBatcher:
+    """
+    Token-level scheduler for concurrent generation requests (continuous batching).
+
+    Every step admits waiting requests (prefill) while the batch and the
+    page pool have room, runs one batched decode step over all active
+    sequences and retires finished ones immediately, so new requests join
+    mid-flight instead of waiting for the whole batch to drain. When the
+    pool runs out of pages the most recently admitted sequence is preempted
+    and later re-prefilled from its prompt plus the tokens generated so far.
+    """
+
+    def __init__(self,
+                 generator: GenerationService,
+                 max_batch_size: int = 8,
+                 page_size: int = 16,
+                 max_cache_tokens: int = 16384):
+        if generator.session is None:
+            raise RuntimeError("GenerationService has no model loaded.")
+        fused_ops = generator.session.get_modelmeta().custom_metadata_map.get(FUSED_OPS_METADATA, "")
+        if "GroupQueryAttention" in fused_ops.split(","):
+            # GQA derives KV positions from sum(mask) - 1, i.e. right-padded past;
+            # the paged cache gathers sequences left-padded
+            raise ValueError("GroupQueryAttention models need right-padded KV caches; "
+                             "the paged cache gathers them left-padded")
+        shape = generator.kv_shape
+        if len(shape) != 4 or generator.kv_seq_axis != 2 or not all(isinstance(d, int) for d in (shape[1], shape[3])):
+            raise ValueError(f"Paged KV cache needs [batch, heads, seq, head_dim] past tensors, got {shape}")
+
+        self.generator = generator
+        self.max_batch_size = max_batch_size
+        self.cache = PagedKVCache(generator.past_names, shape[1], shape[3], generator.kv_dtype,
+                                  page_size, math.ceil(max_cache_tokens / page_size))
+
+        self._waiting: "deque[_GenerationRequest]" = deque()
+        self._active: List[_GenerationRequest] = []
+        self._cond = threading.Condition()
+        self._next_seq_id = 0
+        self._stats = {"steps": 0, "decoded_tokens": 0, "occupancy_total": 0, "preemptions": 0, "completed": 0}
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, name="continuous-batcher", daemon=True)
+        self._thread.start()
+        logger.info(f"Continuous batcher: {self.cache.num_pages} pages x {page_size} tokens "
+                    f"({self.cache.nbytes / (1024 * 1024):.1f} MB KV pool)")
+
+    def submit(self,
+               prompt_ids: List[int],
+               max_new_tokens: int = 32,
+               eos_token_id: Optional[int] = None,
+               temperature: float = 0.0,
+               top_k: int = 0) -> Future:
+        """Queue a prompt; the future resolves to {tokens, time_to_first_token_ms, latency_ms}."""
+        if not prompt_ids:
+            raise ValueError("Prompt must contain at least one token.")
+        if self.cache.pages_for(len(prompt_ids) + max_new_tokens) > self.cache.num_pages:
+            raise ValueError("Request does not fit in the KV page pool.")
+        request = _GenerationRequest(prompt_ids, max_new_tokens, eos_token_id, temperature, top_k)
+        with self._cond:
+            if not self._running:
+                request.future.set_exception(RuntimeError("server stopped"))
+                return request.future
+            self._waiting.append(request)
+            self._cond.notify()
+        return request.future
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        self._thread.join(timeout=5)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            steps = self._stats["steps"]
+            return {
+                **self._stats,
+                "avg_batch_occupancy": self._stats["occupancy_total"] / steps if steps else 0.0,
+                "active": len(self._active),
+                "waiting": len(self._waiting),
+                "pages_in_use": self.cache.pages_in_use,
+                "pages_total": self.cache.num_pages,
+                "prefix_cache": self.generator.prefix_cache.stats() if self.generator.prefix_cache else None,
+            }
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while self._running and not self._waiting and not self._active:
+                    self._cond.wait()
+                if not self._running:
+                    break
+            try:
+                self.step()
+            except Exception as e:
+                logger.exception(f"Generation step failed: {e}")
+                self._fail_all(e)
+        # Nothing resolves queued or in-flight requests once the loop is gone
+        self._fail_all(RuntimeError("server stopped"))
+
+    def _fail_all(self, error: Exception):
+        with self._cond:
+            failed = self._active + list(self._waiting)
+            self._active, self._waiting = [], deque()
+        for request in failed:
+            if request.seq_id is not None:
+                self.cache.free(request.seq_id)
+            if not request.future.done():
+                request.future.set_exception(error)
+
+    def step(self):
+        """Admit, decode one token for every active sequence, retire finished ones."""
+        self._admit()
+        if self._active:
+            self._decode()
+        self._retire()
+
+    def _admit(self):
+        while len(self._active) < self.max_batch_size:
+            with self._cond:
+                if not self._waiting:
+                    return
+                request = self._waiting[0]
+                # Room for the prompt (plus generated tokens after a preemption) and the next token
+                if not self.cache.can_allocate(len(request.prompt_ids) + len(request.tokens) + 1):
+                    return
+                self._waiting.popleft()
+            self._prefill(request)
+            self._active.append(request)
+
+    def _prefill(self, request: _GenerationRequest):
+        # Invariant: the cache holds prompt + tokens[:-1]; tokens[-1] is the next input.
+        ids = request.prompt_ids + request.tokens[:-1]
+        # Shared prompt prefixes come from the generator's prefix cache when enabled
+        logits, past = self.generator.prefill(ids)
+
+        request.seq_id = self._next_seq_id
+        self._next_seq_id += 1
+        self.cache.add_sequence(request.seq_id)
+        self.cache.append(request.seq_id, {name: value[0] for name, value in past.items()})
+
+        if not request.tokens:
+            request.tokens.append(self.generator.select_token(logits[0, -1], request.temperature, request.top_k))
+            request.first_token_at = time.perf_counter()
+
+    def _preempt(self, request: _GenerationRequest):
+        self.cache.free(request.seq_id)
+        request.seq_id = None
+        request.preemptions += 1
+        self._active.remove(request)
+        with self._cond:
+            self._waiting.appendleft(request)
+            self._stats["preemptions"] += 1
+
+    def _decode(self):
+        running = [r for r in self._active if not r.finished]
+        # Make sure every sequence can take one more position; evict the newest until it fits.
+        while running and sum(self.cache.needs_page(r.seq_id) for r in running) > len(self.cache.free_pages):
+            victim = running.pop()
+            self._preempt(victim)
+        if not running:
+            return
+
+        seq_ids = [r.seq_id for r in running]
+        past, mask = self.cache.gather(seq_ids)
+        batch = len(running)
+        lengths = np.array([self.cache.lengths[s] for s in seq_ids], dtype=np.int64)
+        input_ids = np.array([[r.tokens[-1]] for r in running], dtype=np.int64)
+        mask = np.concatenate([mask, np.ones((batch, 1), dtype=np.int64)], axis=1)
+        # Left padding: each row's position is its own length, not the padded one
+        logits, present = self.generator.forward(input_ids, past, mask, lengths[:, None])
+
+        for b, request in enumerate(running):
+            self.cache.append(request.seq_id, {name: value[b, :, -1:] for name, value in present.items()})
+            request.tokens.append(self.generator.select_token(logits[b, -1], request.temperature, request.top_k))
+
+        with self._cond:
+            self._stats["steps"] += 1
+            self._stats["decoded_tokens"] += batch
+            self._stats["occupancy_total"] += batch
+
+    def _retire(self):
+        done = [r for r in self._active if r.finished]
+        if not done:
+            return
+        now = time.perf_counter()
+        for request in done:
+            self.cache.free(request.seq_id)
+            self._active.remove(request)
+            request.future.set_result({
+                "tokens": request.tokens,
+                "time_to_first_token_ms": 1000.0 * (request.first_token_at - request.enqueued),
+                "latency_ms": 1000.0 * (now - request.enqueued),
+                "preemptions": request.preemptions,
+            })
+        with self._cond:
+            self._stats["completed"] += len(done)
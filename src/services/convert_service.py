@@ -1,20 +1,27 @@
 import os
 import logging
-from typing import Optional, Dict, Union, Tuple
+from typing import Optional, Dict, Union, Tuple, Any
 import subprocess
 import torch
 import re 
 from services.wrapper import OnnxExportWrapper
-import os
-os.environ["TORCH_LOGS"] = "onnx"
+from services.prune_service import PruneModel
+from services.compact_service import ModelCompactor
+from services.instrumentation import tracer
+# Exporter debug logs are opt-in: set TORCH_LOGS=onnx (or pass --torch-logs to the CLI)
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+EXPORTERS = ("legacy", "dynamo", "auto")
+
 class ConvertOnnxModel:
     """
     Service to handle conversion of models (PyTorch, TensorFlow, Keras) to ONNX format.
     """
+
+    def __init__(self):
+        self.last_report: Dict[str, Any] = {}
     
     def convert(self, 
                 input_path: str, 
@@ -22,7 +29,10 @@ class ConvertOnnxModel:
                 framework: str, 
                 input_shapes: Optional[str] = None, 
                 opset_version: int = 17, 
-                optimize: bool = True) -> bool:
+                optimize: bool = True,
+                prune_options: Optional[Dict] = None,
+                exporter: str = "legacy",
+                dynamic: bool = False) -> bool:
         """
         Convert a model to ONNX.
         
@@ -32,13 +42,24 @@ class ConvertOnnxModel:
             framework: The source framework ('PyTorch', 'TensorFlow', 'Keras').
             input_shapes: String defining input shapes (e.g., "input_ids:[1,128]").
             opset_version: ONNX Opset version to use.
-            optimize: Whether to apply basic optimizations.
+            optimize: Whether to apply basic optimizations: initializer deduplication,
+                tied-weight sharing and unused initializer / doc string removal
+                (report in `last_report["compaction"]`).
+            prune_options: Optional keyword arguments for PruneModel.prune (PyTorch only),
+                e.g. {"head_ratio": 0.25, "mlp_ratio": 0.3, "layers_to_drop": 2}.
+            exporter: PyTorch exporter: 'legacy' (TorchScript tracing), 'dynamo'
+                (torch.export) or 'auto' (dynamo, falling back to legacy on failure).
+                The exporter actually used is recorded in `last_report`.
+            dynamic: Export with a dynamic batch dimension (and sequence dimension
+                for integer token inputs) instead of the dummy input's fixed shape.
             
         Returns:
             True if conversion was successful, False otherwise.
         """
-        print(f"Converting model: {input_path}")
-        print(f"output path: {output_path}")
+        logger.info(f"Converting model: {input_path} -> {output_path}")
+        if exporter not in EXPORTERS:
+            raise ValueError(f"Unknown exporter: {exporter}. Expected one of {EXPORTERS}")
+        self.last_report = {"framework": framework, "output_path": output_path, "opset": opset_version}
         if not os.path.exists(input_path):
             logger.error(f"Input file not found: {input_path}")
             raise FileNotFoundError(f"Input file not found: {input_path}")
@@ -51,13 +72,23 @@ class ConvertOnnxModel:
         logger.info(f"Starting conversion for {framework} model: {input_path}")
 
         try:
-            if "pytorch" in framework.lower():
-                return self._convert_pytorch(input_path, output_path, input_shapes, opset_version)
-            elif "tensorflow" in framework.lower() or "keras" in framework.lower():
-                return self._convert_tensorflow(input_path, output_path, framework, opset_version)
-            else:
-                logger.error(f"Unsupported framework: {framework}")
-                raise ValueError(f"Unsupported framework: {framework}")
+            with tracer.span("convert", framework=framework, input_path=input_path, output_path=output_path):
+                if "pytorch" in framework.lower():
+                    success = self._convert_pytorch(input_path, output_path, input_shapes, opset_version,
+                                                    prune_options, exporter, dynamic)
+                elif "tensorflow" in framework.lower() or "keras" in framework.lower():
+                    if prune_options:
+                        raise ValueError("Structured pruning is only supported for PyTorch models.")
+                    self.last_report["exporter"] = "tf2onnx"
+                    success = self._convert_tensorflow(input_path, output_path, framework, opset_version)
+                else:
+                    logger.error(f"Unsupported framework: {framework}")
+                    raise ValueError(f"Unsupported framework: {framework}")
+
+                if success and optimize:
+                    with tracer.span("compact"):
+                        self.last_report["compaction"] = ModelCompactor().compact(output_path)
+                return success
                 
         except Exception as e:
             logger.exception(f"Conversion failed: {str(e)}")
@@ -73,7 +104,7 @@ class ConvertOnnxModel:
 
         for inp in graph.inputs():
             t = inp.type() 
-            print("type of t", t)
+            logger.debug(f"TorchScript input type: {t}")
             # Skip `self`
             if t.kind() == "ClassType":
                 continue
@@ -92,64 +123,95 @@ class ConvertOnnxModel:
         output_path: str,
         input_shapes: Optional[str],
         opset: int,
+        prune_options: Optional[Dict] = None,
+        exporter: str = "legacy",
+        dynamic: bool = False,
     ) -> bool: 
   
-        model = self._load_pytorch_model(input_path)
-        model.eval()
+        with tracer.span("load"):
+            model = self._load_pytorch_model(input_path)
+            model.eval()
         
-        if self.is_torchscript_model(model):
-            input_shapes = self.extract_shapes_from_torchscript(model) 
-            print("input_shapes" , input_shapes)
-  
-        dummy_input = self._build_dummy_input(model, input_shapes)
-        if not isinstance(dummy_input, tuple):
-            dummy_input = (dummy_input,)
+        dummy_input = self.prepare_dummy_input(model, input_shapes)
+
+        if prune_options:
+            # Pruning must rebuild modules before tracing so the exported graph is smaller
+            with tracer.span("prune"):
+                pruner = PruneModel()
+                model = pruner.prune(model, dummy_input, **prune_options)
+                logger.info(f"Pruning report: {pruner.last_report}")
+                self.last_report["prune"] = pruner.last_report
+
+        return self.export_loaded(model, dummy_input, output_path, opset, exporter, dynamic)
+
+    def prepare_dummy_input(self, model: torch.nn.Module, input_shapes: Optional[str]) -> Tuple[torch.Tensor, ...]:
+        """Example inputs for tracing, always as a tuple (TorchScript models supply their own shapes)."""
+        with tracer.span("dummy_input"):
+            if self.is_torchscript_model(model):
+                input_shapes = self.extract_shapes_from_torchscript(model) 
+                logger.info(f"TorchScript input shapes: {input_shapes}")
   
+            dummy_input = self._build_dummy_input(model, input_shapes)
+            if not isinstance(dummy_input, tuple):
+                dummy_input = (dummy_input,)
+        return dummy_input
+
+    def export_loaded(
+        self,
+        model: torch.nn.Module,
+        dummy_input: Tuple[torch.Tensor, ...],
+        output_path: str,
+        opset: int,
+        exporter: str = "legacy",
+        dynamic: bool = False,
+    ) -> bool:
+        """
+        Export an already loaded model, so several variants can share one load.
+
+        Args:
+            model: Loaded (and optionally pruned) model in eval mode.
+            dummy_input: Example inputs from prepare_dummy_input().
+            output_path: Destination .onnx path.
+            opset: ONNX opset version.
+            exporter: 'legacy', 'dynamo' or 'auto'.
+            dynamic: Dynamic batch/sequence dimensions.
+
+        Returns:
+            True if the artifact was written; the exporter used is in `last_report`.
+        """
         output_path = os.path.abspath(output_path)
         os.makedirs(os.path.dirname(output_path), exist_ok=True) 
 
         try:
-            if self.is_torchscript_model(model):  
-                print("Using legacy path for Script Model")
-                # LEGACY PATH (TorchScript → ONNX)  
-                torch.onnx.export(
-                    model,
-                    dummy_input,
-                    output_path,
-                    opset_version=opset,
-                    dynamo=False
-                ) 
-            else: 
-                print("Using modern path")
-                torch.onnx.export(
-                    model,
-                    dummy_input,
-                    output_path,
-                    opset_version=opset,
-                    dynamo=False
-                ) 
-
-                # MODERN PATH (Eager → torch.export → ONNX) 
-                # exported = torch.export.export(
-                #     model,
-                #     dummy_input,
-                # )
-
-                # # Use file handle to force serialization errors
-                # with open(output_path, "wb") as f:
-                #     torch.onnx.export(
-                #         exported,
-                #         f,
-                #         opset_version=opset,
-                #         input_names=[f"input_{i}" for i in range(len(dummy_input))],
-                #         output_names=["output"],
-                #     )
+            if self.is_torchscript_model(model):
+                # torch.export cannot trace ScriptModules
+                if exporter == "dynamo":
+                    raise ValueError("The dynamo exporter does not support TorchScript models; use 'legacy'.")
+                exporter = "legacy"
+
+            used = exporter
+            if exporter in ("dynamo", "auto"):
+                try:
+                    self._export_dynamo(model, dummy_input, output_path, opset, dynamic)
+                    used = "dynamo"
+                except Exception as e:
+                    if exporter == "dynamo":
+                        raise
+                    logger.warning(f"Dynamo export failed, falling back to legacy exporter: {e}")
+                    self.last_report["fallback_reason"] = str(e)
+                    used = "legacy"
+
+            if used == "legacy":
+                self._export_legacy(model, dummy_input, output_path, opset, dynamic)
   
             if not os.path.isfile(output_path):
                 raise RuntimeError(
                     "ONNX export completed but file was not written"
                 )
 
+            self.last_report.update({"exporter": used, "dynamic": dynamic,
+                                     "size_bytes": os.path.getsize(output_path)})
+            logger.info(f"Exported with the {used} exporter: {output_path}")
             return True
 
         except Exception:
@@ -157,6 +219,64 @@ class ConvertOnnxModel:
             logger.exception("ONNX export failed")
             raise
 
+    def _export_legacy(self, model, dummy_input: Tuple[torch.Tensor, ...], output_path: str,
+                       opset: int, dynamic: bool):
+        """TorchScript tracing exporter (torch.onnx.export with dynamo=False)."""
+        kwargs = {}
+        if dynamic:
+            input_names = [f"input_{i}" for i in range(len(dummy_input))]
+            kwargs["input_names"] = input_names
+            kwargs["dynamic_axes"] = {name: self._dynamic_dims(t) for name, t in zip(input_names, dummy_input)}
+
+        # Tracing, graph building and protobuf serialization all happen inside export
+        with tracer.span("export", exporter="legacy"):
+            torch.onnx.export(
+                model,
+                dummy_input,
+                output_path,
+                opset_version=opset,
+                dynamo=False,
+                **kwargs
+            ) 
+
+    def _export_dynamo(self, model, dummy_input: Tuple[torch.Tensor, ...], output_path: str,
+                       opset: int, dynamic: bool):
+        """torch.export based exporter: trace to an ExportedProgram, translate to ONNX, save."""
+        dynamic_shapes = None
+        if dynamic:
+            dims = {label: torch.export.Dim(label) for label in ("batch", "sequence")}
+            dynamic_shapes = tuple(
+                {dim: dims[label] for dim, label in self._dynamic_dims(t).items()} for t in dummy_input
+            )
+            # torch.export specializes dimensions whose example size is 0 or 1
+            dummy_input = tuple(
+                self._widen(t, dyn.keys()) for t, dyn in zip(dummy_input, dynamic_shapes)
+            )
+
+        with tracer.span("trace", exporter="dynamo"):
+            exported = torch.export.export(model, dummy_input, dynamic_shapes=dynamic_shapes, strict=False)
+
+        with tracer.span("export", exporter="dynamo"):
+            onnx_program = torch.onnx.export(exported, opset_version=opset, dynamo=True, optimize=True)
+
+        with tracer.span("save", exporter="dynamo"):
+            onnx_program.save(output_path)
+
+    @staticmethod
+    def _dynamic_dims(tensor: torch.Tensor) -> Dict[int, str]:
+        """Batch is always dynamic; dim 1 of integer (token id / mask) inputs is the sequence."""
+        dims = {0: "batch"} if tensor.ndim else {}
+        if tensor.ndim >= 2 and not tensor.is_floating_point():
+            dims[1] = "sequence"
+        return dims
+
+    @staticmethod
+    def _widen(tensor: torch.Tensor, dims) -> torch.Tensor:
+        for dim in dims:
+            if tensor.shape[dim] < 2:
+                tensor = torch.cat([tensor] * 2, dim=dim)
+        return tensor
+
     def _build_dummy_input(
         self,
         model: torch.nn.Module,
@@ -263,7 +383,8 @@ class ConvertOnnxModel:
              cmd.extend(["--saved-model", input_path])
 
         logger.info(f"Running command: {' '.join(cmd)}")
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        with tracer.span("tf2onnx"):
+            result = subprocess.run(cmd, capture_output=True, text=True)
         
         if result.returncode != 0:
             logger.error(f"tf2onnx failed: {result.stderr}")
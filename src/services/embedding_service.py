@@ -0,0 +1,253 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, List, Tuple
+
+import numpy as np
+
+from services.hashing import file_sha256
+from services.inference_service import InferenceService
+from services.length_batching import LengthBucketBatcher
+from services.vector_store import VectorStore
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """
+    Two-level text -> vector cache: a bounded in-memory LRU backed by an
+    optional SQLite file. Keys already include the model hash and pooling
+    settings, so several models can share one cache file.
+    """
+
+    def __init__(self, max_entries: int = 10000, cache_path: Optional[str] = None, max_disk_entries: int = 1_000_000):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.hits = 0
+        self.misses = 0
+
+        if cache_path:
+            cache_dir = os.path.dirname(cache_path)
+            if cache_dir:
+                os.makedirs(cache_dir, exist_ok=True)
+            self._db = sqlite3.connect(cache_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, dim INTEGER, vector BLOB)")
+            self._db.commit()
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        with self._lock:
+            for key in keys:
+                value = self._memory.get(key)
+                if value is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = value
+
+            missing = [k for k in keys if k not in found]
+            if self._db is not None and missing:
+                # SQLite caps the number of bound parameters per statement.
+                for start in range(0, len(missing), 500):
+                    chunk = missing[start:start + 500]
+                    rows = self._db.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                    ).fetchall()
+                    for key, blob in rows:
+                        vector = np.frombuffer(blob, dtype=np.float32)
+                        found[key] = vector
+                        self._remember(key, vector)
+
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items: Dict[str, np.ndarray]):
+        with self._lock:
+            for key, vector in items.items():
+                self._remember(key, vector)
+            if self._db is not None and items:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, dim, vector) VALUES (?, ?, ?)",
+                    [(k, v.shape[0], v.astype(np.float32).tobytes()) for k, v in items.items()],
+                )
+                count = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+                if count > self.max_disk_entries:
+                    # Oldest inserts go first.
+                    self._db.execute(
+                        "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY rowid LIMIT ?)",
+                        (count - self.max_disk_entries,),
+                    )
+                self._db.commit()
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+class EmbeddingService:
+    """
+    Service to compute sentence embeddings with exported `feature-extraction` models.
+
+    Texts are tokenized and run in length-bucketed batches, pooled (mean or
+    CLS) and L2-normalized in NumPy. Results are cached by (model hash, pooling,
+    normalization, text), so repeated texts are never re-embedded.
+    """
+
+    def __init__(self, cache_size: int = 10000, cache_path: Optional[str] = None):
+        self.inference = InferenceService()
+        self.batcher = LengthBucketBatcher(self.inference)
+        self.cache = EmbeddingCache(cache_size, cache_path)
+        self.model_hash: Optional[str] = None
+        self.pooling = "mean"
+        self.normalize = True
+        self.max_length = 512
+
+    def load(self,
+             model_path: str,
+             pooling: str = "mean",
+             normalize: bool = True,
+             max_length: int = 512,
+             intra_op_num_threads: int = 0) -> bool:
+        """
+        Load an exported feature-extraction model.
+
+        Args:
+            model_path: The .onnx file or the export directory containing model.onnx.
+            pooling: 'mean' (masked mean over tokens) or 'cls' (first token).
+            normalize: L2-normalize the pooled vectors.
+            max_length: Truncation length for tokenization.
+            intra_op_num_threads: ORT threads per operator (0 keeps the default).
+
+        Returns:
+            True if the model was loaded.
+        """
+        if os.path.isdir(model_path):
+            model_path = os.path.join(model_path, "model.onnx")
+        if pooling not in ("mean", "cls"):
+            raise ValueError(f"Unknown pooling: {pooling}")
+
+        self.inference.load(model_path, intra_op_num_threads=intra_op_num_threads)
+        if self.inference.tokenizer is None:
+            raise ValueError(f"No tokenizer found next to {model_path}")
+
+        self.model_hash = file_sha256(model_path)
+        self.pooling = pooling
+        self.normalize = normalize
+        self.max_length = max_length
+        self.batcher.max_length = max_length
+        logger.info(f"Embedding model loaded ({pooling} pooling): {model_path}")
+        return True
+
+    def _cache_key(self, text: str) -> str:
+        raw = f"{self.model_hash}|{self.pooling}|{int(self.normalize)}|{self.max_length}|{text}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def embed(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        """
+        Embed texts.
+
+        Args:
+            texts: Input texts (duplicates are embedded once).
+            batch_size: Maximum texts per ORT run; texts are grouped by token length.
+
+        Returns:
+            float32 array of shape [len(texts), dim].
+        """
+        if self.model_hash is None:
+            raise RuntimeError("No model loaded. Call load() first.")
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        keys = [self._cache_key(t) for t in texts]
+        unique: Dict[str, str] = dict(zip(keys, texts))
+        vectors = self.cache.get_many(list(unique))
+
+        pending = [(k, t) for k, t in unique.items() if k not in vectors]
+        if pending:
+            self.batcher.batch_size = batch_size
+            embeddings = self.batcher.run([t for _k, t in pending],
+                                          lambda outputs, mask: self.pool(next(iter(outputs.values())), mask))
+            computed = {k: e for (k, _t), e in zip(pending, embeddings)}
+            self.cache.put_many(computed)
+            vectors.update(computed)
+
+        logger.debug(f"Embedded {len(texts)} texts ({len(pending)} computed, {len(texts) - len(pending)} cached)")
+        return np.stack([vectors[k] for k in keys]).astype(np.float32, copy=False)
+
+    def index(self,
+              texts: List[str],
+              store: Optional[VectorStore] = None,
+              ids: Optional[np.ndarray] = None,
+              batch_size: int = 32,
+              chunk_size: int = 4096,
+              store_path: Optional[str] = None,
+              store_dtype: str = "float32") -> VectorStore:
+        """
+        Embed texts into a vector store.
+
+        Args:
+            texts: Texts to add.
+            store: Store to append to; a new cosine store is created when None.
+            ids: Ids of the texts (sequential from the store's size when None).
+            batch_size: Maximum texts per ORT run.
+            chunk_size: Texts embedded per store append, which bounds peak memory.
+            store_path: Directory memory-mapping a newly created store (in memory when None).
+            store_dtype: 'float32' or 'float16' for a newly created store.
+
+        Returns:
+            The store holding the new vectors.
+        """
+        if not texts:
+            raise ValueError("No texts to index.")
+        if ids is not None and len(ids) != len(texts):
+            raise ValueError("ids and texts must have the same length")
+
+        for start in range(0, len(texts), chunk_size):
+            vectors = self.embed(texts[start:start + chunk_size], batch_size)
+            if store is None:
+                store = VectorStore(vectors.shape[1], path=store_path, dtype=store_dtype)
+            store.add(vectors, None if ids is None else ids[start:start + chunk_size])
+        logger.info(f"Indexed {len(texts)} texts ({len(store)} vectors in the store)")
+        return store
+
+    def search(self,
+               store: VectorStore,
+               queries: List[str],
+               k: int = 10,
+               nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Embed queries and find their nearest neighbours in a store.
+
+        Returns:
+            (scores [n, k], ids [n, k]) as returned by VectorStore.search.
+        """
+        return store.search(self.embed(queries), k, nprobe)
+
+    def pool(self, hidden: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        """Pool [batch, seq, dim] hidden states (2D outputs are already pooled)."""
+        hidden = hidden.astype(np.float32, copy=False)
+        if hidden.ndim == 2:
+            pooled = hidden
+        elif self.pooling == "cls":
+            pooled = hidden[:, 0]
+        else:
+            mask = attention_mask[..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+
+        if self.normalize:
+            norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+            pooled = pooled / np.maximum(norms, 1e-12)
+        return pooled
@@ -0,0 +1,189 @@
+import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Dict, List, Any
+
+from services.convert_service import ConvertOnnxModel
+from services.compact_service import ModelCompactor
+from services.instrumentation import tracer
+from services.quantize_service import quantize_job
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Named quantization presets (keyword arguments for QuantizeModel.quantize)
+QUANT_PRESETS: Dict[str, Dict[str, Any]] = {
+    "dynamic-int8": {"strategy": "Dynamic", "quant_type": "INT8"},
+    "dynamic-uint8": {"strategy": "Dynamic", "quant_type": "UINT8"},
+    "dynamic-int8-per-channel": {"strategy": "Dynamic", "quant_type": "INT8", "per_channel": True},
+    "static-qdq": {"strategy": "Static", "quant_type": "QDQ", "calibration_method": "MinMax"},
+    "static-int8": {"strategy": "Static", "quant_type": "INT8", "calibration_method": "MinMax"},
+}
+
+SUMMARY_FILE = "matrix_summary.json"
+
+
+class ExportMatrix:
+    """
+    Service to produce every release variant of a model from a single load.
+
+    The source checkpoint is loaded (and traced per shape variant) once in
+    this process, each opset/shape variant is exported from the loaded
+    module, and quantization variants fan out across a process pool.
+    """
+
+    def __init__(self):
+        self.converter = ConvertOnnxModel()
+
+    def run(self,
+            input_path: str,
+            output_dir: str,
+            opsets: List[int],
+            shape_variants: Optional[Dict[str, Dict[str, Any]]] = None,
+            quant_variants: Optional[List[str]] = None,
+            exporter: str = "legacy",
+            calibration_data_path: Optional[str] = None,
+            max_workers: Optional[int] = None,
+            benchmark: bool = True,
+            compact: bool = True,
+            seq_len: int = 128,
+            iterations: int = 20) -> List[Dict[str, Any]]:
+        """
+        Export and quantize all variants, then measure them.
+
+        Args:
+            input_path: PyTorch checkpoint (.pt/.pth, eager or TorchScript).
+            output_dir: Directory receiving the artifacts and matrix_summary.json.
+            opsets: Opset versions to export, e.g. [15, 16, 18].
+            shape_variants: Name -> {"input_shapes": str, "dynamic": bool}.
+                Defaults to a single static variant using the model's default input.
+            quant_variants: Names from QUANT_PRESETS applied to every exported artifact.
+            exporter: 'legacy', 'dynamo' or 'auto'.
+            calibration_data_path: Calibration data for static quantization presets.
+            max_workers: Quantization processes (defaults to the CPU count).
+            benchmark: Measure size and latency of every artifact.
+            compact: Deduplicate/strip initializers of every artifact once quantization is done.
+            seq_len: Sequence length for symbolic dimensions while benchmarking.
+            iterations: Timed runs per artifact.
+
+        Returns:
+            One summary row per artifact (also written to matrix_summary.json).
+        """
+        if not os.path.exists(input_path):
+            raise FileNotFoundError(f"Input file not found: {input_path}")
+        unknown = [q for q in quant_variants or [] if q not in QUANT_PRESETS]
+        if unknown:
+            raise ValueError(f"Unknown quantization variants: {unknown}. Expected {list(QUANT_PRESETS)}")
+
+        os.makedirs(output_dir, exist_ok=True)
+        shape_variants = shape_variants or {"default": {}}
+        stem = os.path.splitext(os.path.basename(input_path))[0]
+        rows: List[Dict[str, Any]] = []
+
+        with tracer.span("matrix", input_path=input_path, opsets=list(opsets),
+                         shapes=list(shape_variants), quant=list(quant_variants or [])):
+            with tracer.span("load"):
+                model = self.converter._load_pytorch_model(input_path)
+                model.eval()
+
+            for shape_name, variant in shape_variants.items():
+                dummy_input = self.converter.prepare_dummy_input(model, variant.get("input_shapes"))
+                for opset in opsets:
+                    path = os.path.join(output_dir, f"{stem}.{shape_name}.opset{opset}.onnx")
+                    row = {"artifact": path, "shapes": shape_name, "opset": opset,
+                           "input_spec": variant.get("input_shapes"), "quantization": None}
+                    self.converter.last_report = {}
+                    try:
+                        with tracer.span("export_variant", shapes=shape_name, opset=opset):
+                            self.converter.export_loaded(model, dummy_input, path, opset,
+                                                         exporter, bool(variant.get("dynamic")))
+                        row.update(status="ok", exporter=self.converter.last_report.get("exporter"))
+                    except Exception as e:
+                        logger.error(f"Export {shape_name}/opset{opset} failed: {e}")
+                        row.update(status="error", error=str(e))
+                    rows.append(row)
+
+            rows.extend(self._quantize_all(rows, quant_variants or [], calibration_data_path, max_workers))
+
+            if compact:
+                # After quantization, so the quantizers still see every weight as a plain initializer
+                with tracer.span("compact_all"):
+                    for row in rows:
+                        if row["status"] != "ok":
+                            continue
+                        try:
+                            row["bytes_saved"] = ModelCompactor().compact(row["artifact"])["bytes_saved"]
+                        except Exception as e:
+                            logger.warning(f"Compaction failed for {row['artifact']}: {e}")
+
+            if benchmark:
+                with tracer.span("benchmark_all"):
+                    for row in rows:
+                        self._measure(row, seq_len, iterations)
+
+        summary_path = os.path.join(output_dir, SUMMARY_FILE)
+        with open(summary_path, "w") as f:
+            json.dump(rows, f, indent=2)
+        logger.info(f"Export matrix finished: {len(rows)} artifacts, summary at {summary_path}")
+        return rows
+
+    def _quantize_all(self,
+                      exported: List[Dict[str, Any]],
+                      quant_variants: List[str],
+                      calibration_data_path: Optional[str],
+                      max_workers: Optional[int]) -> List[Dict[str, Any]]:
+        jobs = []
+        for base in exported:
+            if base["status"] != "ok":
+                continue
+            for name in quant_variants:
+                options = dict(QUANT_PRESETS[name])
+                if options["strategy"] == "Static":
+                    options["calibration_data_path"] = calibration_data_path
+                output_path = base["artifact"][:-len(".onnx")] + f".{name}.onnx"
+                row = {**base, "artifact": output_path, "quantization": name, "source": base["artifact"]}
+                row.pop("error", None)
+                jobs.append((row, options))
+
+        if not jobs:
+            return []
+
+        # Spawned workers keep the (potentially large) torch state of this process out of the pool
+        context = multiprocessing.get_context("spawn")
+        workers = min(max_workers or os.cpu_count() or 1, len(jobs))
+        with tracer.span("quantize_pool", jobs=len(jobs), workers=workers):
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+                futures = [pool.submit(quantize_job, row["source"], row["artifact"], options)
+                           for row, options in jobs]
+                for (row, _options), future in zip(jobs, futures):
+                    row.update(future.result())
+        return [row for row, _options in jobs]
+
+    def _measure(self, row: Dict[str, Any], seq_len: int, iterations: int):
+        if row["status"] != "ok":
+            return
+        from services.benchmark_service import BenchmarkModel
+
+        row["size_mb"] = round(os.path.getsize(row["artifact"]) / (1024 * 1024), 2)
+        try:
+            result = BenchmarkModel().benchmark(row["artifact"], seq_len=seq_len, input_spec=row.get("input_spec"),
+                                                iterations=iterations)
+            row["latency_p50_ms"] = result["latency_p50_ms"]
+            row["latency_p95_ms"] = result["latency_p95_ms"]
+            row["throughput"] = result["throughput"]
+        except Exception as e:
+            logger.warning(f"Benchmark failed for {row['artifact']}: {e}")
+            row["benchmark_error"] = str(e)
+
+    @staticmethod
+    def format_table(rows: List[Dict[str, Any]]) -> str:
+        """Plain-text summary table for logs and the CLI."""
+        lines = [f"{'artifact':<48}{'exporter':>10}{'size_mb':>10}{'p50_ms':>10}{'status':>8}"]
+        for r in rows:
+            p50 = f"{r['latency_p50_ms']:.2f}" if "latency_p50_ms" in r else "-"
+            size = f"{r['size_mb']:.2f}" if "size_mb" in r else "-"
+            lines.append(f"{os.path.basename(r['artifact']):<48}{r.get('exporter') or '-':>10}"
+                         f"{size:>10}{p50:>10}{r['status']:>8}")
+        return "\n".join(lines)
@@ -0,0 +1,689 @@
+import json
+import logging
+import os
+import tempfile
+from collections import defaultdict
+from typing import Optional, Dict, List, Any, Set, Tuple
+
+import numpy as np
+
+from services.compact_service import PROTOBUF_LIMIT
+from services.inference_service import ORT_TO_NUMPY
+from services.instrumentation import tracer
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+FUSION_STAGES = ("rmsnorm", "rotary", "gqa")
+MS_DOMAIN = "com.microsoft"
+# Transpose between [batch, seq, heads, head_dim] and [batch, heads, seq, head_dim]
+BSNH_PERM = [0, 2, 1, 3]
+# Model metadata key listing the contrib ops a fused model relies on
+FUSED_OPS_METADATA = "fused_ops"
+
+
+class _GraphIndex:
+    """Producer/consumer lookup over one (sub)graph; rebuilt after every rewrite."""
+
+    def __init__(self, graph, outer_names: Set[str]):
+        from onnx import numpy_helper
+        self.graph = graph
+        self.producer = {}
+        self.consumers = defaultdict(list)
+        for node in graph.node:
+            for name in node.output:
+                if name:
+                    self.producer[name] = node
+            for name in node.input:
+                self.consumers[name].append(node)
+        self.initializers = {init.name: init for init in graph.initializer}
+        self.outputs = [o.name for o in graph.output]
+        # Graph inputs plus names visible from enclosing graphs (If/Loop bodies)
+        self.available = {i.name for i in graph.input} | outer_names
+        self._to_array = numpy_helper.to_array
+
+    def parent(self, node, index: int, op_type: Optional[str] = None):
+        if index >= len(node.input):
+            return None
+        parent = self.producer.get(node.input[index])
+        if parent is None or (op_type and parent.op_type != op_type):
+            return None
+        return parent
+
+    def constant(self, name: str) -> Optional[np.ndarray]:
+        if name in self.initializers:
+            return self._to_array(self.initializers[name])
+        node = self.producer.get(name)
+        if node is not None and node.op_type == "Constant":
+            for attr in node.attribute:
+                if attr.name == "value":
+                    return self._to_array(attr.t)
+                if attr.name == "value_float":
+                    return np.array(attr.f, dtype=np.float32)
+                if attr.name == "value_int":
+                    return np.array(attr.i, dtype=np.int64)
+        return None
+
+    @staticmethod
+    def attr(node, name: str, default=None):
+        from onnx import helper
+        for attr in node.attribute:
+            if attr.name == name:
+                return helper.get_attribute_value(attr)
+        return default
+
+
+class DecoderFusion:
+    """
+    Service to rewrite exported decoder graphs onto ORT's fused contrib ops.
+
+    Three passes run in order, each verified against the unfused graph:
+    RMSNorm chains become SimplifiedLayerNormalization (or
+    SkipSimplifiedLayerNormalization when fed by a residual Add),
+    rotate_half rotary embeddings become RotaryEmbedding, and the
+    per-layer attention block (past concat, repeat_kv, QK^T, softmax, V)
+    becomes GroupQueryAttention. A pass whose outputs drift from the
+    original model is rolled back.
+    """
+
+    def fuse(self,
+             model_path: str,
+             output_path: Optional[str] = None,
+             config_path: Optional[str] = None,
+             stages: Tuple[str, ...] = FUSION_STAGES,
+             verify: bool = True,
+             atol: float = 1e-3,
+             rtol: float = 1e-3) -> Dict[str, Any]:
+        """
+        Fuse a decoder ONNX model.
+
+        Args:
+            model_path: Exported decoder (.onnx) with past_key_values inputs.
+            output_path: Destination; defaults to <model>.fused.onnx.
+            config_path: HF config.json (num_attention_heads, num_key_value_heads, head_dim,
+                rope_theta, max_position_embeddings); defaults to the one next to the model.
+            stages: Subset of FUSION_STAGES to run.
+            verify: Compare every pass against the unfused graph with onnxruntime.
+            atol: Absolute tolerance of the comparison.
+            rtol: Relative tolerance of the comparison.
+
+        Returns:
+            Report with per-stage `fused` counts, `verified`, `max_abs_diff` and `rolled_back`.
+        """
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"Model not found: {model_path}")
+        unknown = [s for s in stages if s not in FUSION_STAGES]
+        if unknown:
+            raise ValueError(f"Unknown fusion stages: {unknown}. Expected {list(FUSION_STAGES)}")
+        try:
+            import onnx
+        except ImportError:
+            logger.error("onnx is not installed.")
+            raise ImportError("onnx dependency missing.")
+
+        output_path = output_path or os.path.splitext(model_path)[0] + ".fused.onnx"
+        config = self._load_config(model_path, config_path)
+        model = onnx.load(model_path)
+        if not any(i.name == "position_ids" for i in model.graph.input) and "rotary" in stages:
+            logger.warning("Model has no position_ids input; RotaryEmbedding fusion needs it")
+
+        report: Dict[str, Any] = {"model_path": output_path, "stages": {}}
+        with tracer.span("fuse", model_path=model_path, stages=list(stages)), \
+                tempfile.TemporaryDirectory() as work_dir:
+            reference = self._run_reference(model, work_dir) if verify else None
+            for stage in FUSION_STAGES:
+                if stage not in stages:
+                    continue
+                candidate = onnx.ModelProto()
+                candidate.CopyFrom(model)
+                with tracer.span(f"fuse_{stage}"):
+                    fused, skipped = self._apply(stage, candidate, config)
+                entry: Dict[str, Any] = {"fused": fused}
+                if skipped:
+                    entry["skipped"] = skipped
+                if fused and verify:
+                    ok, diff, error = self._compare(candidate, reference, work_dir, atol, rtol)
+                    entry.update(verified=ok, max_abs_diff=diff)
+                    if error:
+                        entry["error"] = error
+                    if not ok:
+                        entry["rolled_back"] = True
+                        logger.warning(f"{stage} fusion changed model outputs (max diff {diff}); rolled back")
+                        report["stages"][stage] = entry
+                        continue
+                if fused:
+                    model = candidate
+                report["stages"][stage] = entry
+                logger.info(f"{stage}: fused {fused}" + (f" ({skipped})" if skipped else ""))
+
+        # Recorded so runtimes can tell which layouts a fused model supports (see ContinuousBatcher)
+        fused_ops = sorted({n.op_type for n in model.graph.node if n.domain == MS_DOMAIN})
+        if fused_ops:
+            props = {p.key: p.value for p in model.metadata_props}
+            props[FUSED_OPS_METADATA] = ",".join(fused_ops)
+            onnx.helper.set_model_props(model, props)
+
+        output_dir = os.path.dirname(output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        external = model.ByteSize() > PROTOBUF_LIMIT
+        onnx.save_model(model, output_path, save_as_external_data=external,
+                        location=os.path.basename(output_path) + ".data" if external else None)
+        report["nodes"] = len(model.graph.node)
+        report["fused_ops"] = fused_ops
+        return report
+
+    # ------------------------------------------------------------------
+    # Configuration
+    # ------------------------------------------------------------------
+
+    def _load_config(self, model_path: str, config_path: Optional[str]) -> Dict[str, Any]:
+        config_path = config_path or os.path.join(os.path.dirname(os.path.abspath(model_path)), "config.json")
+        config: Dict[str, Any] = {}
+        if os.path.exists(config_path):
+            with open(config_path) as f:
+                config = json.load(f)
+        else:
+            logger.warning(f"No config.json at {config_path}; rotary and attention fusion will be skipped")
+        heads = config.get("num_attention_heads")
+        if heads and not config.get("head_dim") and config.get("hidden_size"):
+            config["head_dim"] = config["hidden_size"] // heads
+        config.setdefault("num_key_value_heads", heads)
+        config.setdefault("rope_theta", 10000.0)
+        config.setdefault("max_position_embeddings", 2048)
+        return config
+
+    # ------------------------------------------------------------------
+    # Passes
+    # ------------------------------------------------------------------
+
+    def _apply(self, stage: str, model, config: Dict[str, Any]) -> Tuple[int, Optional[str]]:
+        if stage in ("rotary", "gqa"):
+            missing = [k for k in ("num_attention_heads", "head_dim") if not config.get(k)]
+            if missing:
+                return 0, f"config is missing {missing}"
+            if config.get("rope_scaling"):
+                return 0, "rope_scaling is not supported"
+        main_inputs = {i.name for i in model.graph.input}
+        if stage == "rotary" and "position_ids" not in main_inputs:
+            return 0, "no position_ids input"
+        if stage == "gqa" and "attention_mask" not in main_inputs:
+            return 0, "no attention_mask input"
+
+        fused = self._apply_graph(stage, model, model.graph, set(), config)
+        if fused:
+            self._ensure_ms_opset(model)
+        return fused, None
+
+    def _apply_graph(self, stage: str, model, graph, outer: Set[str], config: Dict[str, Any]) -> int:
+        # Optimum's merged decoders keep both branches in If subgraphs
+        fused = 0
+        visible = outer | {i.name for i in graph.input} | {i.name for i in graph.initializer} | \
+            {o for n in graph.node for o in n.output}
+        for node in graph.node:
+            for sub in self._subgraphs(node):
+                fused += self._apply_graph(stage, model, sub, visible, config)
+
+        index = _GraphIndex(graph, outer)
+        if stage == "rmsnorm":
+            fused += self._fuse_rmsnorm(index)
+        elif stage == "rotary":
+            fused += self._fuse_rotary(model, index, config)
+        else:
+            fused += self._fuse_gqa(model, index, config)
+        if fused:
+            self._eliminate_dead_nodes(graph)
+            self._toposort(graph, outer)
+        return fused
+
+    def _fuse_rmsnorm(self, g: _GraphIndex) -> int:
+        from onnx import helper
+        replacements = {}
+        removed_adds = set()
+        for node in g.graph.node:
+            match = self._match_rmsnorm(g, node)
+            if match is None:
+                continue
+            hidden, weight, eps = match
+            name = node.name or node.output[0]
+            residual = g.producer.get(hidden)
+            if residual is not None and residual.op_type == "Add" and residual.output[0] not in removed_adds \
+                    and self._is_residual_add(g, residual):
+                # Fold the residual Add in; its sum stays available as output 3
+                fused = helper.make_node("SkipSimplifiedLayerNormalization",
+                                         [residual.input[0], residual.input[1], weight],
+                                         [node.output[0], "", "", hidden],
+                                         name=f"{name}_skip_rmsnorm", domain=MS_DOMAIN, epsilon=eps)
+                removed_adds.add(hidden)
+            else:
+                fused = helper.make_node("SimplifiedLayerNormalization", [hidden, weight], [node.output[0]],
+                                         name=f"{name}_rmsnorm", axis=-1, epsilon=eps, stash_type=1)
+            replacements[id(node)] = fused
+
+        if not replacements:
+            return 0
+        nodes = []
+        for node in g.graph.node:
+            if node.op_type == "Add" and node.output[0] in removed_adds:
+                continue
+            nodes.append(replacements.get(id(node), node))
+        del g.graph.node[:]
+        g.graph.node.extend(nodes)
+        return len(replacements)
+
+    def _match_rmsnorm(self, g: _GraphIndex, node) -> Optional[Tuple[str, str, float]]:
+        """weight * (x * 1/sqrt(mean(x^2) + eps)) -> (x, weight, eps)."""
+        if node.op_type != "Mul":
+            return None
+        for w_idx in (0, 1):
+            weight = node.input[w_idx]
+            init = g.initializers.get(weight)
+            if init is None or len(init.dims) != 1:
+                continue
+            normed = g.producer.get(self._skip_casts(g, node.input[1 - w_idx], init.data_type))
+            if normed is None or normed.op_type != "Mul":
+                continue
+            for x_idx in (0, 1):
+                hidden = normed.input[x_idx]
+                chain = self._match_inverse_rms(g, g.producer.get(normed.input[1 - x_idx]))
+                if chain is not None and chain[0] == hidden:
+                    return hidden, weight, chain[1]
+        return None
+
+    def _match_inverse_rms(self, g: _GraphIndex, node) -> Optional[Tuple[str, float]]:
+        if node is None:
+            return None
+        if node.op_type == "Reciprocal":
+            sqrt = g.parent(node, 0, "Sqrt")
+        elif node.op_type == "Div":
+            one = g.constant(node.input[0])
+            sqrt = g.parent(node, 1, "Sqrt") if one is not None and one.size == 1 and one.item() == 1.0 else None
+        else:
+            return None
+        add = g.parent(sqrt, 0, "Add") if sqrt is not None else None
+        if add is None:
+            return None
+        for m_idx in (0, 1):
+            mean = g.parent(add, m_idx, "ReduceMean")
+            eps = g.constant(add.input[1 - m_idx])
+            if mean is None or eps is None or eps.size != 1:
+                continue
+            axes = g.attr(mean, "axes")
+            if axes is None and len(mean.input) > 1:
+                axes = g.constant(mean.input[1])
+            if axes is None or list(np.atleast_1d(axes)) != [-1] or g.attr(mean, "keepdims", 1) != 1:
+                return None
+            power = g.parent(mean, 0, "Pow")
+            exponent = g.constant(power.input[1]) if power is not None else None
+            if exponent is None or exponent.size != 1 or exponent.item() != 2.0:
+                return None
+            return power.input[0], float(eps.item())
+        return None
+
+    def _skip_casts(self, g: _GraphIndex, name: str, to: int) -> str:
+        # Casts to the weight's own type are no-ops in fp32 exports
+        node = g.producer.get(name)
+        while node is not None and node.op_type == "Cast" and g.attr(node, "to") == to:
+            name = node.input[0]
+            node = g.producer.get(name)
+        return name
+
+    def _is_residual_add(self, g: _GraphIndex, add) -> bool:
+        # Both operands must be activations (not a bias) and the sum must be reused later
+        if any(name in g.initializers or g.constant(name) is not None for name in add.input):
+            return False
+        return len(g.consumers[add.output[0]]) > 1 or add.output[0] in g.outputs
+
+    def _rope_caches(self, model, config: Dict[str, Any]) -> Tuple[str, str]:
+        from onnx import numpy_helper
+        cos_name, sin_name = "fusion_rope_cos_cache", "fusion_rope_sin_cache"
+        names = {init.name for init in model.graph.initializer}
+        if cos_name not in names:
+            head_dim = config["head_dim"]
+            inv_freq = 1.0 / (float(config["rope_theta"]) ** (np.arange(0, head_dim, 2, dtype=np.float64) / head_dim))
+            freqs = np.outer(np.arange(config["max_position_embeddings"], dtype=np.float64), inv_freq)
+            dtype = self._float_dtype(model)
+            # Caches live in the main graph so If branches can capture them
+            model.graph.initializer.extend([numpy_helper.from_array(np.cos(freqs).astype(dtype), cos_name),
+                                            numpy_helper.from_array(np.sin(freqs).astype(dtype), sin_name)])
+        return cos_name, sin_name
+
+    def _fuse_rotary(self, model, g: _GraphIndex, config: Dict[str, Any]) -> int:
+        from onnx import helper
+        replacements = {}
+        for node in g.graph.node:
+            x = self._match_rotate_half(g, node)
+            if x is None:
+                continue
+            cos_cache, sin_cache = self._rope_caches(model, config)
+            replacements[id(node)] = helper.make_node(
+                "RotaryEmbedding", [x, "position_ids", cos_cache, sin_cache], [node.output[0]],
+                name=f"{node.name or node.output[0]}_rotary", domain=MS_DOMAIN, interleaved=0
+            )
+        if replacements:
+            nodes = [replacements.get(id(n), n) for n in g.graph.node]
+            del g.graph.node[:]
+            g.graph.node.extend(nodes)
+        return len(replacements)
+
+    def _match_rotate_half(self, g: _GraphIndex, node) -> Optional[str]:
+        """x * cos + concat(-x[..., d/2:], x[..., :d/2]) * sin -> x."""
+        if node.op_type != "Add":
+            return None
+        for a_idx in (0, 1):
+            plain, rotated = g.parent(node, a_idx, "Mul"), g.parent(node, 1 - a_idx, "Mul")
+            if plain is None or rotated is None:
+                continue
+            for r_idx in (0, 1):
+                concat = g.parent(rotated, r_idx, "Concat")
+                if concat is None or len(concat.input) != 2 or g.attr(concat, "axis") not in (-1, 3):
+                    continue
+                neg, first_half = g.parent(concat, 0, "Neg"), g.parent(concat, 1, "Slice")
+                second_half = g.parent(neg, 0, "Slice") if neg is not None else None
+                if first_half is None or second_half is None:
+                    continue
+                x = first_half.input[0]
+                if second_half.input[0] == x and x in plain.input:
+                    return x
+        return None
+
+    def _fuse_gqa(self, model, g: _GraphIndex, config: Dict[str, Any]) -> int:
+        from onnx import helper, numpy_helper, TensorProto
+        matches = []
+        for key_out in g.outputs:
+            if "present" not in key_out or not key_out.endswith("key"):
+                continue
+            value_out = key_out[:-len("key")] + "value"
+            if value_out not in g.outputs:
+                continue
+            match = self._match_attention(g, key_out, value_out)
+            if match is not None:
+                matches.append(match)
+        if not matches:
+            return 0
+
+        cos_cache, sin_cache = self._rope_caches(model, config)
+        shape_name = "fusion_bsh_shape"
+        if shape_name not in g.initializers:
+            g.graph.initializer.append(numpy_helper.from_array(np.array([0, 0, -1], dtype=np.int64), shape_name))
+
+        # seqlens_k = sum(mask) - 1 and total_sequence_length = mask.shape[1], as int32
+        opset = next((o.version for o in model.opset_import if o.domain in ("", "ai.onnx")), 13)
+        one_name, axis_name = "fusion_one_i64", "fusion_axis_1"
+        g.graph.initializer.extend([numpy_helper.from_array(np.array(1, dtype=np.int64), one_name),
+                                    numpy_helper.from_array(np.array([1], dtype=np.int64), axis_name)])
+        if opset >= 13:
+            reduce = helper.make_node("ReduceSum", ["attention_mask", axis_name], ["fusion_mask_sum"], keepdims=0)
+        else:
+            reduce = helper.make_node("ReduceSum", ["attention_mask"], ["fusion_mask_sum"], axes=[1], keepdims=0)
+        prologue = [
+            reduce,
+            helper.make_node("Sub", ["fusion_mask_sum", one_name], ["fusion_seqlens_i64"]),
+            helper.make_node("Cast", ["fusion_seqlens_i64"], ["fusion_seqlens_k"], to=TensorProto.INT32),
+            helper.make_node("Shape", ["attention_mask"], ["fusion_mask_shape"]),
+            helper.make_node("Gather", ["fusion_mask_shape", one_name], ["fusion_total_len_i64"], axis=0),
+            helper.make_node("Cast", ["fusion_total_len_i64"], ["fusion_total_seq_len"], to=TensorProto.INT32),
+        ]
+
+        removed = set()
+        replacements = {}
+        for i, m in enumerate(matches):
+            reshapes = [helper.make_node("Reshape", [m[part], shape_name], [f"{m[part]}_bsh"], name=f"gqa{i}_{part}_bsh")
+                        for part in ("q", "k", "v")]
+            gqa = helper.make_node(
+                "GroupQueryAttention",
+                [f"{m['q']}_bsh", f"{m['k']}_bsh", f"{m['v']}_bsh", m["past_key"], m["past_value"],
+                 "fusion_seqlens_k", "fusion_total_seq_len", cos_cache, sin_cache],
+                [m["output"], m["present_key"], m["present_value"]],
+                name=f"GroupQueryAttention_{i}", domain=MS_DOMAIN,
+                num_heads=int(config["num_attention_heads"]), kv_num_heads=int(config["num_key_value_heads"]),
+                do_rotary=1, rotary_interleaved=0,
+            )
+            replacements[id(m["output_node"])] = reshapes + [gqa]
+            removed.update({id(m["key_concat"]), id(m["value_concat"])})
+
+        nodes = list(prologue)
+        for node in g.graph.node:
+            if id(node) in removed:
+                continue
+            nodes.extend(replacements.get(id(node), [node]))
+        del g.graph.node[:]
+        g.graph.node.extend(nodes)
+        return len(matches)
+
+    def _match_attention(self, g: _GraphIndex, key_out: str, value_out: str) -> Optional[Dict[str, Any]]:
+        """Match one decoder attention block anchored on its present key/value outputs."""
+        key_concat, value_concat = g.producer.get(key_out), g.producer.get(value_out)
+        for concat in (key_concat, value_concat):
+            if concat is None or concat.op_type != "Concat" or g.attr(concat, "axis") not in (2, -2) \
+                    or len(concat.input) != 2 or concat.input[0] not in g.available:
+                return None
+
+        # New K: Reshape -> (k_norm) -> Transpose -> RotaryEmbedding; new V: Reshape -> Transpose
+        rot_k = g.parent(key_concat, 1, "RotaryEmbedding")
+        k_t = g.parent(rot_k, 0, "Transpose") if rot_k is not None else None
+        v_t = g.parent(value_concat, 1, "Transpose")
+        if k_t is None or v_t is None or g.attr(k_t, "perm") != BSNH_PERM or g.attr(v_t, "perm") != BSNH_PERM:
+            return None
+
+        softmax = self._find_downstream(g, key_out, "Softmax", depth=10)
+        if softmax is None:
+            return None
+        qk = self._walk_up(g, softmax.input[0], "MatMul", through=("Add", "Mul", "Div", "Where", "Cast"))
+        if qk is None:
+            return None
+        rot_q = None
+        for side in qk.input:
+            candidate = self._walk_up(g, side, "RotaryEmbedding", through=("Mul", "Div", "Cast"))
+            if candidate is not None and candidate is not rot_k:
+                rot_q = candidate
+        q_t = g.parent(rot_q, 0, "Transpose") if rot_q is not None else None
+        if q_t is None or g.attr(q_t, "perm") != BSNH_PERM:
+            return None
+        if not any(self._reaches(g, side, key_out, depth=10) for side in qk.input):
+            return None
+
+        pv = self._find_downstream(g, softmax.output[0], "MatMul", depth=3)
+        if pv is None or not any(self._reaches(g, side, value_out, depth=10) for side in pv.input):
+            return None
+        out_t = self._find_downstream(g, pv.output[0], "Transpose", depth=1)
+        if out_t is None or g.attr(out_t, "perm") != BSNH_PERM:
+            return None
+        consumers = g.consumers[out_t.output[0]]
+        if len(consumers) != 1 or consumers[0].op_type != "Reshape":
+            return None
+        output_node = consumers[0]
+
+        return {"q": q_t.input[0], "k": k_t.input[0], "v": v_t.input[0],
+                "past_key": key_concat.input[0], "past_value": value_concat.input[0],
+                "present_key": key_out, "present_value": value_out,
+                "output": output_node.output[0], "output_node": output_node,
+                "key_concat": key_concat, "value_concat": value_concat}
+
+    def _find_downstream(self, g: _GraphIndex, name: str, op_type: str, depth: int):
+        frontier, seen = [name], set()
+        for _ in range(depth + 1):
+            following = []
+            for tensor in frontier:
+                for node in g.consumers.get(tensor, []):
+                    if node.op_type == op_type:
+                        return node
+                    if id(node) not in seen:
+                        seen.add(id(node))
+                        following.extend(o for o in node.output if o)
+            frontier = following
+        return None
+
+    def _walk_up(self, g: _GraphIndex, name: str, op_type: str, through: Tuple[str, ...], depth: int = 8):
+        for _ in range(depth):
+            node = g.producer.get(name)
+            if node is None:
+                return None
+            if node.op_type == op_type:
+                return node
+            if node.op_type not in through:
+                return None
+            # Follow the activation operand, not the scale/mask constant
+            activations = [n for n in node.input if n and g.constant(n) is None]
+            if not activations:
+                return None
+            name = activations[0]
+        return None
+
+    def _reaches(self, g: _GraphIndex, name: str, target: str, depth: int) -> bool:
+        frontier = [name]
+        for _ in range(depth + 1):
+            if target in frontier:
+                return True
+            frontier = [i for n in frontier if n in g.producer for i in g.producer[n].input if i]
+        return False
+
+    # ------------------------------------------------------------------
+    # Graph housekeeping
+    # ------------------------------------------------------------------
+
+    def _subgraphs(self, node) -> List[Any]:
+        from onnx import AttributeProto
+        graphs = []
+        for attr in node.attribute:
+            if attr.type == AttributeProto.GRAPH:
+                graphs.append(attr.g)
+            elif attr.type == AttributeProto.GRAPHS:
+                graphs.extend(attr.graphs)
+        return graphs
+
+    def _used_names(self, graph) -> Set[str]:
+        used = set()
+        for node in graph.node:
+            used.update(node.input)
+            for sub in self._subgraphs(node):
+                used |= self._used_names(sub) | {o.name for o in sub.output}
+        return used
+
+    def _eliminate_dead_nodes(self, graph):
+        outputs = {o.name for o in graph.output}
+        while True:
+            used = self._used_names(graph) | outputs
+            alive = [n for n in graph.node if any(o in used for o in n.output if o)]
+            if len(alive) == len(graph.node):
+                break
+            del graph.node[:]
+            graph.node.extend(alive)
+        used = self._used_names(graph) | outputs
+        kept = [init for init in graph.initializer if init.name in used]
+        del graph.initializer[:]
+        graph.initializer.extend(kept)
+
+    def _toposort(self, graph, outer: Set[str]):
+        available = set(outer) | {i.name for i in graph.input} | {i.name for i in graph.initializer} | {""}
+        produced = {o for n in graph.node for o in n.output if o}
+        pending = list(graph.node)
+        ordered = []
+        while pending:
+            remaining = []
+            for node in pending:
+                needed = set(node.input)
+                for sub in self._subgraphs(node):
+                    # Subgraph bodies may capture values produced in this graph
+                    needed |= self._used_names(sub) & produced
+                if needed <= available:
+                    ordered.append(node)
+                    available.update(node.output)
+                else:
+                    remaining.append(node)
+            if len(remaining) == len(pending):
+                raise RuntimeError("Fused graph contains a cycle")
+            pending = remaining
+        del graph.node[:]
+        graph.node.extend(ordered)
+
+    def _ensure_ms_opset(self, model):
+        from onnx import helper
+        if not any(o.domain == MS_DOMAIN for o in model.opset_import):
+            model.opset_import.append(helper.make_opsetid(MS_DOMAIN, 1))
+
+    def _float_dtype(self, model):
+        from onnx import helper
+        for init in model.graph.initializer:
+            dtype = np.dtype(helper.tensor_dtype_to_np_dtype(init.data_type))
+            if dtype.kind == "f":
+                return dtype
+        return np.dtype(np.float32)
+
+    # ------------------------------------------------------------------
+    # Verification
+    # ------------------------------------------------------------------
+
+    def _session(self, model, work_dir: str):
+        import onnx
+        import onnxruntime as ort
+        path = os.path.join(work_dir, "candidate.onnx")
+        external = model.ByteSize() > PROTOBUF_LIMIT
+        onnx.save_model(model, path, save_as_external_data=external,
+                        location="candidate.onnx.data" if external else None)
+        return ort.InferenceSession(path, providers=["CPUExecutionProvider"])
+
+    def _verification_feeds(self, session, past_len: int, seq_len: int, pad: int = 0) -> Dict[str, np.ndarray]:
+        """
+        Synthetic feeds for one verification run.
+
+        With `pad` > 0 a second row is added whose past is `pad` positions
+        shorter, right-padded (the KV layout GroupQueryAttention supports).
+        """
+        rng = np.random.default_rng(0)
+        batch = 2 if pad else 1
+        # Valid past positions per row; padding sits at the end of each row's past
+        valid = [past_len, past_len - pad][:batch]
+        feeds = {}
+        for inp in session.get_inputs():
+            dtype = ORT_TO_NUMPY.get(inp.type, np.float32)
+            if inp.name == "input_ids":
+                feeds[inp.name] = rng.integers(0, 100, (batch, seq_len)).astype(dtype)
+            elif inp.name == "attention_mask":
+                mask = np.ones((batch, past_len + seq_len), dtype=dtype)
+                for b, n in enumerate(valid):
+                    mask[b, n:past_len] = 0
+                feeds[inp.name] = mask
+            elif inp.name == "position_ids":
+                feeds[inp.name] = np.stack([np.arange(n, n + seq_len) for n in valid]).astype(dtype)
+            elif inp.name == "use_cache_branch":
+                feeds[inp.name] = np.array([past_len > 0])
+            elif "past" in inp.name:
+                shape = [batch if a == 0 else (d if isinstance(d, int) else past_len) for a, d in enumerate(inp.shape)]
+                feeds[inp.name] = rng.standard_normal(shape).astype(dtype)
+            else:
+                raise ValueError(f"Cannot build a verification input for '{inp.name}'")
+        return feeds
+
+    def _run_reference(self, model, work_dir: str) -> List[Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]]:
+        session = self._session(model, work_dir)
+        names = [o.name for o in session.get_outputs()]
+        runs = []
+        # Prefill from an empty cache, a decode step on top of a filled one, and a
+        # two-row decode step with a padded shorter row
+        for past_len, seq_len, pad in ((0, 8, 0), (8, 1, 0), (8, 1, 3)):
+            feeds = self._verification_feeds(session, past_len, seq_len, pad)
+            # Padded present slots hold unspecified values once fused, so only logits are compared
+            checked = [n for n in names if not (pad and "present" in n)]
+            runs.append((feeds, dict(zip(checked, session.run(checked, feeds)))))
+        return runs
+
+    def _compare(self, model, reference, work_dir: str, atol: float, rtol: float) -> Tuple[bool, float, Optional[str]]:
+        try:
+            session = self._session(model, work_dir)
+            max_diff = 0.0
+            ok = True
+            for feeds, expected in reference:
+                names = list(expected)
+                actual = dict(zip(names, session.run(names, feeds)))
+                for name in names:
+                    a = actual[name].astype(np.float64)
+                    e = expected[name].astype(np.float64)
+                    if a.shape != e.shape:
+                        return False, float("inf"), f"{name}: shape {a.shape} != {e.shape}"
+                    if a.size:
+                        max_diff = max(max_diff, float(np.abs(a - e).max()))
+                        ok = ok and bool(np.allclose(a, e, rtol=rtol, atol=atol))
+            return ok, max_diff, None
+        except Exception as e:
+            return False, float("inf"), str(e)
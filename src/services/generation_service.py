@@ -0,0 +1,458 @@
+import logging
+import time
+from typing import Optional, Dict, List, Any, Tuple
+
+import numpy as np
+
+from services.inference_service import InferenceService, ORT_TO_NUMPY
+from services.prefix_cache import PrefixCache
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class GenerationService:
+    """
+    Service to run autoregressive generation with ONNX causal-LM decoders.
+
+    Expects the Optimum/HF export layout: `input_ids`, `attention_mask`,
+    optional `position_ids`, `past_key_values.<i>.key/value` inputs and
+    `logits`, `present.<i>.key/value` outputs.
+    """
+
+    def __init__(self):
+        self.inference = InferenceService()
+        self.session = None
+        self.tokenizer = None
+        self.input_names: List[str] = []
+        self.past_names: List[str] = []
+        self.present_names: List[str] = []
+        self.logits_name = "logits"
+        self.logits_dtype = np.float32
+        self.kv_dtype = np.float32
+        self.kv_seq_axis = 2
+        self.kv_shape: List[int] = []
+        self.rng = np.random.default_rng()
+        # Optional small decoder sharing the tokenizer, used for speculative decoding
+        self.draft: Optional["GenerationService"] = None
+        self.prefix_cache: Optional[PrefixCache] = None
+
+    @staticmethod
+    def is_decoder(session) -> bool:
+        return any("past" in i.name for i in session.get_inputs())
+
+    def load(self, model_path: str, providers: Optional[List[str]] = None, intra_op_num_threads: int = 0) -> bool:
+        """
+        Load an ONNX decoder exported with a KV cache.
+
+        Args:
+            model_path: Path to the decoder .onnx (tokenizer files may sit next to it).
+            providers: Execution providers (defaults to CPUExecutionProvider).
+            intra_op_num_threads: ORT threads per operator (0 keeps the default).
+
+        Returns:
+            True if the model was loaded.
+        """
+        inference = InferenceService()
+        inference.load(model_path, providers, intra_op_num_threads)
+        return self.attach(inference)
+
+    def attach(self, inference: InferenceService) -> bool:
+        """Use an already loaded InferenceService (e.g. one owned by the server)."""
+        model_path = inference.model_path
+        if not self.is_decoder(inference.session):
+            raise ValueError(f"Model has no past_key_values inputs: {model_path}")
+        self.inference = inference
+        self.session = inference.session
+        self.tokenizer = inference.tokenizer
+
+        inputs = {i.name: i for i in self.session.get_inputs()}
+        output_types = {o.name: o.type for o in self.session.get_outputs()}
+        outputs = list(output_types)
+        self.input_names = list(inputs)
+        self.past_names = [n for n in inputs if "past" in n]
+        self.present_names = []
+        for past in self.past_names:
+            present = past.replace("past_key_values", "present")
+            if present not in outputs:
+                raise ValueError(f"No present output matching {past}")
+            self.present_names.append(present)
+        self.logits_name = "logits" if "logits" in outputs else outputs[0]
+        self.logits_dtype = ORT_TO_NUMPY.get(output_types[self.logits_name], np.float32)
+
+        first = inputs[self.past_names[0]]
+        self.kv_dtype = ORT_TO_NUMPY.get(first.type, np.float32)
+        self.kv_shape = list(first.shape)
+        symbolic = [a for a, d in enumerate(self.kv_shape) if a > 0 and not isinstance(d, int)]
+        self.kv_seq_axis = symbolic[0] if symbolic else 2
+        logger.info(f"Loaded decoder with {len(self.past_names) // 2} KV layers: {model_path}")
+        return True
+
+    def enable_prefix_cache(self, max_bytes: int = 256 * 1024 * 1024, block_size: int = 16) -> PrefixCache:
+        """Reuse prefill KV tensors across prompts sharing a prefix (system prompts, few-shot templates)."""
+        if self.session is None:
+            raise RuntimeError("No model loaded. Call load() first.")
+        self.prefix_cache = PrefixCache(self.kv_seq_axis, block_size, max_bytes)
+        logger.info(f"Prefix cache enabled: {max_bytes / (1024 * 1024):.0f} MB, {block_size}-token blocks")
+        return self.prefix_cache
+
+    def load_draft(self, model_path: str, providers: Optional[List[str]] = None) -> bool:
+        """
+        Load a draft decoder for speculative decoding.
+
+        The draft must share the target's tokenizer/vocabulary; it only
+        proposes tokens, so outputs are unchanged whatever its quality.
+        """
+        draft = GenerationService()
+        draft.load(model_path, providers)
+        draft.rng = self.rng
+        self.draft = draft
+        logger.info(f"Loaded draft model for speculative decoding: {model_path}")
+        return True
+
+    # ------------------------------------------------------------------
+    # Forward passes
+    # ------------------------------------------------------------------
+
+    def empty_past(self, batch_size: int = 1) -> Dict[str, np.ndarray]:
+        shape = [batch_size if a == 0 else (0 if a == self.kv_seq_axis else d)
+                 for a, d in enumerate(self.kv_shape)]
+        return {name: np.zeros(shape, dtype=self.kv_dtype) for name in self.past_names}
+
+    def past_length(self, past: Dict[str, np.ndarray]) -> int:
+        return past[self.past_names[0]].shape[self.kv_seq_axis]
+
+    def trim_past(self, past: Dict[str, np.ndarray], length: int) -> Dict[str, np.ndarray]:
+        """Roll the KV cache back to its first `length` positions."""
+        if self.past_length(past) <= length:
+            return past
+        index = tuple(slice(0, length) if a == self.kv_seq_axis else slice(None)
+                      for a in range(len(self.kv_shape)))
+        return {name: value[index] for name, value in past.items()}
+
+    def _base_feeds(self,
+                    input_ids: np.ndarray,
+                    past_len: int,
+                    attention_mask: Optional[np.ndarray] = None,
+                    position_ids: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+        batch, seq = input_ids.shape
+        feeds = {"input_ids": input_ids.astype(np.int64)}
+        if "attention_mask" in self.input_names:
+            if attention_mask is None:
+                attention_mask = np.ones((batch, past_len + seq), dtype=np.int64)
+            feeds["attention_mask"] = attention_mask
+        if "position_ids" in self.input_names:
+            if position_ids is None:
+                position_ids = np.broadcast_to(np.arange(past_len, past_len + seq, dtype=np.int64), (batch, seq))
+            feeds["position_ids"] = np.ascontiguousarray(position_ids)
+        if "use_cache_branch" in self.input_names:
+            feeds["use_cache_branch"] = np.array([past_len > 0])
+        return feeds
+
+    def forward(self,
+                input_ids: np.ndarray,
+                past: Dict[str, np.ndarray],
+                attention_mask: Optional[np.ndarray] = None,
+                position_ids: Optional[np.ndarray] = None) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """
+        Run one forward pass.
+
+        Returns:
+            (logits [batch, seq, vocab], new past keyed by past input names).
+        """
+        feeds = self._base_feeds(input_ids, self.past_length(past), attention_mask, position_ids)
+        feeds.update(past)
+        outputs = self.session.run([self.logits_name] + self.present_names, feeds)
+        return outputs[0], dict(zip(self.past_names, outputs[1:]))
+
+    def prefill(self, prompt_ids: List[int]) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """
+        Run the prompt, starting from the longest cached prefix when a prefix cache is enabled.
+
+        Returns:
+            (logits for the uncached remainder, past covering the whole prompt).
+        """
+        past, matched = self.empty_past(1), 0
+        if self.prefix_cache is not None:
+            # Keep at least one token to prefill: its logits pick the first new token.
+            matched, cached = self.prefix_cache.lookup(prompt_ids, len(prompt_ids) - 1)
+            if cached is not None:
+                past = cached
+        logits, past = self.forward(np.array([prompt_ids[matched:]], dtype=np.int64), past)
+        if self.prefix_cache is not None:
+            self.prefix_cache.insert(prompt_ids, past)
+        return logits, past
+
+    def token_probs(self, logits: np.ndarray, temperature: float, top_k: int = 0) -> np.ndarray:
+        """Sampling distribution over a [vocab] logits row (temperature > 0)."""
+        scaled = logits.astype(np.float64) / temperature
+        if top_k:
+            cutoff = np.partition(scaled, -top_k)[-top_k]
+            scaled = np.where(scaled < cutoff, -np.inf, scaled)
+        probs = np.exp(scaled - scaled.max())
+        return probs / probs.sum()
+
+    def select_token(self, logits: np.ndarray, temperature: float = 0.0, top_k: int = 0) -> int:
+        """Pick the next token from a [vocab] logits row (greedy when temperature is 0)."""
+        if temperature <= 0:
+            return int(np.argmax(logits))
+        probs = self.token_probs(logits, temperature, top_k)
+        return int(self.rng.choice(len(probs), p=probs))
+
+    # ------------------------------------------------------------------
+    # Generation loops
+    # ------------------------------------------------------------------
+
+    def generate(self,
+                 prompt_ids: List[int],
+                 max_new_tokens: int = 32,
+                 eos_token_id: Optional[int] = None,
+                 temperature: float = 0.0,
+                 top_k: int = 0,
+                 use_iobinding: bool = True,
+                 num_draft_tokens: int = 0) -> Dict[str, Any]:
+        """
+        Generate tokens for a single prompt.
+
+        Args:
+            prompt_ids: Prompt token ids.
+            max_new_tokens: Maximum tokens to generate.
+            eos_token_id: Stop when this token is produced.
+            temperature: Sampling temperature (0 = greedy).
+            top_k: Restrict sampling to the k most likely tokens (0 = no limit).
+            use_iobinding: Keep the KV cache bound as ORT values between steps
+                instead of round-tripping it through NumPy.
+            num_draft_tokens: When > 0 and a draft model is loaded, decode
+                speculatively with that many draft proposals per target forward.
+
+        Returns:
+            Dict with generated `tokens`, `time_to_first_token_ms` and `tokens_per_second`
+            (plus `acceptance_rate` and `target_forwards` when decoding speculatively).
+        """
+        if self.session is None:
+            raise RuntimeError("No model loaded. Call load() first.")
+        if not prompt_ids:
+            raise ValueError("Prompt must contain at least one token.")
+
+        if num_draft_tokens > 0 and self.draft is not None:
+            return self.generate_speculative(prompt_ids, max_new_tokens, eos_token_id, num_draft_tokens,
+                                             temperature, top_k)
+
+        start = time.perf_counter()
+        loop = self._generate_bound if use_iobinding else self._generate_numpy
+        tokens, first_token_at = loop(prompt_ids, max_new_tokens, eos_token_id, temperature, top_k)
+        elapsed = time.perf_counter() - start
+
+        return {
+            "tokens": tokens,
+            "time_to_first_token_ms": 1000.0 * (first_token_at - start),
+            "tokens_per_second": len(tokens) / elapsed if elapsed > 0 else 0.0,
+        }
+
+    def _generate_numpy(self, prompt_ids, max_new_tokens, eos_token_id, temperature, top_k):
+        logits, past = self.prefill(prompt_ids)
+        first_token_at = time.perf_counter()
+
+        tokens: List[int] = []
+        while True:
+            token = self.select_token(logits[0, -1], temperature, top_k)
+            tokens.append(token)
+            if token == eos_token_id or len(tokens) >= max_new_tokens:
+                break
+            logits, past = self.forward(np.array([[token]], dtype=np.int64), past)
+        return tokens, first_token_at
+
+    def _generate_bound(self, prompt_ids, max_new_tokens, eos_token_id, temperature, top_k):
+        binding = self.session.io_binding()
+        prompt_len = len(prompt_ids)
+        max_total = prompt_len + max_new_tokens
+
+        if self.prefix_cache is not None:
+            # Prefill through the prefix cache, then hand the KV cache to the binding.
+            from onnxruntime import OrtValue
+            logits, past = self.prefill(prompt_ids)
+            first_token_at = time.perf_counter()
+            logits_row = logits[0, -1]
+            vocab = logits.shape[-1]
+            kv_values = [OrtValue.ortvalue_from_numpy(past[name]) for name in self.past_names]
+        else:
+            # Prefill: ORT allocates logits and the first KV cache.
+            for name, value in self._base_feeds(np.array([prompt_ids], dtype=np.int64), 0).items():
+                binding.bind_cpu_input(name, value)
+            for name, value in self.empty_past(1).items():
+                binding.bind_cpu_input(name, value)
+            binding.bind_output(self.logits_name, "cpu")
+            for name in self.present_names:
+                binding.bind_output(name, "cpu")
+            self.session.run_with_iobinding(binding)
+            first_token_at = time.perf_counter()
+
+            outputs = binding.get_outputs()
+            logits_row = outputs[0].numpy()[0, -1]
+            vocab = outputs[0].shape()[-1]
+            kv_values = outputs[1:]
+
+        # Decode buffers are allocated once and rebound in place every step.
+        ids_buf = np.zeros((1, 1), dtype=np.int64)
+        pos_buf = np.zeros((1, 1), dtype=np.int64)
+        mask_buf = np.ones((1, max_total), dtype=np.int64)
+        logits_buf = np.empty((1, 1, vocab), dtype=self.logits_dtype)
+
+        tokens: List[int] = []
+        past_len = prompt_len
+        while True:
+            token = self.select_token(logits_row, temperature, top_k)
+            tokens.append(token)
+            if token == eos_token_id or len(tokens) >= max_new_tokens:
+                break
+
+            ids_buf[0, 0] = token
+            pos_buf[0, 0] = past_len
+            binding.clear_binding_inputs()
+            binding.clear_binding_outputs()
+            binding.bind_input("input_ids", "cpu", 0, np.int64, [1, 1], ids_buf.ctypes.data)
+            if "attention_mask" in self.input_names:
+                binding.bind_input("attention_mask", "cpu", 0, np.int64, [1, past_len + 1], mask_buf.ctypes.data)
+            if "position_ids" in self.input_names:
+                binding.bind_input("position_ids", "cpu", 0, np.int64, [1, 1], pos_buf.ctypes.data)
+            if "use_cache_branch" in self.input_names:
+                binding.bind_cpu_input("use_cache_branch", np.array([True]))
+            # The previous step's present tensors feed straight back in as past.
+            for name, value in zip(self.past_names, kv_values):
+                binding.bind_ortvalue_input(name, value)
+
+            binding.bind_output(self.logits_name, "cpu", 0, logits_buf.dtype, list(logits_buf.shape), logits_buf.ctypes.data)
+            for name in self.present_names:
+                binding.bind_output(name, "cpu")
+            self.session.run_with_iobinding(binding)
+
+            kv_values = binding.get_outputs()[1:]
+            logits_row = logits_buf[0, -1]
+            past_len += 1
+
+        return tokens, first_token_at
+
+    def generate_speculative(self,
+                             prompt_ids: List[int],
+                             max_new_tokens: int = 32,
+                             eos_token_id: Optional[int] = None,
+                             num_draft_tokens: int = 4,
+                             temperature: float = 0.0,
+                             top_k: int = 0) -> Dict[str, Any]:
+        """
+        Speculative decoding: the draft proposes k tokens, the target verifies them in one forward.
+
+        Greedy decoding accepts a proposal only if it equals the target's
+        argmax, so the output matches plain greedy decoding exactly. With
+        sampling, proposals are accepted with probability min(1, p/q) and a
+        rejection resamples from max(0, p - q), which preserves the target
+        distribution. Rejected positions are rolled back from both KV caches.
+
+        Returns:
+            Dict with `tokens`, `time_to_first_token_ms`, `tokens_per_second`,
+            `acceptance_rate` (accepted / proposed) and `target_forwards`.
+        """
+        if self.session is None or self.draft is None:
+            raise RuntimeError("Load a target model and a draft model first.")
+        if not prompt_ids:
+            raise ValueError("Prompt must contain at least one token.")
+
+        start = time.perf_counter()
+        logits, target_past = self.prefill(prompt_ids)
+        first_token_at = time.perf_counter()
+        draft_logits, draft_past = self.draft.prefill(prompt_ids)
+        if draft_logits.shape[-1] != logits.shape[-1]:
+            raise ValueError(f"Draft vocabulary ({draft_logits.shape[-1]}) does not match target ({logits.shape[-1]}).")
+
+        # Invariant: the target cache covers sequence[:-1]; the draft cache a prefix of it.
+        sequence = list(prompt_ids) + [self.select_token(logits[0, -1], temperature, top_k)]
+        tokens = sequence[len(prompt_ids):]
+        proposed = accepted = forwards = 0
+
+        while tokens[-1] != eos_token_id and len(tokens) < max_new_tokens:
+            k = min(num_draft_tokens, max_new_tokens - len(tokens))
+
+            # 1. Draft k tokens autoregressively (feeding whatever the draft cache is missing first).
+            draft_tokens, draft_dists = [], []
+            pending = sequence[self.draft.past_length(draft_past):]
+            for _ in range(k):
+                draft_logits, draft_past = self.draft.forward(np.array([pending], dtype=np.int64), draft_past)
+                row = draft_logits[0, -1]
+                if temperature > 0:
+                    dist = self.token_probs(row, temperature, top_k)
+                    token = int(self.rng.choice(len(dist), p=dist))
+                    draft_dists.append(dist)
+                else:
+                    token = int(np.argmax(row))
+                draft_tokens.append(token)
+                pending = [token]
+
+            # 2. Verify all proposals (plus one bonus position) in a single target forward.
+            verify = np.array([[sequence[-1]] + draft_tokens], dtype=np.int64)
+            logits, target_past = self.forward(verify, target_past)
+            forwards += 1
+            rows = logits[0]
+
+            new_tokens = []
+            for i, token in enumerate(draft_tokens):
+                if temperature > 0:
+                    p = self.token_probs(rows[i], temperature, top_k)
+                    q = draft_dists[i]
+                    if self.rng.random() < min(1.0, p[token] / max(q[token], 1e-20)):
+                        new_tokens.append(token)
+                        continue
+                    residual = np.maximum(p - q, 0.0)
+                    total = residual.sum()
+                    correction = int(self.rng.choice(len(p), p=residual / total)) if total > 0 else \
+                        int(self.rng.choice(len(p), p=p))
+                else:
+                    correction = int(np.argmax(rows[i]))
+                    if correction == token:
+                        new_tokens.append(token)
+                        continue
+                new_tokens.append(correction)
+                break
+            else:
+                # Every proposal accepted: the last row gives a free extra token.
+                new_tokens.append(self.select_token(rows[k], temperature, top_k))
+
+            n_accepted = len(new_tokens) - 1
+            proposed += k
+            accepted += n_accepted
+
+            committed = len(sequence) + n_accepted
+            for token in new_tokens:
+                tokens.append(token)
+                sequence.append(token)
+                if token == eos_token_id or len(tokens) >= max_new_tokens:
+                    break
+            # 3. Roll back rejected positions; both caches must end at or before sequence[:-1].
+            keep = min(committed, len(sequence) - 1)
+            target_past = self.trim_past(target_past, keep)
+            draft_past = self.draft.trim_past(draft_past, keep)
+
+        elapsed = time.perf_counter() - start
+        acceptance = accepted / proposed if proposed else 0.0
+        logger.info(f"Speculative decoding: {len(tokens)} tokens, acceptance {acceptance:.1%}, "
+                    f"{forwards} target forwards")
+        return {
+            "tokens": tokens,
+            "time_to_first_token_ms": 1000.0 * (first_token_at - start),
+            "tokens_per_second": len(tokens) / elapsed if elapsed > 0 else 0.0,
+            "acceptance_rate": acceptance,
+            "target_forwards": forwards,
+        }
+
+    def generate_text(self,
+                      prompt: str,
+                      max_new_tokens: int = 32,
+                      temperature: float = 0.0,
+                      top_k: int = 0,
+                      num_draft_tokens: int = 0) -> str:
+        """Tokenize a prompt, generate and decode the continuation."""
+        if self.tokenizer is None:
+            raise RuntimeError("No tokenizer found next to the model.")
+        prompt_ids = self.tokenizer(prompt)["input_ids"]
+        result = self.generate(prompt_ids, max_new_tokens, self.tokenizer.eos_token_id, temperature, top_k,
+                               num_draft_tokens=num_draft_tokens)
+        return self.tokenizer.decode(result["tokens"], skip_special_tokens=True)
@@ -0,0 +1,530 @@
+import argparse
+import json
+import logging
+import os
+import queue
+import socketserver
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Dict, List, Any, Callable
+
+import numpy as np
+
+from services.inference_service import InferenceService
+from services.generation_service import GenerationService
+from services.continuous_batching import ContinuousBatcher
+from services.session_pool import SessionPool
+from services.planner_service import planned_batch_size
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class ServerMetrics:
+    """
+    Thread-safe counters for throughput, batch occupancy and queue depth.
+    """
+
+    def __init__(self, window_seconds: float = 60.0):
+        self._lock = threading.Lock()
+        self.window_seconds = window_seconds
+        self.requests_total = 0
+        self.errors_total = 0
+        self.batches_total = 0
+        self.batched_requests_total = 0
+        self.latency_seconds_total = 0.0
+        self.queue_depth = 0
+        self._completions = deque()
+
+    def record_batch(self, size: int, latencies: List[float]):
+        now = time.monotonic()
+        with self._lock:
+            self.batches_total += 1
+            self.batched_requests_total += size
+            self.requests_total += size
+            self.latency_seconds_total += sum(latencies)
+            self._completions.extend([now] * size)
+            self._trim(now)
+
+    def record_error(self, count: int = 1):
+        with self._lock:
+            self.errors_total += count
+
+    def set_queue_depth(self, depth: int):
+        with self._lock:
+            self.queue_depth = depth
+
+    def _trim(self, now: float):
+        cutoff = now - self.window_seconds
+        while self._completions and self._completions[0] < cutoff:
+            self._completions.popleft()
+
+    def snapshot(self) -> Dict[str, float]:
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            return {
+                "requests_total": self.requests_total,
+                "errors_total": self.errors_total,
+                "batches_total": self.batches_total,
+                "avg_batch_size": self.batched_requests_total / self.batches_total if self.batches_total else 0.0,
+                "avg_latency_ms": 1000.0 * self.latency_seconds_total / self.requests_total if self.requests_total else 0.0,
+                "throughput_rps": len(self._completions) / self.window_seconds,
+                "queue_depth": self.queue_depth,
+            }
+
+
+class _PendingRequest:
+    __slots__ = ("feeds", "future", "enqueued", "batch_size", "signature")
+
+    def __init__(self, feeds: Dict[str, np.ndarray]):
+        self.feeds = feeds
+        self.future: Future = Future()
+        self.enqueued = time.monotonic()
+        first = next(iter(feeds.values()))
+        self.batch_size = first.shape[0] if first.ndim else 1
+        # Requests can only be concatenated when everything but the batch axis matches.
+        self.signature = tuple(sorted((k, v.dtype.str, v.shape[1:]) for k, v in feeds.items()))
+
+
+class DynamicBatcher:
+    """
+    Coalesces concurrent requests into one batched run.
+
+    A request waits at most `max_latency_ms` for companions, and a batch is
+    dispatched as soon as it holds `max_batch_size` rows. When requests arrive
+    more slowly than the latency window the batcher dispatches immediately,
+    since waiting would only add latency without growing the batch. With
+    `dispatch_workers` > 1 up to that many batches run concurrently (e.g.
+    on a SessionPool); collection stalls while every worker is busy.
+    """
+
+    def __init__(self,
+                 run_fn: Callable[[Dict[str, np.ndarray]], Dict[str, np.ndarray]],
+                 max_batch_size: int = 8,
+                 max_latency_ms: float = 5.0,
+                 metrics: Optional[ServerMetrics] = None,
+                 dispatch_workers: int = 1):
+        self.run_fn = run_fn
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency_ms / 1000.0
+        self.metrics = metrics or ServerMetrics()
+
+        self._queue: "queue.Queue[Optional[_PendingRequest]]" = queue.Queue()
+        self._carry: Optional[_PendingRequest] = None
+        self._interarrival_ema: Optional[float] = None
+        self._last_arrival: Optional[float] = None
+        self._arrival_lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots = threading.Semaphore(max(1, dispatch_workers))
+        if dispatch_workers > 1:
+            self._executor = ThreadPoolExecutor(dispatch_workers, thread_name_prefix="batch-dispatch")
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, name="dynamic-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, feeds: Dict[str, np.ndarray]) -> Future:
+        request = _PendingRequest(feeds)
+        if not self._running:
+            request.future.set_exception(RuntimeError("server stopped"))
+            return request.future
+        with self._arrival_lock:
+            now = request.enqueued
+            if self._last_arrival is not None:
+                gap = now - self._last_arrival
+                self._interarrival_ema = gap if self._interarrival_ema is None else 0.8 * self._interarrival_ema + 0.2 * gap
+            self._last_arrival = now
+        self._queue.put(request)
+        self.metrics.set_queue_depth(self._queue.qsize())
+        return request.future
+
+    def stop(self):
+        self._running = False
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+        if not self._thread.is_alive():
+            # Requests that raced with the loop's own drain
+            self._fail_pending()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+    def _fail_pending(self):
+        """Fail every request still queued (or carried over) once the loop has exited."""
+        pending = [self._carry] if self._carry is not None else []
+        self._carry = None
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                pending.append(item)
+        for request in pending:
+            if not request.future.done():
+                request.future.set_exception(RuntimeError("server stopped"))
+        self.metrics.set_queue_depth(0)
+
+    def _wait_window(self) -> float:
+        ema = self._interarrival_ema
+        if ema is not None and ema > self.max_latency:
+            return 0.0
+        return self.max_latency
+
+    def _collect(self) -> List[_PendingRequest]:
+        first = self._carry or self._queue.get()
+        self._carry = None
+        if first is None:
+            return []
+
+        batch = [first]
+        rows = first.batch_size
+        deadline = first.enqueued + self._wait_window()
+
+        while rows < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._running = False
+                break
+            if item.signature != first.signature or rows + item.batch_size > self.max_batch_size:
+                # Incompatible shape or overflow: it opens the next batch.
+                self._carry = item
+                break
+            batch.append(item)
+            rows += item.batch_size
+
+        self.metrics.set_queue_depth(self._queue.qsize() + (1 if self._carry else 0))
+        return batch
+
+    def _loop(self):
+        while self._running or self._carry is not None:
+            batch = self._collect()
+            if not batch:
+                continue
+            if self._executor is None:
+                self._dispatch(batch)
+                continue
+            # Keep collecting only while a worker is free, so requests keep coalescing under load
+            self._slots.acquire()
+            self._executor.submit(self._dispatch_and_release, batch)
+        self._fail_pending()
+
+    def _dispatch_and_release(self, batch: List[_PendingRequest]):
+        try:
+            self._dispatch(batch)
+        finally:
+            self._slots.release()
+
+    def _dispatch(self, batch: List[_PendingRequest]):
+        try:
+            if len(batch) == 1:
+                outputs_per_request = [self.run_fn(batch[0].feeds)]
+            else:
+                names = batch[0].feeds.keys()
+                merged = {n: np.concatenate([r.feeds[n] for r in batch], axis=0) for n in names}
+                outputs = self.run_fn(merged)
+                outputs_per_request = self._split(outputs, batch)
+        except Exception as e:
+            logger.exception(f"Batched inference failed: {e}")
+            self.metrics.record_error(len(batch))
+            for r in batch:
+                r.future.set_exception(e)
+            return
+
+        done = time.monotonic()
+        self.metrics.record_batch(len(batch), [done - r.enqueued for r in batch])
+        for r, out in zip(batch, outputs_per_request):
+            r.future.set_result(out)
+
+    @staticmethod
+    def _split(outputs: Dict[str, np.ndarray], batch: List[_PendingRequest]) -> List[Dict[str, np.ndarray]]:
+        total = sum(r.batch_size for r in batch)
+        results = [{} for _ in batch]
+        for name, value in outputs.items():
+            if value.ndim and value.shape[0] == total:
+                offset = 0
+                for i, r in enumerate(batch):
+                    results[i][name] = value[offset:offset + r.batch_size]
+                    offset += r.batch_size
+            else:
+                # Outputs without a batch axis are shared by every request.
+                for res in results:
+                    res[name] = value
+        return results
+
+
+class ModelEndpoint:
+    """
+    An ONNX model served behind its own dynamic batcher.
+
+    Decoders with a KV cache additionally get a continuous batcher for
+    token-by-token generation requests.
+    """
+
+    def __init__(self,
+                 name: str,
+                 model_path: str,
+                 max_batch_size: int,
+                 max_latency_ms: float,
+                 max_cache_tokens: int = 16384,
+                 page_size: int = 16,
+                 prefix_cache_mb: float = 0.0,
+                 sessions: int = 1):
+        self.name = name
+        self.service = InferenceService()
+        self.pool: Optional[SessionPool] = None
+        if sessions > 1:
+            # Batches run concurrently on pooled sessions that share one copy of the weights
+            self.pool = SessionPool(model_path, sessions, health_check_interval=30.0)
+            self.service.use_session(self.pool.primary, model_path, self.pool.profile)
+            run_fn = self.pool.run
+        else:
+            self.service.load(model_path)
+            run_fn = self.service.run
+        self.metrics = ServerMetrics()
+        self.batcher = DynamicBatcher(run_fn, max_batch_size, max_latency_ms, self.metrics, dispatch_workers=sessions)
+        self.input_dtypes = {name: dtype for name, _shape, dtype in self.service.input_specs()}
+
+        self.generator: Optional[GenerationService] = None
+        self.scheduler: Optional[ContinuousBatcher] = None
+        self._generate_lock = threading.Lock()
+        if GenerationService.is_decoder(self.service.session):
+            self.generator = GenerationService()
+            self.generator.attach(self.service)
+            if prefix_cache_mb > 0:
+                self.generator.enable_prefix_cache(int(prefix_cache_mb * 1024 * 1024), page_size)
+            try:
+                self.scheduler = ContinuousBatcher(self.generator, max_batch_size, page_size, max_cache_tokens)
+            except ValueError as e:
+                logger.warning(f"Continuous batching disabled for {name}: {e}")
+
+    def infer(self, inputs: Dict[str, Any], timeout: float = 60.0) -> Dict[str, np.ndarray]:
+        missing = set(self.input_dtypes) - set(inputs)
+        if missing:
+            raise ValueError(f"Missing inputs: {sorted(missing)}")
+        feeds = {n: np.asarray(inputs[n], dtype=self.input_dtypes[n]) for n in self.input_dtypes}
+        return self.batcher.submit(feeds).result(timeout=timeout)
+
+    def generate(self, body: Dict[str, Any], timeout: float = 300.0) -> Dict[str, Any]:
+        if self.generator is None:
+            raise ValueError(f"Model {self.name} does not support generation.")
+        tokenizer = self.generator.tokenizer
+        prompt_ids = body.get("input_ids")
+        if prompt_ids is None:
+            if "prompt" not in body or tokenizer is None:
+                raise ValueError("Expected 'input_ids' (or 'prompt' when a tokenizer is available).")
+            prompt_ids = tokenizer(body["prompt"])["input_ids"]
+        eos = body.get("eos_token_id", tokenizer.eos_token_id if tokenizer is not None else None)
+        args = ([int(t) for t in prompt_ids], int(body.get("max_new_tokens", 32)), eos,
+                float(body.get("temperature", 0.0)), int(body.get("top_k", 0)))
+        if self.scheduler is not None:
+            result = self.scheduler.submit(*args).result(timeout=timeout)
+        else:
+            # Models the scheduler rejects (e.g. fused GroupQueryAttention) decode one request at a time
+            start = time.perf_counter()
+            with self._generate_lock:
+                result = self.generator.generate(*args)
+            result["latency_ms"] = 1000.0 * (time.perf_counter() - start)
+        self.metrics.record_batch(1, [result["latency_ms"] / 1000.0])
+        if tokenizer is not None:
+            result["text"] = tokenizer.decode(result["tokens"], skip_special_tokens=True)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self.metrics.snapshot()
+        if self.scheduler is not None:
+            snapshot["generation"] = self.scheduler.stats()
+        if self.pool is not None:
+            snapshot["session_pool"] = self.pool.stats()
+        return snapshot
+
+    def stop(self):
+        self.batcher.stop()
+        if self.scheduler is not None:
+            self.scheduler.stop()
+        if self.pool is not None:
+            self.pool.close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "ModelForge"
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def _send(self, status: int, body: Any, content_type: str = "application/json"):
+        payload = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        endpoints: Dict[str, ModelEndpoint] = self.server.endpoints
+        if self.path == "/health":
+            self._send(200, {"status": "ok", "models": sorted(endpoints)})
+        elif self.path == "/stats":
+            self._send(200, {name: ep.stats() for name, ep in endpoints.items()})
+        elif self.path == "/metrics":
+            self._send(200, render_prometheus(endpoints).encode("utf-8"), "text/plain; version=0.0.4")
+        else:
+            self._send(404, {"error": f"Unknown path: {self.path}"})
+
+    def do_POST(self):
+        endpoints: Dict[str, ModelEndpoint] = self.server.endpoints
+        # /v1/models/<name>/infer or /v1/models/<name>/generate
+        parts = self.path.strip("/").split("/")
+        if len(parts) != 4 or parts[:2] != ["v1", "models"] or parts[3] not in ("infer", "generate"):
+            self._send(404, {"error": f"Unknown path: {self.path}"})
+            return
+        endpoint = endpoints.get(parts[2])
+        if endpoint is None:
+            self._send(404, {"error": f"Unknown model: {parts[2]}"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if parts[3] == "generate":
+                self._send(200, endpoint.generate(body))
+                return
+            outputs = endpoint.infer(body.get("inputs", {}))
+            self._send(200, {"outputs": {k: v.tolist() for k, v in outputs.items()}})
+        except ValueError as e:
+            self._send(400, {"error": str(e)})
+        except Exception as e:
+            logger.exception(f"Inference request failed: {e}")
+            self._send(500, {"error": str(e)})
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def render_prometheus(endpoints: Dict[str, ModelEndpoint]) -> str:
+    lines = []
+    metric_types = {
+        "requests_total": "counter", "errors_total": "counter", "batches_total": "counter",
+        "avg_batch_size": "gauge", "avg_latency_ms": "gauge", "throughput_rps": "gauge", "queue_depth": "gauge",
+    }
+    snapshots = {name: ep.metrics.snapshot() for name, ep in endpoints.items()}
+    for metric, kind in metric_types.items():
+        lines.append(f"# TYPE modelforge_{metric} {kind}")
+        for name, snap in snapshots.items():
+            lines.append(f'modelforge_{metric}{{model="{name}"}} {snap[metric]}')
+    generation = {name: ep.scheduler.stats() for name, ep in endpoints.items() if ep.scheduler is not None}
+    generation_types = {
+        "decoded_tokens": "counter", "preemptions": "counter", "avg_batch_occupancy": "gauge",
+        "active": "gauge", "waiting": "gauge", "pages_in_use": "gauge",
+    }
+    for metric, kind in generation_types.items():
+        if not generation:
+            break
+        lines.append(f"# TYPE modelforge_generation_{metric} {kind}")
+        for name, snap in generation.items():
+            lines.append(f'modelforge_generation_{metric}{{model="{name}"}} {snap[metric]}')
+    return "\n".join(lines) + "\n"
+
+
+class InferenceServer:
+    """
+    Local HTTP (TCP or Unix socket) inference server for ONNX models.
+
+    Endpoints:
+        POST /v1/models/<name>/infer   {"inputs": {"input_ids": [[...]]}}
+        POST /v1/models/<name>/generate   {"input_ids": [...] | "prompt": "...", "max_new_tokens": 32}
+             (decoders only; requests share decode steps via continuous batching)
+        GET  /health, /stats (JSON), /metrics (Prometheus text)
+    """
+
+    def __init__(self,
+                 models: Dict[str, str],
+                 host: str = "127.0.0.1",
+                 port: int = 8080,
+                 unix_socket: Optional[str] = None,
+                 max_batch_size: Optional[int] = None,
+                 max_latency_ms: float = 5.0,
+                 max_cache_tokens: int = 16384,
+                 prefix_cache_mb: float = 0.0,
+                 sessions: int = 1):
+        if not models:
+            raise ValueError("At least one model is required.")
+        self.endpoints = {
+            # Without an explicit size, use the model's saved batch plan (8 when there is none)
+            name: ModelEndpoint(name, path, max_batch_size or planned_batch_size(path) or 8, max_latency_ms,
+                                max_cache_tokens, prefix_cache_mb=prefix_cache_mb, sessions=sessions)
+            for name, path in models.items()
+        }
+
+        if unix_socket:
+            if os.path.exists(unix_socket):
+                os.remove(unix_socket)
+            self.httpd = _UnixHTTPServer(unix_socket, _Handler)
+            self.address = unix_socket
+        else:
+            self.httpd = ThreadingHTTPServer((host, port), _Handler)
+            self.address = f"http://{host}:{self.httpd.server_address[1]}"
+        self.httpd.endpoints = self.endpoints
+        self._thread: Optional[threading.Thread] = None
+
+    def serve_forever(self):
+        logger.info(f"Serving {sorted(self.endpoints)} on {self.address}")
+        self.httpd.serve_forever()
+
+    def start(self):
+        """Serve in a background thread."""
+        self._thread = threading.Thread(target=self.serve_forever, name="inference-server", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        for ep in self.endpoints.values():
+            ep.stop()
+        logger.info("Inference server stopped")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Serve ONNX models with dynamic batching.")
+    parser.add_argument("--model", action="append", required=True,
+                        help="name=path/to/model.onnx (repeatable)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--unix-socket", default=None)
+    parser.add_argument("--max-batch-size", type=int, default=None,
+                        help="Dynamic batching cap (default: the model's .plan.json recommendation, else 8)")
+    parser.add_argument("--max-latency-ms", type=float, default=5.0)
+    parser.add_argument("--max-cache-tokens", type=int, default=16384,
+                        help="KV page pool size (tokens) for generation on decoder models")
+    parser.add_argument("--prefix-cache-mb", type=float, default=0.0,
+                        help="Reuse prefill KV of shared prompt prefixes, up to this many MB (0 = off)")
+    parser.add_argument("--sessions", type=int, default=1,
+                        help="ORT sessions per model sharing one copy of the weights (batches run concurrently)")
+    args = parser.parse_args(argv)
+
+    models = {}
+    for spec in args.model:
+        name, sep, path = spec.partition("=")
+        if not sep:
+            name, path = os.path.splitext(os.path.basename(spec))[0], spec
+        models[name] = path
+
+    logging.basicConfig(level=logging.INFO)
+    server = InferenceServer(models, args.host, args.port, args.unix_socket,
+                             args.max_batch_size, args.max_latency_ms, args.max_cache_tokens,
+                             args.prefix_cache_mb, args.sessions)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
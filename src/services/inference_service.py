@@ -0,0 +1,366 @@
+import os
+import re
+import json
+import logging
+import platform
+from typing import Optional, Dict, List, Any, Tuple
+
+import numpy as np
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# ONNX Runtime type strings -> NumPy dtypes
+ORT_TO_NUMPY = {
+    "tensor(float)": np.float32,
+    "tensor(float16)": np.float16,
+    "tensor(double)": np.float64,
+    "tensor(int64)": np.int64,
+    "tensor(int32)": np.int32,
+    "tensor(int8)": np.int8,
+    "tensor(uint8)": np.uint8,
+    "tensor(bool)": np.bool_,
+}
+
+# Symbolic dimension names that usually mean "sequence length"
+SEQUENCE_DIM_NAMES = ("sequence", "seq", "length", "tokens")
+
+# Tuned SessionOptions are stored next to the model as <model>.session_profile.json
+SESSION_PROFILE_SUFFIX = ".session_profile.json"
+
+
+def session_profile_path(model_path: str) -> str:
+    return os.path.splitext(model_path)[0] + SESSION_PROFILE_SUFFIX
+
+
+def load_session_profile(model_path: str) -> Optional[Dict[str, Any]]:
+    """Return the saved tuning profile for a model, if it was tuned on a host like this one."""
+    path = session_profile_path(model_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r") as f:
+            profile = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable session profile {path}: {e}")
+        return None
+    tuned_for = profile.get("tuned_for")
+    if tuned_for and (tuned_for.get("machine") != platform.machine() or tuned_for.get("cpu_count") != os.cpu_count()):
+        # Thread counts and graph levels tuned elsewhere can be far off here
+        logger.warning(f"Ignoring session profile {path}: tuned on a different host type "
+                       f"({tuned_for.get('machine')}, {tuned_for.get('cpu_count')} CPUs)")
+        return None
+    return profile
+
+
+def build_session_options(profile: Optional[Dict[str, Any]] = None):
+    """
+    Build onnxruntime.SessionOptions from a profile dict.
+
+    Recognised keys: intra_op_num_threads, inter_op_num_threads,
+    execution_mode ('sequential'/'parallel'), graph_optimization_level
+    ('disable'/'basic'/'extended'/'all') and enable_cpu_mem_arena.
+    """
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    if not profile:
+        return options
+
+    levels = {
+        "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+        "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+        "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+        "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+    }
+    modes = {
+        "sequential": ort.ExecutionMode.ORT_SEQUENTIAL,
+        "parallel": ort.ExecutionMode.ORT_PARALLEL,
+    }
+
+    if profile.get("intra_op_num_threads") is not None:
+        options.intra_op_num_threads = int(profile["intra_op_num_threads"])
+    if profile.get("inter_op_num_threads") is not None:
+        options.inter_op_num_threads = int(profile["inter_op_num_threads"])
+    if profile.get("execution_mode") in modes:
+        options.execution_mode = modes[profile["execution_mode"]]
+    if profile.get("graph_optimization_level") in levels:
+        options.graph_optimization_level = levels[profile["graph_optimization_level"]]
+    if profile.get("enable_cpu_mem_arena") is not None:
+        options.enable_cpu_mem_arena = bool(profile["enable_cpu_mem_arena"])
+    return options
+
+
+def resolve_session_source(model_path: str,
+                           providers: List[str],
+                           profile: Optional[Dict[str, Any]] = None,
+                           use_saved_profile: bool = True,
+                           prefer_optimized: bool = True) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """
+    Pick the file and SessionOptions profile a session for `model_path` should use.
+
+    Returns:
+        (path to load, which may be a pre-optimized artifact; effective profile).
+    """
+    if profile is None and use_saved_profile:
+        profile = load_session_profile(model_path)
+        if profile:
+            logger.info(f"Using tuned session profile for {model_path}")
+
+    session_path = model_path
+    if prefer_optimized:
+        # Imported here: ort_export_service builds on this module.
+        from services.ort_export_service import resolve_optimized_model, LEVEL_ORDER
+        resolved = resolve_optimized_model(model_path, providers)
+        if resolved:
+            session_path, manifest = resolved
+            # Without an explicit level the artifact's own level is the one to honour;
+            # comparing against ORT's default ('all') would re-optimize on every load.
+            requested = (profile or {}).get("graph_optimization_level", manifest["optimization_level"])
+            profile = dict(profile or {})
+            if LEVEL_ORDER.index(manifest["optimization_level"]) >= LEVEL_ORDER.index(requested):
+                # The saved graph already has every requested optimization applied.
+                profile["graph_optimization_level"] = "disable"
+            logger.info(f"Using pre-optimized model: {session_path}")
+    return session_path, profile
+
+
+def parse_input_spec(input_spec: str) -> List[Tuple[Any, List[int]]]:
+    """
+    Parse an input spec in the converter's format, e.g. "int64[1,128],int64[1,128]".
+
+    Returns a list of (numpy dtype, shape) in model input order.
+    """
+    pattern = r"(?:(?P<dtype>\w+))?\[(?P<shape>[0-9,\s]+)\]"
+    matches = list(re.finditer(pattern, input_spec))
+    if not matches:
+        raise ValueError(f"Invalid input spec format: {input_spec}")
+
+    specs = []
+    for m in matches:
+        dtype_name = m.group("dtype") or "float32"
+        if not hasattr(np, dtype_name):
+            raise ValueError(f"Unsupported dtype: {dtype_name}")
+        shape = [int(x.strip()) for x in m.group("shape").split(",")]
+        specs.append((np.dtype(dtype_name).type, shape))
+    return specs
+
+
+def synthetic_feed(specs: List[Tuple[str, List[Any], Any]],
+                   batch_size: int = 1,
+                   seq_len: int = 128) -> Dict[str, np.ndarray]:
+    """Build random inputs for (name, shape, dtype) specs; see InferenceService.build_feed."""
+    feed = {}
+    for name, shape, dtype in specs:
+        dims = []
+        for axis, dim in enumerate(shape):
+            if isinstance(dim, int) and dim > 0:
+                dims.append(dim)
+            elif axis == 0:
+                dims.append(batch_size)
+            elif isinstance(dim, str) and any(s in dim.lower() for s in SEQUENCE_DIM_NAMES):
+                dims.append(seq_len)
+            else:
+                dims.append(1)
+
+        if np.issubdtype(dtype, np.integer):
+            # Masks are all ones; ids are small valid token ids.
+            fill = np.ones(dims, dtype=dtype) if "mask" in name else np.random.randint(0, 100, dims).astype(dtype)
+            feed[name] = fill
+        elif dtype == np.bool_:
+            feed[name] = np.ones(dims, dtype=dtype)
+        else:
+            feed[name] = np.random.randn(*dims).astype(dtype)
+    return feed
+
+
+def load_tokenizer(model_path: str):
+    """Load a Hugging Face tokenizer saved next to an exported model, if present."""
+    model_dir = os.path.dirname(os.path.abspath(model_path))
+    markers = ("tokenizer.json", "tokenizer_config.json", "vocab.txt")
+    if not any(os.path.exists(os.path.join(model_dir, m)) for m in markers):
+        return None
+    try:
+        from transformers import AutoTokenizer
+        return AutoTokenizer.from_pretrained(model_dir)
+    except Exception as e:
+        logger.warning(f"Could not load tokenizer from {model_dir}: {e}")
+        return None
+
+
+class InferenceService:
+    """
+    Service to load ONNX models into onnxruntime sessions and run inference.
+    """
+
+    def __init__(self):
+        self.session = None
+        self.model_path: Optional[str] = None
+        self.profile: Optional[Dict[str, Any]] = None
+        self.tokenizer = None
+        self.bound = None
+
+    def load(self,
+             model_path: str,
+             providers: Optional[List[str]] = None,
+             intra_op_num_threads: int = 0,
+             profile: Optional[Dict[str, Any]] = None,
+             use_saved_profile: bool = True,
+             prefer_optimized: bool = True,
+             enable_profiling: bool = False) -> bool:
+        """
+        Load an ONNX model into an inference session.
+
+        Args:
+            model_path: Path to the .onnx model.
+            providers: Execution providers (defaults to CPUExecutionProvider).
+            intra_op_num_threads: Threads per operator (0 keeps the profile/ORT default).
+            profile: Explicit SessionOptions profile (see build_session_options).
+            use_saved_profile: Pick up a tuned <model>.session_profile.json when no profile is given.
+            prefer_optimized: Load a compatible pre-optimized artifact (see OptimizedModelExporter)
+                instead of re-optimizing the graph at session creation.
+            enable_profiling: Turn on ORT's per-operator profiler (see end_profiling()).
+
+        Returns:
+            True if the model was loaded.
+        """
+        if not os.path.exists(model_path):
+            logger.error(f"Model file not found: {model_path}")
+            raise FileNotFoundError(f"Model file not found: {model_path}")
+
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            logger.error("onnxruntime is not installed.")
+            raise ImportError("onnxruntime dependency missing.")
+
+        providers = providers or ["CPUExecutionProvider"]
+        session_path, profile = resolve_session_source(model_path, providers, profile, use_saved_profile,
+                                                       prefer_optimized)
+        options = build_session_options(profile)
+        if intra_op_num_threads:
+            options.intra_op_num_threads = intra_op_num_threads
+        if enable_profiling:
+            options.enable_profiling = True
+            options.profile_file_prefix = os.path.splitext(model_path)[0] + ".ort_profile"
+
+        self.session = ort.InferenceSession(
+            session_path,
+            sess_options=options,
+            providers=providers,
+        )
+        self.model_path = model_path
+        self.profile = profile
+        self.tokenizer = load_tokenizer(model_path)
+        self.bound = None
+        logger.info(f"Loaded ONNX model: {model_path}")
+        return True
+
+    def use_session(self, session, model_path: str, profile: Optional[Dict[str, Any]] = None):
+        """Adopt a session created elsewhere (e.g. by a SessionPool)."""
+        self.session = session
+        self.model_path = model_path
+        self.profile = profile
+        self.tokenizer = load_tokenizer(model_path)
+        self.bound = None
+
+    def _require_session(self):
+        if self.session is None:
+            raise RuntimeError("No model loaded. Call load() first.")
+        return self.session
+
+    def input_specs(self) -> List[Tuple[str, List[Any], Any]]:
+        """Return (name, shape, numpy dtype) for every model input."""
+        session = self._require_session()
+        return [(i.name, list(i.shape), ORT_TO_NUMPY.get(i.type, np.float32)) for i in session.get_inputs()]
+
+    def output_names(self) -> List[str]:
+        return [o.name for o in self._require_session().get_outputs()]
+
+    def run(self, feeds: Dict[str, np.ndarray], output_names: Optional[List[str]] = None) -> Dict[str, np.ndarray]:
+        """
+        Run the model.
+
+        Args:
+            feeds: Mapping of input name to array.
+            output_names: Subset of outputs to fetch (all by default).
+
+        Returns:
+            Mapping of output name to array.
+        """
+        session = self._require_session()
+        names = output_names or self.output_names()
+        outputs = session.run(names, feeds)
+        return dict(zip(names, outputs))
+
+    def end_profiling(self) -> str:
+        """Stop ORT profiling and return the path of the JSON trace."""
+        return self._require_session().end_profiling()
+
+    def run_bound(self, feeds: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """
+        Run the model through IOBinding with reusable per-bucket buffers.
+
+        Returned arrays are views that are overwritten by the next call; copy
+        them if they must be kept.
+        """
+        if self.bound is None:
+            from services.iobinding_service import BoundSession
+            self.bound = BoundSession(self._require_session())
+        return self.bound.run(feeds)
+
+    def feeds_from_text(self, text: str) -> Dict[str, np.ndarray]:
+        """
+        Build model inputs from user text.
+
+        With a tokenizer next to the model the text is tokenized; otherwise it
+        must be JSON: either {"input_name": [...]} or a bare list for the first input.
+        """
+        specs = self.input_specs()
+        feeds = {}
+
+        if self.tokenizer is not None:
+            encoded = self.tokenizer([text], return_tensors="np")
+            seq_len = encoded["input_ids"].shape[1]
+            for name, _shape, dtype in specs:
+                if name in encoded:
+                    feeds[name] = encoded[name].astype(dtype)
+                elif name == "token_type_ids":
+                    feeds[name] = np.zeros((1, seq_len), dtype=dtype)
+                elif name == "position_ids":
+                    feeds[name] = np.arange(seq_len, dtype=dtype)[None, :]
+                else:
+                    raise ValueError(f"Cannot derive input '{name}' from text")
+            return feeds
+
+        try:
+            data = json.loads(text)
+        except ValueError:
+            raise ValueError("No tokenizer found next to the model; enter inputs as JSON.")
+        if isinstance(data, list):
+            data = {specs[0][0]: data}
+        for name, _shape, dtype in specs:
+            if name not in data:
+                raise ValueError(f"Missing input '{name}'")
+            feeds[name] = np.asarray(data[name], dtype=dtype)
+        return feeds
+
+    def build_feed(self,
+                   batch_size: int = 1,
+                   seq_len: int = 128,
+                   input_spec: Optional[str] = None) -> Dict[str, np.ndarray]:
+        """
+        Build a synthetic feed matching the model inputs.
+
+        Symbolic dimensions are resolved as batch (first axis), sequence length
+        (names containing 'seq'/'length') or 1 otherwise. An explicit input_spec
+        (e.g. "int64[8,128],int64[8,128]") overrides shapes and dtypes in input order.
+        """
+        specs = self.input_specs()
+        if input_spec:
+            parsed = parse_input_spec(input_spec)
+            if len(parsed) != len(specs):
+                raise ValueError(f"Input spec has {len(parsed)} entries, model has {len(specs)} inputs")
+            specs = [(name, shape, dtype) for (name, _s, _d), (dtype, shape) in zip(specs, parsed)]
+
+        return synthetic_feed(specs, batch_size, seq_len)
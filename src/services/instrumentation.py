@@ -0,0 +1,200 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Optional, Dict, List, Any, Callable
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+Event = Dict[str, Any]
+Sink = Callable[[Event], None]
+
+
+def current_rss_bytes() -> Optional[int]:
+    """Resident set size of this process, or None when it cannot be read."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return None
+
+
+class RssSampler:
+    """
+    Tracks the peak RSS reached while it runs by polling on a background thread.
+
+    ru_maxrss and VmHWM are lifetime high-water marks, so they cannot tell
+    how much a stage itself peaked once an earlier stage went higher.
+    Short spikes between two samples are missed; the interval bounds that.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.peak = current_rss_bytes()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        if self.peak is not None:
+            self._thread = threading.Thread(target=self._run, args=(interval,), name="rss-sampler", daemon=True)
+            self._thread.start()
+
+    def _sample(self):
+        rss = current_rss_bytes()
+        if rss is not None and rss > self.peak:
+            self.peak = rss
+
+    def _run(self, interval: float):
+        while not self._stop.wait(interval):
+            self._sample()
+
+    def stop(self) -> Optional[int]:
+        """Stop sampling and return the peak RSS in bytes (None when RSS is unreadable)."""
+        if self._thread is None:
+            return None
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        return self.peak
+
+
+def _mb(value: Optional[int]) -> Optional[float]:
+    return round(value / (1024 * 1024), 1) if value is not None else None
+
+
+class Tracer:
+    """
+    Emits structured stage events (timed spans with RSS and peak-RSS deltas).
+
+    Sinks are plain callables receiving event dicts, so the same stream can
+    drive UI status labels, a JSON-lines trace file and CLI output.
+    """
+
+    def __init__(self):
+        self._sinks: List[Sink] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def subscribe(self, sink: Sink) -> Callable[[], None]:
+        """Register a sink; returns a function that unregisters it."""
+        with self._lock:
+            self._sinks.append(sink)
+
+        def unsubscribe():
+            with self._lock:
+                if sink in self._sinks:
+                    self._sinks.remove(sink)
+        return unsubscribe
+
+    def emit(self, event: Event):
+        event.setdefault("ts", time.time())
+        with self._lock:
+            sinks = list(self._sinks)
+        for sink in sinks:
+            try:
+                sink(event)
+            except Exception as e:
+                logger.warning(f"Trace sink failed: {e}")
+
+    def _stack(self) -> List[Event]:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextmanager
+    def span(self, stage: str, **attrs):
+        """
+        Time a pipeline stage.
+
+        Emits a `start` event, then an `end` event carrying duration_ms,
+        rss_mb, rss_delta_mb, peak_rss_mb, peak_delta_mb and status. The
+        peak is the highest RSS sampled during this span (see RssSampler).
+        Nested spans share the run_id of the outermost span.
+        """
+        stack = self._stack()
+        parent = stack[-1] if stack else None
+        context = {
+            "stage": stage,
+            "run_id": parent["run_id"] if parent else uuid.uuid4().hex[:12],
+            "parent": parent["stage"] if parent else None,
+            **attrs,
+        }
+        stack.append(context)
+
+        rss_before = current_rss_bytes()
+        sampler = RssSampler()
+        start = time.perf_counter()
+        self.emit({"event": "start", **context})
+        status, error = "ok", None
+        try:
+            yield context
+        except Exception as e:
+            status, error = "error", str(e)
+            raise
+        finally:
+            stack.pop()
+            rss_after, peak_after = current_rss_bytes(), sampler.stop()
+            end = {
+                "event": "end",
+                **context,
+                "status": status,
+                "duration_ms": round(1000.0 * (time.perf_counter() - start), 2),
+                "rss_mb": _mb(rss_after),
+                "rss_delta_mb": _mb(rss_after - rss_before) if rss_after is not None and rss_before is not None else None,
+                "peak_rss_mb": _mb(peak_after),
+                "peak_delta_mb": _mb(peak_after - rss_before) if peak_after is not None and rss_before is not None else None,
+            }
+            if error:
+                end["error"] = error
+            self.emit(end)
+
+
+# Process-wide tracer used by the services
+tracer = Tracer()
+
+
+class JsonLinesSink:
+    """Appends every event as one JSON line to a trace file."""
+
+    def __init__(self, path: str):
+        trace_dir = os.path.dirname(path)
+        if trace_dir:
+            os.makedirs(trace_dir, exist_ok=True)
+        self._file = open(path, "a", buffering=1)
+        self._lock = threading.Lock()
+
+    def __call__(self, event: Event):
+        with self._lock:
+            self._file.write(json.dumps(event, default=str) + "\n")
+
+    def close(self):
+        self._file.close()
+
+
+def format_event(event: Event) -> str:
+    """One-line human readable rendering of an event (CLI and status labels)."""
+    stage = event.get("stage", "?")
+    if event.get("event") == "start":
+        return f"{stage}..."
+    if event.get("event") == "end":
+        text = f"{stage} {event['status']} in {event['duration_ms'] / 1000:.2f}s"
+        if event.get("peak_delta_mb") is not None:
+            text += f" (RSS {event['rss_mb']} MB, peak +{event['peak_delta_mb']} MB)"
+        if event.get("error"):
+            text += f": {event['error']}"
+        return text
+    return f"{stage}: {event.get('message', '')}"
+
+
+def console_sink(event: Event):
+    """Print span completions (and failures) to stderr."""
+    if event.get("event") != "start":
+        indent = "  " if event.get("parent") else ""
+        print(f"[trace] {indent}{format_event(event)}", file=sys.stderr)
@@ -0,0 +1,170 @@
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, List, Tuple, Sequence
+
+import numpy as np
+
+from services.inference_service import ORT_TO_NUMPY, SEQUENCE_DIM_NAMES
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Default batch buckets; larger batches fall back to their exact size.
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+class _Bucket:
+    """Preallocated buffers and a bound IOBinding for one (batch, seq-len) bucket."""
+
+    def __init__(self, binding, inputs: Dict[str, np.ndarray]):
+        self.binding = binding
+        self.inputs = inputs
+        self.outputs: Optional[Dict[str, np.ndarray]] = None
+
+
+class BoundSession:
+    """
+    Runs an onnxruntime session through IOBinding with reusable NumPy buffers.
+
+    Inputs are padded up to a (batch, seq-len) bucket and copied into buffers
+    that stay bound to the session, and outputs are written by ORT straight
+    into preallocated arrays. After the first call in a bucket, a run does no
+    allocation beyond the copy of the caller's inputs.
+
+    Sequence padding is only applied when the model takes an attention mask;
+    otherwise inputs are bucketed on batch size alone. The batch is only padded
+    when every input's batch dim is symbolic. Not safe for concurrent
+    use from several threads (calls are serialized by a lock).
+    """
+
+    def __init__(self,
+                 session,
+                 batch_buckets: Sequence[int] = BATCH_BUCKETS,
+                 seq_bucket: int = 32,
+                 max_buckets: int = 16):
+        self.session = session
+        self.batch_buckets = sorted(batch_buckets)
+        self.max_buckets = max_buckets
+        self.inputs = [(i.name, list(i.shape), ORT_TO_NUMPY.get(i.type, np.float32)) for i in session.get_inputs()]
+        self.outputs = [(o.name, list(o.shape)) for o in session.get_outputs()]
+
+        has_mask = any("mask" in name for name, _s, _d in self.inputs)
+        self.seq_bucket = seq_bucket if has_mask else 1
+        self.seq_axes = {name: self._seq_axis(shape) for name, shape, _d in self.inputs}
+        # ORT rejects a padded batch when any input declares a fixed batch dim
+        self.pad_batch = all(shape and not isinstance(shape[0], int) for _n, shape, _d in self.inputs)
+
+        self._buckets: "OrderedDict[Tuple, _Bucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _seq_axis(shape: List) -> Optional[int]:
+        for axis, dim in enumerate(shape):
+            if axis > 0 and isinstance(dim, str) and any(s in dim.lower() for s in SEQUENCE_DIM_NAMES):
+                return axis
+        return None
+
+    def _bucket_key(self, feeds: Dict[str, np.ndarray]) -> Tuple[int, int, int, int]:
+        first = feeds[self.inputs[0][0]]
+        batch = first.shape[0] if first.ndim else 1
+        seq = 0
+        for name, axis in self.seq_axes.items():
+            if axis is not None and name in feeds:
+                seq = feeds[name].shape[axis]
+                break
+
+        padded_batch = next((b for b in self.batch_buckets if b >= batch), batch) if self.pad_batch else batch
+        padded_seq = -(-seq // self.seq_bucket) * self.seq_bucket if seq else 0
+        return batch, seq, padded_batch, padded_seq
+
+    def _create_bucket(self, feeds, padded_batch, padded_seq) -> _Bucket:
+        binding = self.session.io_binding()
+        buffers = {}
+        for name, _shape, dtype in self.inputs:
+            shape = list(feeds[name].shape)
+            if shape:
+                shape[0] = padded_batch
+            axis = self.seq_axes[name]
+            if axis is not None and padded_seq:
+                shape[axis] = padded_seq
+            buf = np.zeros(shape, dtype=dtype)
+            binding.bind_input(name, "cpu", 0, buf.dtype, buf.shape, buf.ctypes.data)
+            buffers[name] = buf
+        for name, _shape in self.outputs:
+            # First run lets ORT allocate so we learn the output shapes.
+            binding.bind_output(name, "cpu")
+        return _Bucket(binding, buffers)
+
+    def _shape_key(self, feeds, padded_seq) -> Tuple:
+        # Non-batch dims of every input, with the sequence axis at its padded length.
+        # Without this, models lacking a recognised sequence axis (or with other
+        # dynamic dims) would share one bucket across differently shaped inputs.
+        shapes = []
+        for name, _shape, _dtype in self.inputs:
+            shape = list(feeds[name].shape)
+            axis = self.seq_axes[name]
+            if axis is not None and padded_seq:
+                shape[axis] = padded_seq
+            shapes.append(tuple(shape[1:]))
+        return tuple(shapes)
+
+    def _get_bucket(self, feeds, padded_batch, padded_seq) -> _Bucket:
+        key = (padded_batch, padded_seq, self._shape_key(feeds, padded_seq))
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._create_bucket(feeds, padded_batch, padded_seq)
+            self._buckets[key] = bucket
+            if len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def run(self, feeds: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """
+        Run the model on `feeds`.
+
+        Returns views into the bucket's output buffers, trimmed to the real
+        batch and sequence length. They are overwritten by the next call in the
+        same bucket; copy them if they must outlive it.
+        """
+        with self._lock:
+            batch, seq, padded_batch, padded_seq = self._bucket_key(feeds)
+            bucket = self._get_bucket(feeds, padded_batch, padded_seq)
+
+            for name, buf in bucket.inputs.items():
+                value = feeds[name]
+                if value.shape != buf.shape:
+                    buf.fill(0)  # padded rows/positions are masked out
+                    buf[tuple(slice(0, d) for d in value.shape)] = value
+                else:
+                    np.copyto(buf, value, casting="unsafe")
+
+            self.session.run_with_iobinding(bucket.binding)
+
+            if bucket.outputs is None:
+                first = bucket.binding.copy_outputs_to_cpu()
+                bucket.binding.clear_binding_outputs()
+                bucket.outputs = {}
+                for (name, _shape), value in zip(self.outputs, first):
+                    buf = np.empty_like(value)
+                    np.copyto(buf, value)
+                    bucket.binding.bind_output(name, "cpu", 0, buf.dtype, buf.shape, buf.ctypes.data)
+                    bucket.outputs[name] = buf
+
+            return {name: self._trim(buf, declared, batch, seq, padded_batch, padded_seq)
+                    for (name, declared), buf in zip(self.outputs, bucket.outputs.values())}
+
+    @staticmethod
+    def _trim(buf, declared, batch, seq, padded_batch, padded_seq) -> np.ndarray:
+        slices = []
+        for axis, dim in enumerate(buf.shape):
+            symbolic = axis >= len(declared) or not isinstance(declared[axis], int)
+            if axis == 0 and dim == padded_batch and batch != padded_batch:
+                slices.append(slice(0, batch))
+            elif axis > 0 and symbolic and padded_seq and dim == padded_seq and seq != padded_seq:
+                slices.append(slice(0, seq))
+            else:
+                slices.append(slice(None))
+        return buf[tuple(slices)]
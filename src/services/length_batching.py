@@ -0,0 +1,137 @@
+import logging
+from typing import Optional, Dict, List, Any, Callable
+
+import numpy as np
+
+from services.inference_service import InferenceService
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class LengthBucketBatcher:
+    """
+    Batches encoder inputs by token length instead of arrival order.
+
+    Texts are tokenized once without padding, sorted by length and cut into
+    batches of similar lengths; each batch is padded only to its longest
+    member rounded up to `pad_multiple`, then results are scattered back
+    to the original order. Encoders are position-independent across the
+    batch, so outputs are identical to padding everything to max_length.
+    """
+
+    def __init__(self,
+                 inference: InferenceService,
+                 max_length: int = 512,
+                 batch_size: int = 32,
+                 max_batch_tokens: Optional[int] = None,
+                 pad_multiple: int = 8):
+        """
+        Args:
+            inference: Loaded InferenceService with a tokenizer.
+            max_length: Truncation length.
+            batch_size: Maximum texts per run.
+            max_batch_tokens: Optional cap on batch_size * padded_length, so short
+                texts form large batches and long texts small ones.
+            pad_multiple: Round padded lengths up to this multiple (keeps the number of
+                distinct shapes small for ORT's allocator and kernel caches).
+        """
+        self.inference = inference
+        self.max_length = max_length
+        self.batch_size = batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.pad_multiple = max(1, pad_multiple)
+        self.last_stats: Dict[str, Any] = {}
+
+    def _padded_length(self, length: int) -> int:
+        padded = -(-length // self.pad_multiple) * self.pad_multiple
+        return max(1, min(padded, self.max_length))
+
+    def plan(self, lengths: List[int]) -> List[List[int]]:
+        """Group indices into length-sorted batches."""
+        order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+        batches: List[List[int]] = []
+        current: List[int] = []
+        for i in order:
+            if current:
+                # Sorted ascending, so the newest member sets the padded length
+                padded = self._padded_length(lengths[i])
+                too_many = len(current) >= self.batch_size
+                too_big = self.max_batch_tokens and (len(current) + 1) * padded > self.max_batch_tokens
+                if too_many or too_big:
+                    batches.append(current)
+                    current = []
+            current.append(i)
+        if current:
+            batches.append(current)
+        return batches
+
+    def _feeds(self, encoded: Dict[str, List[List[int]]], indices: List[int], length: int) -> Dict[str, np.ndarray]:
+        tokenizer = self.inference.tokenizer
+        pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else 0
+        left = getattr(tokenizer, "padding_side", "right") == "left"
+
+        feeds = {}
+        for name, _shape, dtype in self.inference.input_specs():
+            fill = pad_id if name == "input_ids" else 0
+            array = np.full((len(indices), length), fill, dtype=dtype)
+            if name in encoded:
+                for row, i in enumerate(indices):
+                    values = encoded[name][i]
+                    if left:
+                        array[row, length - len(values):] = values
+                    else:
+                        array[row, :len(values)] = values
+            elif name != "token_type_ids":
+                raise ValueError(f"Cannot derive input '{name}' from text")
+            feeds[name] = array
+        return feeds
+
+    def run(self,
+            texts: List[str],
+            postprocess: Callable[[Dict[str, np.ndarray], np.ndarray], np.ndarray]) -> np.ndarray:
+        """
+        Encode texts in length-bucketed batches.
+
+        Args:
+            texts: Input texts.
+            postprocess: (outputs, attention_mask) -> [batch, ...] per-text results,
+                e.g. pooling for embeddings or softmax for classification.
+
+        Returns:
+            Results stacked in the original text order.
+        """
+        tokenizer = self.inference.tokenizer
+        if tokenizer is None:
+            raise RuntimeError("Length bucketing needs a tokenizer next to the model.")
+        if not texts:
+            return np.zeros((0,), dtype=np.float32)
+
+        encoded = tokenizer(list(texts), truncation=True, max_length=self.max_length)
+        lengths = [len(ids) for ids in encoded["input_ids"]]
+        results: List[Optional[np.ndarray]] = [None] * len(texts)
+        padded_tokens = 0
+
+        batches = self.plan(lengths)
+        for indices in batches:
+            length = self._padded_length(max(lengths[i] for i in indices))
+            feeds = self._feeds(encoded, indices, length)
+            outputs = self.inference.run(feeds)
+            mask = feeds.get("attention_mask")
+            if mask is None:
+                mask = (np.arange(length)[None, :] < np.array([lengths[i] for i in indices])[:, None]).astype(np.int64)
+            for row, value in zip(indices, postprocess(outputs, mask)):
+                results[row] = value
+            padded_tokens += len(indices) * length
+
+        real_tokens = sum(lengths)
+        self.last_stats = {
+            "texts": len(texts),
+            "batches": len(batches),
+            "real_tokens": real_tokens,
+            "padded_tokens": padded_tokens,
+            "padding_efficiency": real_tokens / padded_tokens if padded_tokens else 1.0,
+        }
+        logger.debug(f"Length-bucketed {len(texts)} texts into {len(batches)} batches "
+                     f"({self.last_stats['padding_efficiency']:.0%} of computed tokens are real)")
+        return np.stack(results)
@@ -0,0 +1,148 @@
+import json
+import logging
+import os
+import time
+from typing import Optional, Dict, List, Any, Tuple
+
+from services.inference_service import build_session_options
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Artifacts written next to <model>.onnx
+OPTIMIZED_SUFFIX = ".optimized.onnx"
+ORT_FORMAT_SUFFIX = ".ort"
+MANIFEST_SUFFIX = ".optimized.json"
+
+# Ordering used to decide whether a saved graph already covers a requested level
+LEVEL_ORDER = ["disable", "basic", "extended", "all"]
+
+
+def manifest_path(model_path: str) -> str:
+    return os.path.splitext(model_path)[0] + MANIFEST_SUFFIX
+
+
+def _source_fingerprint(model_path: str) -> Dict[str, Any]:
+    # Size + mtime is enough to detect a re-export and, unlike hashing,
+    # costs nothing on the cold-start path this cache exists to speed up.
+    stat = os.stat(model_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def resolve_optimized_model(model_path: str,
+                            providers: Optional[List[str]] = None) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """
+    Return (artifact path, manifest) of a compatible pre-optimized model, or None.
+
+    A saved artifact is compatible when it was built from the current source file
+    by the installed onnxruntime version for the same execution providers.
+    """
+    path = manifest_path(model_path)
+    if not os.path.exists(path) or not os.path.exists(model_path):
+        return None
+
+    try:
+        import onnxruntime as ort
+        with open(path, "r") as f:
+            manifest = json.load(f)
+    except (ImportError, OSError, ValueError) as e:
+        logger.warning(f"Ignoring pre-optimized manifest {path}: {e}")
+        return None
+
+    providers = providers or ["CPUExecutionProvider"]
+    if manifest.get("ort_version") != ort.__version__:
+        logger.info(f"Pre-optimized model built with onnxruntime {manifest.get('ort_version')}, have {ort.__version__}")
+        return None
+    if manifest.get("providers") != providers:
+        logger.info(f"Pre-optimized model built for {manifest.get('providers')}, requested {providers}")
+        return None
+    if manifest.get("source") != _source_fingerprint(model_path):
+        logger.info(f"Source model changed since pre-optimization: {model_path}")
+        return None
+
+    base_dir = os.path.dirname(path)
+    artifacts = manifest.get("artifacts", {})
+    # The flatbuffer format loads fastest; fall back to the optimized ONNX graph.
+    for key in ("ort", "onnx"):
+        if artifacts.get(key):
+            candidate = os.path.join(base_dir, artifacts[key])
+            if os.path.exists(candidate):
+                return candidate, manifest
+    return None
+
+
+class OptimizedModelExporter:
+    """
+    Service to serialize onnxruntime's fully optimized graph for fast cold start.
+    """
+
+    def export(self,
+               model_path: str,
+               providers: Optional[List[str]] = None,
+               optimization_level: str = "extended",
+               save_ort_format: bool = False) -> Dict[str, Any]:
+        """
+        Save the optimized graph (and optionally the ORT flatbuffer format) next to the model.
+
+        Args:
+            model_path: Path to the .onnx model (converted or quantized).
+            providers: Execution providers the artifact is optimized for.
+            optimization_level: 'basic', 'extended' or 'all'. 'all' adds layout
+                transforms tied to this host's CPU features; 'extended' is portable.
+            save_ort_format: Also write a .ort flatbuffer model.
+
+        Returns:
+            The manifest describing the saved artifacts.
+        """
+        if not os.path.exists(model_path):
+            logger.error(f"Model file not found: {model_path}")
+            raise FileNotFoundError(f"Model file not found: {model_path}")
+        if optimization_level not in LEVEL_ORDER[1:]:
+            raise ValueError(f"Unknown optimization level: {optimization_level}")
+
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            logger.error("onnxruntime is not installed.")
+            raise ImportError("onnxruntime dependency missing.")
+
+        providers = providers or ["CPUExecutionProvider"]
+        stem = os.path.splitext(model_path)[0]
+        artifacts = {}
+
+        onnx_path = stem + OPTIMIZED_SUFFIX
+        self._save(ort, model_path, onnx_path, providers, optimization_level, "ONNX")
+        artifacts["onnx"] = os.path.basename(onnx_path)
+
+        if save_ort_format:
+            ort_path = stem + ORT_FORMAT_SUFFIX
+            self._save(ort, model_path, ort_path, providers, optimization_level, "ORT")
+            artifacts["ort"] = os.path.basename(ort_path)
+
+        manifest = {
+            "source": _source_fingerprint(model_path),
+            "source_name": os.path.basename(model_path),
+            "ort_version": ort.__version__,
+            "providers": providers,
+            "optimization_level": optimization_level,
+            "artifacts": artifacts,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        with open(manifest_path(model_path), "w") as f:
+            json.dump(manifest, f, indent=2)
+
+        logger.info(f"Saved pre-optimized artifacts for {model_path}: {artifacts}")
+        return manifest
+
+    def _save(self, ort, model_path, output_path, providers, level, model_format):
+        options = build_session_options({"graph_optimization_level": level})
+        options.optimized_model_filepath = output_path
+        if model_format == "ORT":
+            options.add_session_config_entry("session.save_model_format", "ORT")
+
+        start = time.perf_counter()
+        ort.InferenceSession(model_path, sess_options=options, providers=providers)
+        logger.info(f"Optimized {model_format} model written in {time.perf_counter() - start:.2f}s: {output_path}")
+
+        if not os.path.isfile(output_path):
+            raise RuntimeError(f"onnxruntime did not write the optimized model: {output_path}")
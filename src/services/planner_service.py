@@ -0,0 +1,307 @@
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import queue
+import time
+from typing import Optional, Dict, List, Any, Tuple
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+PLAN_MODES = ("inference", "training")
+
+# Batch size plans are stored next to the model as <model>.plan.json
+PLAN_SUFFIX = ".plan.json"
+
+
+def plan_path(model_path: str) -> str:
+    return os.path.splitext(model_path)[0] + PLAN_SUFFIX
+
+
+def _host_info() -> Dict[str, Any]:
+    return {
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "memory_mb": int(os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / (1024 * 1024)),
+    }
+
+
+def available_memory_mb() -> float:
+    """MemAvailable from /proc/meminfo, or total physical memory elsewhere."""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return float(_host_info()["memory_mb"])
+
+
+def load_plan(model_path: str) -> Optional[Dict[str, Any]]:
+    """Return the saved plan for a model if it was made on a host like this one."""
+    path = plan_path(model_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            plan = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable batch plan {path}: {e}")
+        return None
+    host, here = plan.get("host", {}), _host_info()
+    if host.get("machine") != here["machine"] or host.get("cpu_count") != here["cpu_count"]:
+        # Throughput and memory curves do not transfer between host types
+        logger.warning(f"Ignoring batch plan {path}: made on a different host type ({host})")
+        return None
+    return plan
+
+
+def planned_batch_size(model_path: str, mode: str = "inference", seq_len: Optional[int] = None) -> Optional[int]:
+    """
+    Recommended batch size from the model's saved plan, if any.
+
+    With several planned sequence lengths the smallest one >= seq_len is
+    used (memory grows with length), falling back to the longest planned.
+    An unknown seq_len also uses the longest, the plan safe for any input.
+    """
+    plan = load_plan(model_path)
+    entries = (plan or {}).get(mode, {}).get("seq_lens", {})
+    if not entries:
+        return None
+    lengths = sorted(int(k) for k in entries)
+    if seq_len is None:
+        chosen = lengths[-1]
+    else:
+        chosen = next((n for n in lengths if n >= seq_len), lengths[-1])
+    return entries[str(chosen)].get("recommended_batch_size")
+
+
+def _batched_inputs(sample: Tuple[Any, ...], batch_size: int, seq_len: int):
+    """Resize example PyTorch inputs to [batch, seq, ...] (seq only for integer token inputs)."""
+    import torch
+    resized = []
+    for t in sample:
+        shape = list(t.shape)
+        if shape:
+            shape[0] = batch_size
+        if len(shape) >= 2 and not t.is_floating_point():
+            shape[1] = seq_len
+            resized.append(torch.randint(0, 100, shape, dtype=t.dtype))
+        else:
+            resized.append(torch.randn(shape, dtype=t.dtype) if t.is_floating_point() else torch.zeros(shape, dtype=t.dtype))
+    return tuple(resized)
+
+
+def _probe(task: Dict[str, Any], results) -> None:
+    """Run one (batch, seq_len) point in a fresh process and report peak RSS and throughput."""
+    import resource
+
+    try:
+        batch, seq_len = task["batch_size"], task["seq_len"]
+        if task["model_path"].endswith(".onnx"):
+            from services.inference_service import InferenceService, parse_input_spec, synthetic_feed
+            service = InferenceService()
+            service.load(task["model_path"])
+            specs = service.input_specs()
+            if task.get("input_spec"):
+                parsed = parse_input_spec(task["input_spec"])
+                specs = [(name, [batch] + shape[1:], dtype) for (name, _s, _d), (dtype, shape) in zip(specs, parsed)]
+            feed = synthetic_feed(specs, batch, seq_len)
+
+            def step():
+                service.run(feed)
+        else:
+            import torch
+            from services.convert_service import ConvertOnnxModel
+            from services.prune_service import PruneModel
+            converter = ConvertOnnxModel()
+            model = converter._load_pytorch_model(task["model_path"])
+            model.eval()
+            inputs = _batched_inputs(converter.prepare_dummy_input(model, task.get("input_spec")), batch, seq_len)
+            if task["mode"] == "training":
+                model.train()
+                optimizer = torch.optim.AdamW([p for p in model.parameters() if p.requires_grad], lr=1e-5)
+
+                def step():
+                    loss = PruneModel._primary_output(model(*inputs)).float().pow(2).mean()
+                    optimizer.zero_grad()
+                    loss.backward()
+                    optimizer.step()
+            else:
+                def step():
+                    with torch.no_grad():
+                        model(*inputs)
+
+        step()
+        start = time.perf_counter()
+        for _ in range(task["iterations"]):
+            step()
+        elapsed = time.perf_counter() - start
+        # ru_maxrss is in KiB on Linux
+        peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+        results.put({"ok": True, "peak_rss_mb": peak_mb,
+                     "throughput": batch * task["iterations"] / elapsed if elapsed > 0 else 0.0,
+                     "latency_ms": 1000.0 * elapsed / task["iterations"]})
+    except Exception as e:
+        results.put({"ok": False, "error": str(e)})
+
+
+class BatchPlanner:
+    """
+    Service to find the best batch size for a model under a memory budget.
+
+    Every (batch, sequence length) point runs in a fresh spawned process,
+    so its peak RSS is measured in isolation and an out-of-memory probe
+    cannot take the caller down; probes whose resident memory passes the
+    budget are killed early. Batch sizes grow geometrically until a probe
+    fails or exceeds the budget, then a binary search pins the largest
+    batch that fits. The recommendation is the smallest batch reaching
+    `throughput_tolerance` of the best measured throughput, which keeps
+    latency down once throughput has saturated.
+    """
+
+    def plan(self,
+             model_path: str,
+             mode: str = "inference",
+             memory_budget_mb: Optional[float] = None,
+             seq_lens: Optional[List[int]] = None,
+             input_spec: Optional[str] = None,
+             max_batch_size: int = 1024,
+             iterations: int = 5,
+             throughput_tolerance: float = 0.95,
+             probe_timeout: float = 600.0,
+             save: bool = True) -> Dict[str, Any]:
+        """
+        Probe batch sizes and recommend one per sequence length.
+
+        Args:
+            model_path: .onnx model (inference) or PyTorch model (inference or training).
+            mode: 'inference' or 'training' (forward + backward + AdamW step).
+            memory_budget_mb: Peak RSS allowed per process (default: 80% of available memory).
+            seq_lens: Sequence lengths to plan for symbolic sequence dimensions (default [128]).
+            input_spec: Explicit input spec / shapes; the batch axis is searched, the sequence
+                axis of PyTorch token inputs follows seq_lens.
+            max_batch_size: Upper bound of the search.
+            iterations: Timed steps per probe.
+            throughput_tolerance: Fraction of the best throughput the recommendation must reach.
+            probe_timeout: Seconds before a probe is abandoned.
+            save: Merge the result into <model>.plan.json.
+
+        Returns:
+            Plan dict: {mode: {"budget_mb", "seq_lens": {seq: {"max_batch_size",
+            "recommended_batch_size", "points"}}}, "host": ...}.
+        """
+        if mode not in PLAN_MODES:
+            raise ValueError(f"Unknown plan mode: {mode}. Expected one of {PLAN_MODES}")
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"Model not found: {model_path}")
+        if mode == "training" and model_path.endswith(".onnx"):
+            raise ValueError("Training plans need the PyTorch model, not ONNX.")
+
+        budget = memory_budget_mb or 0.8 * available_memory_mb()
+        logger.info(f"Planning {mode} batch sizes for {model_path} within {budget:.0f} MB")
+
+        entries = {}
+        for seq_len in seq_lens or [128]:
+            points: Dict[int, Dict[str, Any]] = {}
+
+            def fits(batch: int) -> bool:
+                if batch not in points:
+                    points[batch] = self._measure(model_path, mode, batch, seq_len, input_spec,
+                                                  iterations, budget, probe_timeout)
+                return points[batch]["fits"]
+
+            if not fits(1):
+                logger.warning(f"Batch 1 at sequence length {seq_len} does not fit: {points[1].get('error')}")
+                entries[str(seq_len)] = {"max_batch_size": 0, "recommended_batch_size": None,
+                                         "points": list(points.values())}
+                continue
+
+            # Geometric growth, then binary search between the last fit and the first miss
+            good, bad = 1, None
+            while good < max_batch_size:
+                candidate = min(good * 2, max_batch_size)
+                if fits(candidate):
+                    good = candidate
+                else:
+                    bad = candidate
+                    break
+            while bad is not None and bad - good > 1:
+                middle = (good + bad) // 2
+                if fits(middle):
+                    good = middle
+                else:
+                    bad = middle
+
+            feasible = [p for p in points.values() if p["fits"]]
+            best = max(p["throughput"] for p in feasible)
+            recommended = min(p["batch_size"] for p in feasible if p["throughput"] >= throughput_tolerance * best)
+            entries[str(seq_len)] = {
+                "max_batch_size": good,
+                "recommended_batch_size": recommended,
+                "points": sorted(points.values(), key=lambda p: p["batch_size"]),
+            }
+            logger.info(f"Sequence length {seq_len}: max batch {good}, recommended {recommended}")
+
+        result = {"budget_mb": budget, "input_spec": input_spec, "seq_lens": entries}
+        plan = (load_plan(model_path) or {}) if save else {}
+        plan.update({"model_path": os.path.abspath(model_path), "host": _host_info(), mode: result})
+        if save:
+            path = plan_path(model_path)
+            with open(path, "w") as f:
+                json.dump(plan, f, indent=2)
+            logger.info(f"Saved batch plan to {path}")
+        return plan
+
+    def _measure(self, model_path, mode, batch, seq_len, input_spec, iterations, budget, timeout) -> Dict[str, Any]:
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        task = {"model_path": model_path, "mode": mode, "batch_size": batch, "seq_len": seq_len,
+                "input_spec": input_spec, "iterations": iterations}
+        process = context.Process(target=_probe, args=(task, results), daemon=True)
+        process.start()
+
+        point: Dict[str, Any] = {"batch_size": batch, "seq_len": seq_len}
+        deadline = time.monotonic() + timeout
+        outcome = None
+        while outcome is None:
+            try:
+                outcome = results.get(timeout=0.05)
+            except queue.Empty:
+                rss = self._resident_mb(process.pid)
+                if rss is not None and rss > budget:
+                    outcome = {"ok": False, "error": f"exceeded budget ({rss:.0f} MB resident)"}
+                elif not process.is_alive():
+                    try:
+                        # The probe may have reported and exited since the get above timed out
+                        outcome = results.get(timeout=0.5)
+                    except queue.Empty:
+                        # Killed without reporting, typically by the kernel OOM killer
+                        outcome = {"ok": False, "error": f"probe exited with code {process.exitcode}"}
+                elif time.monotonic() > deadline:
+                    outcome = {"ok": False, "error": f"timed out after {timeout:.0f}s"}
+        if process.is_alive():
+            process.kill()
+        process.join()
+
+        point.update({k: v for k, v in outcome.items() if k != "ok"})
+        point["fits"] = outcome["ok"] and outcome["peak_rss_mb"] <= budget
+        logger.info(f"Probe batch={batch} seq={seq_len}: "
+                    + (f"{point['peak_rss_mb']:.0f} MB, {point['throughput']:.1f} samples/s"
+                       if outcome["ok"] else point["error"]))
+        return point
+
+    @staticmethod
+    def _resident_mb(pid: int) -> Optional[float]:
+        """Current RSS of a child from /proc (None where unavailable)."""
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) / 1024.0
+        except OSError:
+            return None
+        return None
@@ -0,0 +1,145 @@
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, List, Any, Tuple
+
+import numpy as np
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class _Block:
+    __slots__ = ("node_id", "tokens", "parent", "children", "kv", "nbytes")
+
+    def __init__(self, node_id: int, tokens: Tuple[int, ...], parent: Optional["_Block"], kv: Dict[str, np.ndarray]):
+        self.node_id = node_id
+        self.tokens = tokens
+        self.parent = parent
+        self.children: Dict[Tuple[int, ...], "_Block"] = {}
+        self.kv = kv
+        self.nbytes = sum(v.nbytes for v in kv.values())
+
+
+class PrefixCache:
+    """
+    Prefill KV cache shared by prompts with a common token prefix.
+
+    Prompts are split into fixed-size token blocks forming a radix trie:
+    each node holds the KV tensors of one block and is keyed by that
+    block's tokens under its parent, so a node identifies the whole prefix
+    leading to it. Lookups return the longest cached prefix; nodes are
+    evicted least-recently-used first (leaves only, so every cached node
+    keeps its ancestors) once the byte budget is exceeded.
+    """
+
+    def __init__(self, seq_axis: int = 2, block_size: int = 16, max_bytes: int = 256 * 1024 * 1024):
+        if block_size < 1:
+            raise ValueError("block_size must be positive.")
+        self.seq_axis = seq_axis
+        self.block_size = block_size
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._root = _Block(0, (), None, {})
+        self._lru: "OrderedDict[int, _Block]" = OrderedDict()
+        self._next_id = 1
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.tokens_reused = 0
+        self.evictions = 0
+
+    def _blocks(self, token_ids: List[int], limit: int) -> List[Tuple[int, ...]]:
+        n = limit // self.block_size
+        return [tuple(token_ids[i * self.block_size:(i + 1) * self.block_size]) for i in range(n)]
+
+    def _slice(self, value: np.ndarray, start: int, stop: int) -> np.ndarray:
+        index = tuple(slice(start, stop) if a == self.seq_axis else slice(None) for a in range(value.ndim))
+        # Copy so a cached block never pins the full past tensor it came from
+        return np.ascontiguousarray(value[index])
+
+    def _touch(self, node: _Block):
+        # Leaf first, then ancestors: parents always end up more recent than their children
+        while node is not self._root:
+            self._lru.move_to_end(node.node_id)
+            node = node.parent
+
+    def lookup(self, token_ids: List[int], max_tokens: Optional[int] = None) -> Tuple[int, Optional[Dict[str, np.ndarray]]]:
+        """
+        Find the longest cached prefix of `token_ids`.
+
+        Args:
+            token_ids: Prompt token ids.
+            max_tokens: Upper bound on the prefix length; callers that need logits
+                for the last prompt token pass len(token_ids) - 1.
+
+        Returns:
+            (matched token count, past tensors covering those tokens or None).
+        """
+        limit = len(token_ids) if max_tokens is None else min(max_tokens, len(token_ids))
+        with self._lock:
+            node, path = self._root, []
+            for block in self._blocks(token_ids, limit):
+                child = node.children.get(block)
+                if child is None:
+                    break
+                path.append(child)
+                node = child
+            if not path:
+                self.misses += 1
+                return 0, None
+            self._touch(node)
+            self.hits += 1
+            matched = len(path) * self.block_size
+            self.tokens_reused += matched
+            past = {name: np.concatenate([b.kv[name] for b in path], axis=self.seq_axis) for name in path[0].kv}
+        return matched, past
+
+    def insert(self, token_ids: List[int], past: Dict[str, np.ndarray]):
+        """Cache every complete block of a prefilled prompt (past covers token_ids)."""
+        length = min(len(token_ids), next(iter(past.values())).shape[self.seq_axis])
+        with self._lock:
+            node = self._root
+            for i, block in enumerate(self._blocks(token_ids, length)):
+                child = node.children.get(block)
+                if child is None:
+                    start = i * self.block_size
+                    kv = {name: self._slice(value, start, start + self.block_size) for name, value in past.items()}
+                    child = _Block(self._next_id, block, node, kv)
+                    self._next_id += 1
+                    node.children[block] = child
+                    self._lru[child.node_id] = child
+                    self.nbytes += child.nbytes
+                node = child
+            self._touch(node)
+            self._evict(protect=node)
+
+    def _evict(self, protect: Optional[_Block] = None):
+        while self.nbytes > self.max_bytes and self._lru:
+            victim = next((b for b in self._lru.values() if not b.children and b is not protect), None)
+            if victim is None:
+                break
+            del self._lru[victim.node_id]
+            del victim.parent.children[victim.tokens]
+            self.nbytes -= victim.nbytes
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._root.children.clear()
+            self._lru.clear()
+            self.nbytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "blocks": len(self._lru),
+                "bytes": self.nbytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "tokens_reused": self.tokens_reused,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,123 @@
+import csv
+import json
+import logging
+import os
+from collections import defaultdict
+from typing import Optional, Dict, List, Any
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Op types that only exist because of quantization (Q/DQ overhead)
+QUANTIZATION_OPS = {"QuantizeLinear", "DequantizeLinear", "DynamicQuantizeLinear"}
+
+# Integer compute kernels of quantized models; reported separately, they are the model's real work
+QUANTIZED_COMPUTE_OPS = {
+    "DynamicQuantizeMatMul", "MatMulIntegerToFloat", "QLinearMatMul", "QLinearConv", "MatMulInteger",
+}
+
+
+class OpProfiler:
+    """
+    Service to turn onnxruntime's JSON profiling trace into a hot-op report.
+    """
+
+    def parse_trace(self, trace_path: str, top_nodes: int = 50) -> Dict[str, Any]:
+        """
+        Aggregate kernel time by op type and by node.
+
+        Args:
+            trace_path: JSON trace written by onnxruntime (session.end_profiling()).
+            top_nodes: Number of slowest nodes to keep.
+
+        Returns:
+            Dict with `by_op_type` and `by_node` tables sorted by total time,
+            `total_kernel_us`, `runs`, `quantization_overhead_pct` (Q/DQ ops only)
+            and `quantized_compute_pct` (integer MatMul/Conv kernels).
+        """
+        if not os.path.exists(trace_path):
+            raise FileNotFoundError(f"Profiling trace not found: {trace_path}")
+        with open(trace_path, "r") as f:
+            events = json.load(f)
+
+        by_type: Dict[str, Dict[str, float]] = defaultdict(lambda: {"calls": 0, "total_us": 0.0})
+        by_node: Dict[str, Dict[str, Any]] = {}
+        runs = 0
+
+        for event in events:
+            if event.get("cat") == "Session" and event.get("name") == "model_run":
+                runs += 1
+                continue
+            if event.get("cat") != "Node" or not event.get("name", "").endswith("_kernel_time"):
+                continue
+
+            args = event.get("args", {})
+            op_type = args.get("op_name", "Unknown")
+            node = event["name"][:-len("_kernel_time")]
+            duration = float(event.get("dur", 0))
+
+            by_type[op_type]["calls"] += 1
+            by_type[op_type]["total_us"] += duration
+            entry = by_node.setdefault(node, {"node": node, "op_type": op_type, "calls": 0, "total_us": 0.0,
+                                              "provider": args.get("provider", "")})
+            entry["calls"] += 1
+            entry["total_us"] += duration
+
+        total = sum(v["total_us"] for v in by_type.values())
+        op_rows = [
+            {"op_type": op, "calls": int(v["calls"]), "total_us": v["total_us"],
+             "avg_us": v["total_us"] / v["calls"], "percent": 100.0 * v["total_us"] / total if total else 0.0}
+            for op, v in by_type.items()
+        ]
+        op_rows.sort(key=lambda r: r["total_us"], reverse=True)
+
+        node_rows = sorted(by_node.values(), key=lambda r: r["total_us"], reverse=True)[:top_nodes]
+        for row in node_rows:
+            row["avg_us"] = row["total_us"] / row["calls"]
+            row["percent"] = 100.0 * row["total_us"] / total if total else 0.0
+
+        quant_us = sum(r["total_us"] for r in op_rows if r["op_type"] in QUANTIZATION_OPS)
+        compute_us = sum(r["total_us"] for r in op_rows if r["op_type"] in QUANTIZED_COMPUTE_OPS)
+        return {
+            "trace_file": trace_path,
+            "runs": runs,
+            "total_kernel_us": total,
+            "quantization_overhead_pct": 100.0 * quant_us / total if total else 0.0,
+            "quantized_compute_pct": 100.0 * compute_us / total if total else 0.0,
+            "by_op_type": op_rows,
+            "by_node": node_rows,
+        }
+
+    def export(self, report: Dict[str, Any], output_path: str) -> str:
+        """
+        Write the hot-op report as .json (full report) or .csv (op type and node tables).
+        """
+        output_dir = os.path.dirname(output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+
+        if output_path.endswith(".json"):
+            with open(output_path, "w") as f:
+                json.dump(report, f, indent=2)
+        else:
+            with open(output_path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["level", "name", "op_type", "calls", "total_us", "avg_us", "percent"])
+                for r in report["by_op_type"]:
+                    writer.writerow(["op_type", r["op_type"], r["op_type"], r["calls"],
+                                     f"{r['total_us']:.1f}", f"{r['avg_us']:.2f}", f"{r['percent']:.2f}"])
+                for r in report["by_node"]:
+                    writer.writerow(["node", r["node"], r["op_type"], r["calls"],
+                                     f"{r['total_us']:.1f}", f"{r['avg_us']:.2f}", f"{r['percent']:.2f}"])
+
+        logger.info(f"Hot-op report written to {output_path}")
+        return output_path
+
+    @staticmethod
+    def format_table(rows: List[Dict[str, Any]], limit: Optional[int] = 20) -> str:
+        """Plain-text table of op type rows, for logs and the CLI."""
+        lines = [f"{'op_type':<28}{'calls':>8}{'total_ms':>12}{'avg_us':>10}{'%':>8}"]
+        for r in rows[:limit]:
+            lines.append(f"{r['op_type']:<28}{r['calls']:>8}{r['total_us'] / 1000:>12.2f}"
+                         f"{r['avg_us']:>10.1f}{r['percent']:>8.1f}")
+        return "\n".join(lines)
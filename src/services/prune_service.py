@@ -0,0 +1,542 @@
+import copy
+import logging
+import os
+from typing import Optional, Dict, List, Tuple, Union, Any
+
+import torch
+from torch import nn
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Modules that act element-wise and can sit between two Linear layers of an MLP
+# without depending on the hidden channel layout.
+ELEMENTWISE_MODULES = (
+    nn.ReLU, nn.GELU, nn.SiLU, nn.Tanh, nn.Sigmoid, nn.LeakyReLU,
+    nn.Dropout, nn.Identity,
+)
+
+
+class PruneModel:
+    """
+    Service to apply structured pruning to eager PyTorch models before ONNX export.
+
+    Unlike masking, every pruning step rebuilds physically smaller modules
+    (fewer attention heads, narrower MLPs, fewer layers), so the exported graph
+    carries fewer FLOPs and parameters.
+
+    Supported layouts:
+    - Llama/Qwen style decoders (self_attn.q_proj/k_proj/v_proj/o_proj, mlp.gate_proj/up_proj/down_proj)
+    - BERT style encoders (attention.self.query/key/value, intermediate.dense/output.dense)
+    - Plain nn.Sequential MLPs (Linear -> activation -> Linear)
+    """
+
+    def __init__(self):
+        self.last_report: Dict[str, Any] = {}
+
+    def prune(self,
+              model: nn.Module,
+              sample_inputs: Union[torch.Tensor, Tuple[torch.Tensor, ...]],
+              head_ratio: float = 0.0,
+              mlp_ratio: float = 0.0,
+              layers_to_drop: int = 0,
+              importance: str = "magnitude",
+              finetune_steps: int = 0,
+              finetune_lr: float = 1e-4,
+              sample_data_path: Optional[str] = None) -> nn.Module:
+        """
+        Structurally prune a model in place.
+
+        Args:
+            model: Eager PyTorch model (TorchScript modules cannot be rebuilt).
+            sample_inputs: Inputs used for activation-based importance and recovery fine-tuning.
+            head_ratio: Fraction of attention heads to remove from every layer.
+            mlp_ratio: Fraction of MLP intermediate channels to remove from every layer.
+            layers_to_drop: Number of whole transformer layers to remove.
+            importance: 'magnitude' (weight norms) or 'activation' (scores from sample data).
+            finetune_steps: Number of recovery fine-tune steps (distilling from the unpruned model).
+            finetune_lr: Learning rate for the recovery fine-tune.
+            sample_data_path: Optional .pt/.npy/.npz file with real sample inputs.
+
+        Returns:
+            The pruned model.
+        """
+        if isinstance(model, torch.jit.ScriptModule):
+            raise ValueError("Structured pruning requires an eager PyTorch model, not TorchScript.")
+
+        importance = importance.lower()
+        if importance not in ("magnitude", "activation"):
+            raise ValueError(f"Unknown importance score: {importance}")
+
+        for name, ratio in (("head_ratio", head_ratio), ("mlp_ratio", mlp_ratio)):
+            if not 0.0 <= ratio < 1.0:
+                raise ValueError(f"{name} must be in [0, 1), got {ratio}")
+
+        samples = self._load_samples(model, sample_inputs, sample_data_path)
+        params_before = self._count_params(model)
+        teacher = copy.deepcopy(model).eval() if finetune_steps > 0 else None
+
+        stack_name, layers = self._find_layer_stack(model)
+        logger.info(f"Pruning with {importance} importance; layer stack: {stack_name or 'none'}")
+
+        head_scores, mlp_scores, layer_scores = self._compute_scores(model, layers, samples, importance)
+
+        report: Dict[str, Any] = {"importance": importance}
+        if head_ratio > 0 and layers is not None:
+            report["heads"] = self._prune_heads(model, layers, head_scores, head_ratio)
+        if mlp_ratio > 0:
+            report["mlp_channels"] = self._prune_mlps(model, layers, mlp_scores, mlp_ratio)
+        if layers_to_drop > 0:
+            if layers is None:
+                raise ValueError("layers_to_drop requires a model with a stack of transformer layers.")
+            report["dropped_layers"] = self._drop_layers(model, stack_name, layers, layer_scores, layers_to_drop)
+
+        if teacher is not None:
+            report["finetune_loss"] = self._recovery_finetune(model, teacher, samples, finetune_steps, finetune_lr)
+
+        params_after = self._count_params(model)
+        report["params_before"] = params_before
+        report["params_after"] = params_after
+        self.last_report = report
+        logger.info(f"Pruning finished: {params_before:,} -> {params_after:,} parameters")
+
+        model.eval()
+        return model
+
+    # ------------------------------------------------------------------
+    # Discovery
+    # ------------------------------------------------------------------
+
+    def _find_layer_stack(self, model: nn.Module) -> Tuple[Optional[str], Optional[nn.ModuleList]]:
+        """Return the longest ModuleList of identical blocks (the transformer layers)."""
+        best_name, best = None, None
+        for name, module in model.named_modules():
+            if not isinstance(module, nn.ModuleList) or len(module) < 2:
+                continue
+            if len({type(m) for m in module}) != 1:
+                continue
+            if best is None or len(module) > len(best):
+                best_name, best = name, module
+        return best_name, best
+
+    def _attention_parts(self, block: nn.Module) -> Optional[Dict[str, Any]]:
+        attn = getattr(block, "self_attn", None)
+        if attn is not None and all(isinstance(getattr(attn, p, None), nn.Linear)
+                                    for p in ("q_proj", "k_proj", "v_proj", "o_proj")):
+            return {"style": "decoder", "module": attn,
+                    "q": attn.q_proj, "k": attn.k_proj, "v": attn.v_proj, "o": attn.o_proj}
+
+        attention = getattr(block, "attention", None)
+        self_attn = getattr(attention, "self", None)
+        output = getattr(attention, "output", None)
+        if self_attn is not None and isinstance(getattr(self_attn, "query", None), nn.Linear) \
+                and isinstance(getattr(output, "dense", None), nn.Linear):
+            return {"style": "encoder", "module": self_attn,
+                    "q": self_attn.query, "k": self_attn.key, "v": self_attn.value, "o": output.dense}
+        return None
+
+    def _mlp_parts(self, block: nn.Module) -> Optional[Dict[str, Any]]:
+        mlp = getattr(block, "mlp", None)
+        if mlp is not None and all(isinstance(getattr(mlp, p, None), nn.Linear)
+                                   for p in ("gate_proj", "up_proj", "down_proj")):
+            return {"inputs": [mlp.gate_proj, mlp.up_proj], "output": mlp.down_proj,
+                    "owner": mlp, "names": (["gate_proj", "up_proj"], "down_proj")}
+
+        intermediate = getattr(block, "intermediate", None)
+        output = getattr(block, "output", None)
+        if isinstance(getattr(intermediate, "dense", None), nn.Linear) \
+                and isinstance(getattr(output, "dense", None), nn.Linear):
+            return {"inputs": [intermediate.dense], "output": output.dense,
+                    "owner": (intermediate, output), "names": (["dense"], "dense")}
+        return None
+
+    def _sequential_mlps(self, model: nn.Module, layers: Optional[nn.ModuleList]) -> List[Tuple[nn.Sequential, int, int]]:
+        """Find (sequential, first_linear_idx, second_linear_idx) pairs outside the layer stack."""
+        inside = {id(m) for m in layers.modules()} if layers is not None else set()
+        pairs = []
+        for module in model.modules():
+            if not isinstance(module, nn.Sequential) or id(module) in inside:
+                continue
+            children = list(module)
+            for i, first in enumerate(children):
+                if not isinstance(first, nn.Linear):
+                    continue
+                for j in range(i + 1, len(children)):
+                    if isinstance(children[j], nn.Linear):
+                        pairs.append((module, i, j))
+                        break
+                    if not isinstance(children[j], ELEMENTWISE_MODULES):
+                        break
+        return pairs
+
+    def _head_layout(self, model: nn.Module, parts: Dict[str, Any]) -> Tuple[int, int, int]:
+        """Return (num_heads, num_kv_heads, head_dim) for an attention module."""
+        config = getattr(model, "config", None)
+        attn = parts["module"]
+        if parts["style"] == "encoder":
+            num_heads = attn.num_attention_heads
+            return num_heads, num_heads, attn.attention_head_size
+
+        head_dim = getattr(attn, "head_dim", None) or getattr(config, "head_dim", None)
+        if not head_dim:
+            hidden_size = getattr(config, "hidden_size", None)
+            config_heads = getattr(config, "num_attention_heads", None)
+            if not hidden_size or not config_heads:
+                raise ValueError("Cannot determine the attention head size: the attention module and config "
+                                 "define neither head_dim nor hidden_size and num_attention_heads.")
+            head_dim = hidden_size // config_heads
+        num_heads = parts["q"].out_features // head_dim
+        num_kv_heads = parts["k"].out_features // head_dim
+        return num_heads, num_kv_heads, head_dim
+
+    # ------------------------------------------------------------------
+    # Importance scores
+    # ------------------------------------------------------------------
+
+    def _compute_scores(self, model, layers, samples, importance):
+        head_scores: Dict[int, torch.Tensor] = {}
+        mlp_scores: Dict[Any, torch.Tensor] = {}
+        layer_scores: Dict[int, float] = {}
+
+        blocks = list(layers) if layers is not None else []
+        seq_mlps = self._sequential_mlps(model, layers)
+
+        if importance == "activation":
+            act_heads: Dict[int, torch.Tensor] = {}
+            act_mlp: Dict[Any, torch.Tensor] = {}
+            act_layers: Dict[int, List[float]] = {}
+            hooks = []
+
+            def accumulate(store, key, value):
+                store[key] = store[key] + value if key in store else value
+
+            for idx, block in enumerate(blocks):
+                parts = self._attention_parts(block)
+                if parts is not None:
+                    num_heads, _, head_dim = self._head_layout(model, parts)
+
+                    def head_hook(_m, args, idx=idx, num_heads=num_heads, head_dim=head_dim):
+                        x = args[0].detach().float()
+                        per_head = x.reshape(-1, num_heads, head_dim).norm(dim=-1).mean(dim=0)
+                        accumulate(act_heads, idx, per_head)
+                    hooks.append(parts["o"].register_forward_pre_hook(head_hook))
+
+                mlp = self._mlp_parts(block)
+                if mlp is not None:
+                    def mlp_hook(_m, args, idx=idx):
+                        x = args[0].detach().float()
+                        accumulate(act_mlp, idx, x.reshape(-1, x.shape[-1]).abs().mean(dim=0))
+                    hooks.append(mlp["output"].register_forward_pre_hook(mlp_hook))
+
+                def layer_hook(_m, args, kwargs, output, idx=idx):
+                    hidden_in = args[0] if args else kwargs.get("hidden_states")
+                    hidden_out = output[0] if isinstance(output, (tuple, list)) else output
+                    if not isinstance(hidden_in, torch.Tensor) or not isinstance(hidden_out, torch.Tensor):
+                        return
+                    cos = nn.functional.cosine_similarity(
+                        hidden_in.detach().float().flatten(0, -2),
+                        hidden_out.detach().float().flatten(0, -2), dim=-1)
+                    act_layers.setdefault(idx, []).append(float((1.0 - cos).mean()))
+                hooks.append(block.register_forward_hook(layer_hook, with_kwargs=True))
+
+            for seq, _i, j in seq_mlps:
+                def seq_hook(_m, args, key=(id(seq), j)):
+                    x = args[0].detach().float()
+                    accumulate(act_mlp, key, x.reshape(-1, x.shape[-1]).abs().mean(dim=0))
+                hooks.append(seq[j].register_forward_pre_hook(seq_hook))
+
+            try:
+                with torch.no_grad():
+                    for batch in samples:
+                        model(*batch)
+            finally:
+                for h in hooks:
+                    h.remove()
+
+        for idx, block in enumerate(blocks):
+            parts = self._attention_parts(block)
+            if parts is not None:
+                num_heads, _, head_dim = self._head_layout(model, parts)
+                o_norm = parts["o"].weight.detach().float().reshape(-1, num_heads, head_dim).norm(dim=(0, 2))
+                if importance == "activation" and idx in act_heads:
+                    head_scores[idx] = act_heads[idx] * o_norm
+                else:
+                    q_norm = parts["q"].weight.detach().float().reshape(num_heads, head_dim, -1).norm(dim=(1, 2))
+                    head_scores[idx] = q_norm * o_norm
+
+            mlp = self._mlp_parts(block)
+            if mlp is not None:
+                out_norm = mlp["output"].weight.detach().float().norm(dim=0)
+                if importance == "activation" and idx in act_mlp:
+                    mlp_scores[idx] = act_mlp[idx] * out_norm
+                else:
+                    in_norm = sum(lin.weight.detach().float().norm(dim=1) for lin in mlp["inputs"])
+                    mlp_scores[idx] = in_norm * out_norm
+
+            if importance == "activation" and idx in act_layers:
+                layer_scores[idx] = sum(act_layers[idx]) / len(act_layers[idx])
+            else:
+                # Relative weight magnitude: a coarse proxy for how much a block contributes.
+                layer_scores[idx] = float(sum(p.detach().float().norm() for p in block.parameters()))
+
+        for seq, i, j in seq_mlps:
+            key = (id(seq), j)
+            out_norm = seq[j].weight.detach().float().norm(dim=0)
+            if importance == "activation" and key in act_mlp:
+                mlp_scores[key] = act_mlp[key] * out_norm
+            else:
+                mlp_scores[key] = seq[i].weight.detach().float().norm(dim=1) * out_norm
+
+        return head_scores, mlp_scores, layer_scores
+
+    # ------------------------------------------------------------------
+    # Rebuilding smaller modules
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _shrink_linear(linear: nn.Linear, keep: torch.Tensor, dim: int) -> nn.Linear:
+        """Build a new Linear keeping only `keep` indices along out (dim=0) or in (dim=1) features."""
+        weight = linear.weight.detach().index_select(dim, keep).clone()
+        bias = linear.bias
+        if bias is not None and dim == 0:
+            bias = bias.detach().index_select(0, keep).clone()
+        elif bias is not None:
+            bias = bias.detach().clone()
+
+        new = nn.Linear(weight.shape[1], weight.shape[0], bias=bias is not None,
+                        device=weight.device, dtype=weight.dtype)
+        new.weight.data.copy_(weight)
+        if bias is not None:
+            new.bias.data.copy_(bias)
+        return new
+
+    @staticmethod
+    def _top_k(scores: torch.Tensor, keep_count: int) -> torch.Tensor:
+        keep = torch.topk(scores, keep_count).indices
+        return torch.sort(keep).values
+
+    def _prune_heads(self, model, layers, head_scores, ratio) -> Dict[str, int]:
+        config = getattr(model, "config", None)
+        first = next((self._attention_parts(b) for b in layers if self._attention_parts(b)), None)
+        if first is None:
+            logger.warning("No supported attention modules found; skipping head pruning.")
+            return {}
+
+        num_heads, num_kv_heads, head_dim = self._head_layout(model, first)
+
+        if first["style"] == "encoder":
+            if not hasattr(model, "prune_heads"):
+                logger.warning("Encoder attention without prune_heads support; skipping head pruning.")
+                return {}
+            # HF encoders know how to rebuild their own attention blocks.
+            keep_count = max(1, num_heads - int(round(num_heads * ratio)))
+            to_prune = {}
+            for idx, scores in head_scores.items():
+                keep = set(self._top_k(scores, keep_count).tolist())
+                to_prune[idx] = [h for h in range(num_heads) if h not in keep]
+            model.prune_heads(to_prune)
+            return {"before": num_heads, "after": keep_count}
+
+        groups = num_heads // num_kv_heads
+        if groups == 1:
+            # Plain multi-head attention: whole heads (q, k and v) are removed together.
+            keep_count = max(1, num_heads - int(round(num_heads * ratio)))
+            new_heads, new_kv_heads = keep_count, keep_count
+        else:
+            # Grouped-query attention: remove query heads evenly inside every KV group
+            # so each KV head keeps serving the same number of queries.
+            keep_per_group = max(1, groups - int(round(groups * ratio)))
+            new_heads, new_kv_heads = keep_per_group * num_kv_heads, num_kv_heads
+
+        if new_heads == num_heads:
+            logger.info("Head ratio too small to remove any head; skipping.")
+            return {"before": num_heads, "after": num_heads}
+
+        for idx, block in enumerate(layers):
+            parts = self._attention_parts(block)
+            if parts is None:
+                continue
+            attn = parts["module"]
+            scores = head_scores[idx]
+
+            if groups == 1:
+                heads = self._top_k(scores, new_heads)
+                kv_heads = heads
+            else:
+                keep_per_group = new_heads // num_kv_heads
+                heads = torch.cat([
+                    g * groups + self._top_k(scores[g * groups:(g + 1) * groups], keep_per_group)
+                    for g in range(num_kv_heads)
+                ])
+                kv_heads = torch.arange(num_kv_heads)
+
+            q_rows = (heads[:, None] * head_dim + torch.arange(head_dim)).flatten()
+            kv_rows = (kv_heads[:, None] * head_dim + torch.arange(head_dim)).flatten()
+
+            attn.q_proj = self._shrink_linear(parts["q"], q_rows, 0)
+            attn.o_proj = self._shrink_linear(parts["o"], q_rows, 1)
+            if groups == 1:
+                attn.k_proj = self._shrink_linear(parts["k"], kv_rows, 0)
+                attn.v_proj = self._shrink_linear(parts["v"], kv_rows, 0)
+
+            attn.num_key_value_groups = new_heads // new_kv_heads
+            for attr, value in (("num_heads", new_heads), ("num_key_value_heads", new_kv_heads)):
+                if hasattr(attn, attr):
+                    setattr(attn, attr, value)
+            if hasattr(attn, "head_dim"):
+                attn.head_dim = head_dim
+
+        if config is not None:
+            # head_dim must be pinned before num_attention_heads changes, otherwise
+            # HF derives it from hidden_size // num_attention_heads on reload.
+            config.head_dim = head_dim
+            config.num_attention_heads = new_heads
+            config.num_key_value_heads = new_kv_heads
+
+        return {"before": num_heads, "after": new_heads}
+
+    def _prune_mlps(self, model, layers, mlp_scores, ratio) -> Dict[str, Dict[str, int]]:
+        config = getattr(model, "config", None)
+        report: Dict[str, Dict[str, int]] = {}
+
+        for idx, block in enumerate(layers if layers is not None else []):
+            mlp = self._mlp_parts(block)
+            if mlp is None or idx not in mlp_scores:
+                continue
+            width = mlp["output"].in_features
+            keep_count = max(1, width - int(round(width * ratio)))
+            keep = self._top_k(mlp_scores[idx], keep_count)
+
+            in_names, out_name = mlp["names"]
+            owner = mlp["owner"]
+            in_owner, out_owner = owner if isinstance(owner, tuple) else (owner, owner)
+            for lin, name in zip(mlp["inputs"], in_names):
+                setattr(in_owner, name, self._shrink_linear(lin, keep, 0))
+            setattr(out_owner, out_name, self._shrink_linear(mlp["output"], keep, 1))
+            report["intermediate_size"] = {"before": width, "after": keep_count}
+
+        if config is not None and "intermediate_size" in report and hasattr(config, "intermediate_size"):
+            config.intermediate_size = report["intermediate_size"]["after"]
+
+        for seq, i, j in self._sequential_mlps(model, layers):
+            key = (id(seq), j)
+            if key not in mlp_scores:
+                continue
+            width = seq[i].out_features
+            keep_count = max(1, width - int(round(width * ratio)))
+            keep = self._top_k(mlp_scores[key], keep_count)
+            seq[i] = self._shrink_linear(seq[i], keep, 0)
+            seq[j] = self._shrink_linear(seq[j], keep, 1)
+            totals = report.setdefault("sequential", {"before": 0, "after": 0})
+            totals["before"] += width
+            totals["after"] += keep_count
+
+        return report
+
+    def _drop_layers(self, model, stack_name, layers, layer_scores, count) -> List[int]:
+        if count >= len(layers):
+            raise ValueError(f"Cannot drop {count} of {len(layers)} layers.")
+
+        ranked = sorted(range(len(layers)), key=lambda i: layer_scores.get(i, 0.0))
+        dropped = sorted(ranked[:count])
+        kept = [block for i, block in enumerate(layers) if i not in dropped]
+
+        parent_name, _, attr = stack_name.rpartition(".")
+        parent = model.get_submodule(parent_name) if parent_name else model
+        setattr(parent, attr, nn.ModuleList(kept))
+
+        # Keep KV-cache indexing consistent with the new layer order.
+        for new_idx, block in enumerate(kept):
+            for module in block.modules():
+                if hasattr(module, "layer_idx"):
+                    module.layer_idx = new_idx
+
+        config = getattr(model, "config", None)
+        if config is not None:
+            if hasattr(config, "num_hidden_layers"):
+                config.num_hidden_layers = len(kept)
+            layer_types = getattr(config, "layer_types", None)
+            if isinstance(layer_types, list) and len(layer_types) == len(layers):
+                config.layer_types = [t for i, t in enumerate(layer_types) if i not in dropped]
+
+        logger.info(f"Dropped layers: {dropped}")
+        return dropped
+
+    # ------------------------------------------------------------------
+    # Recovery fine-tune
+    # ------------------------------------------------------------------
+
+    def _recovery_finetune(self, model, teacher, samples, steps, lr) -> float:
+        """Distill the unpruned model's outputs back into the pruned one."""
+        params = [p for p in model.parameters() if p.requires_grad and p.is_floating_point()]
+        optimizer = torch.optim.AdamW(params, lr=lr)
+        model.train()
+        loss_value = 0.0
+
+        for step in range(steps):
+            batch = samples[step % len(samples)]
+            with torch.no_grad():
+                target = self._primary_output(teacher(*batch)).float()
+            output = self._primary_output(model(*batch)).float()
+            loss = nn.functional.mse_loss(output, target)
+
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            loss_value = float(loss)
+            logger.info(f"Recovery step {step + 1}/{steps}: loss={loss_value:.6f}")
+
+        model.eval()
+        return loss_value
+
+    # ------------------------------------------------------------------
+    # Helpers
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _primary_output(out) -> torch.Tensor:
+        if isinstance(out, torch.Tensor):
+            return out
+        for attr in ("logits", "last_hidden_state"):
+            value = getattr(out, attr, None)
+            if isinstance(value, torch.Tensor):
+                return value
+        values = out.values() if isinstance(out, dict) else out
+        for value in values:
+            if isinstance(value, torch.Tensor):
+                return value
+        raise ValueError("Model output contains no tensor to compare against.")
+
+    @staticmethod
+    def _count_params(model: nn.Module) -> int:
+        return sum(p.numel() for p in model.parameters())
+
+    def _load_samples(self, model, sample_inputs, sample_data_path) -> List[Tuple[torch.Tensor, ...]]:
+        """Return a list of input tuples used for scoring and recovery."""
+        if sample_data_path:
+            if not os.path.exists(sample_data_path):
+                raise FileNotFoundError(f"Sample data not found: {sample_data_path}")
+            if sample_data_path.endswith((".npy", ".npz")):
+                import numpy as np
+                data = np.load(sample_data_path)
+                arrays = [data[k] for k in data.files] if hasattr(data, "files") else [data]
+                tensors = [torch.from_numpy(a) for a in arrays]
+            else:
+                loaded = torch.load(sample_data_path, map_location="cpu")
+                tensors = list(loaded) if isinstance(loaded, (list, tuple)) else [loaded]
+            # First dimension is treated as the sample axis; split into single-row batches.
+            rows = tensors[0].shape[0]
+            return [tuple(t[i:i + 1] for t in tensors) for i in range(rows)]
+
+        if not isinstance(sample_inputs, tuple):
+            sample_inputs = (sample_inputs,)
+
+        logger.warning("No sample data provided; scoring on synthetic inputs (rough proxy only).")
+        vocab = getattr(getattr(model, "config", None), "vocab_size", None) or 2
+        batch = []
+        for t in sample_inputs:
+            if t.is_floating_point():
+                batch.append(torch.randn_like(t))
+            else:
+                batch.append(torch.randint(0, vocab, t.shape, dtype=t.dtype))
+        return [tuple(batch)]
@@ -2,6 +2,10 @@ import os
 import logging
 from typing import Optional, Dict, Any, List
 from enum import Enum
+from services.instrumentation import tracer
+from services.calibration_service import (
+    ShardedCalibrator, SampleDataReader, CalibrationTable, load_calibration_samples, model_inputs
+)
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -23,7 +27,9 @@ class QuantizeModel:
                  calibration_method: str = "MinMax",
                  quant_type: str = "INT8",
                  per_channel: bool = False,
-                 calibration_data_path: Optional[str] = None) -> bool:
+                 calibration_data_path: Optional[str] = None,
+                 calibration_workers: int = 0,
+                 use_calibration_table: bool = True) -> bool:
         """
         Quantize an ONNX model.
         
@@ -34,7 +40,13 @@ class QuantizeModel:
             calibration_method: method for calibration (e.g. MinMax, Entropy) if Static.
             quant_type: Data type for quantization (INT8, UINT8) or format (QDQ).
             per_channel: Whether to quantize weights per channel.
-            calibration_data_path: Path to data file for calibration (used if strategy is Static).
+            calibration_data_path: Path to data file for calibration (used if strategy is Static):
+                .npz/.npy arrays, .json feeds or .txt (one text per line, tokenized).
+            calibration_workers: When > 0, calibrate in that many worker processes
+                with exactly merged min/max and histograms (ShardedCalibrator);
+                0 runs onnxruntime's single-process calibrator.
+            use_calibration_table: Reuse (and save) activation ranges in the model's
+                calibration table, so switching quant_type or per_channel skips calibration.
             
         Returns:
             True if successful, False otherwise.
@@ -79,29 +91,20 @@ class QuantizeModel:
         
         try:
             if strategy.lower() == "dynamic":
-                quantize_dynamic(
-                    model_input=input_model_path,
-                    model_output=output_model_path,
-                    weight_type=q_type,
-                    per_channel=per_channel
-                )
+                with tracer.span("quantize", strategy="Dynamic", input_path=input_model_path, output_path=output_model_path):
+                    quantize_dynamic(
+                        model_input=input_model_path,
+                        model_output=output_model_path,
+                        weight_type=q_type,
+                        per_channel=per_channel
+                    )
                 logger.info(f"Dynamic quantization completed: {output_model_path}")
                 return True
                 
             elif strategy.lower() == "static":
                 if not calibration_data_path:
-                    logger.warning("Static quantization requested but no calibration data provided. Falling back to simple static with no data (likely will fail or be inaccurate) or raising error.")
-                    # For this implementation, we require a data reader if we were to do it properly.
-                    # Since implementing a generic CalibrationDataReader from a file path is complex (depends on data format),
-                    # we will mock the reader injection or raise an error asking for code customization.
-                    
-                    # However, to be "production-ready" in a skeleton sense, we can't implement a universal reader.
-                    # We will log error.
                     raise ValueError("Calibration data path required for Static Quantization.")
 
-                # Placeholder for Data Reader
-                # data_reader = MyDataReader(calibration_data_path) 
-                
                 # Mapping calibration method
                 calib_method = CalibrationMethod.MinMax
                 if calibration_method == "Entropy":
@@ -109,12 +112,30 @@ class QuantizeModel:
                 elif calibration_method == "Percentile":
                     calib_method = CalibrationMethod.Percentile
 
-                # NOTE: Real static quantization requires a valid DataReader class instance.
-                # Since we don't have the dataset loader implementation, we will simulate the call
-                # or raise a clear "Not Implemented" for the Reader part.
-                
-                logger.error("Static quantization requires a concrete CalibrationDataReader implementation which depends on the specific dataset format.")
-                raise NotImplementedError("Static quantization with generic data loading is not yet fully implemented. Please provide a custom DataReader.")
+                with tracer.span("quantize", strategy="Static", method=calibration_method,
+                                 workers=calibration_workers, input_path=input_model_path, output_path=output_model_path):
+                    engine = "sharded" if calibration_workers > 0 else "ort"
+                    table = CalibrationTable(input_model_path) if use_calibration_table else None
+                    ranges = table.lookup(calibration_data_path, calibration_method, engine) if table else None
+
+                    if ranges is None:
+                        with tracer.span("calibrate", engine=engine):
+                            if calibration_workers > 0:
+                                calibrator = ShardedCalibrator(calibration_workers)
+                                ranges = calibrator.calibrate(input_model_path, calibration_data_path, calibration_method)
+                                min_max, histograms = calibrator.last_min_max, calibrator.last_histograms
+                            else:
+                                ranges = self._calibrate_single(input_model_path, calibration_data_path, calib_method)
+                                min_max, histograms = None, None
+                        if table:
+                            table.store(calibration_data_path, calibration_method, engine, ranges,
+                                        min_max=min_max, histograms=histograms)
+
+                    with tracer.span("quantize_model"):
+                        self._quantize_with_ranges(input_model_path, output_model_path, ranges,
+                                                   calib_method, q_format, q_type, per_channel)
+                logger.info(f"Static quantization completed: {output_model_path}")
+                return True
                 
             else:
                 raise ValueError(f"Unknown quantization strategy: {strategy}")
@@ -122,3 +143,73 @@ class QuantizeModel:
         except Exception as e:
             logger.exception(f"Quantization failed: {str(e)}")
             raise e
+
+    def _calibrate_single(self, input_model_path: str, calibration_data_path: str, calib_method) -> Dict[str, Any]:
+        """onnxruntime's in-process calibrator, returning plain {tensor: (low, high)} ranges."""
+        import tempfile
+        from pathlib import Path
+        from onnxruntime.quantization.calibrate import create_calibrator
+
+        samples = load_calibration_samples(calibration_data_path, model_inputs(input_model_path), input_model_path)
+        with tempfile.TemporaryDirectory(prefix="calibration_") as work_dir:
+            calibrator = create_calibrator(
+                Path(input_model_path),
+                augmented_model_path=os.path.join(work_dir, "augmented.onnx"),
+                calibrate_method=calib_method,
+            )
+            calibrator.collect_data(SampleDataReader(samples))
+            tensors_range = calibrator.compute_data()
+        return {name: (float(data.range_value[0]), float(data.range_value[1]))
+                for name, data in tensors_range.items()}
+
+    def _quantize_with_ranges(self,
+                              input_model_path: str,
+                              output_model_path: str,
+                              ranges: Dict[str, Any],
+                              calib_method,
+                              q_format,
+                              q_type,
+                              per_channel: bool):
+        """
+        Static quantization from precomputed activation ranges (no calibration run).
+
+        Mirrors quantize_static after its calibration step: the ranges are
+        handed to the QDQ or QOperator quantizer as TensorsData.
+        """
+        from pathlib import Path
+        import numpy as np
+        from onnxruntime.quantization import QuantFormat
+        from onnxruntime.quantization.calibrate import TensorData, TensorsData
+        from onnxruntime.quantization.onnx_quantizer import ONNXQuantizer
+        from onnxruntime.quantization.qdq_quantizer import QDQQuantizer
+        from onnxruntime.quantization.quant_utils import QuantizationMode, load_model_with_shape_infer
+        from onnxruntime.quantization.registry import QDQRegistry, QLinearOpsRegistry
+
+        model = load_model_with_shape_infer(Path(input_model_path))
+        tensors_range = TensorsData(calib_method, {
+            name: TensorData(lowest=np.array(low, dtype=np.float32), highest=np.array(high, dtype=np.float32))
+            for name, (low, high) in ranges.items()
+        })
+
+        if q_format == QuantFormat.QDQ:
+            quantizer = QDQQuantizer(model, per_channel, False, q_type, q_type, tensors_range,
+                                     [], [], list(QDQRegistry.keys()))
+        else:
+            quantizer = ONNXQuantizer(model, per_channel, False, QuantizationMode.QLinearOps, True, q_type, q_type,
+                                      tensors_range, [], [], list(QLinearOpsRegistry.keys()))
+        quantizer.quantize_model()
+        quantizer.model.save_model_to_file(output_model_path, model.ByteSize() > 2 * 1024 ** 3)
+
+
+def quantize_job(input_path: str, output_path: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Quantize one model in a worker process and report the outcome.
+
+    Lives here rather than next to its callers so spawned workers only import
+    this module, which never pulls in torch.
+    """
+    try:
+        QuantizeModel().quantize(input_path, output_path, **options)
+        return {"status": "ok"}
+    except Exception as e:
+        return {"status": "error", "error": str(e)}
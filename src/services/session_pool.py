@@ -0,0 +1,353 @@
+import hashlib
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional, Dict, List, Any
+
+import numpy as np
+
+from services.inference_service import ORT_TO_NUMPY, build_session_options, resolve_session_source, synthetic_feed
+from services.ort_export_service import OPTIMIZED_SUFFIX, ORT_FORMAT_SUFFIX
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+_ENV_ALLOCATOR_LOCK = threading.Lock()
+_env_allocator_registered = False
+
+
+def register_env_allocator() -> bool:
+    """
+    Register one arena allocator on the process-wide ORT environment.
+
+    Sessions created with `session.use_env_allocators=1` then draw their CPU
+    buffers from this single arena instead of growing one arena each.
+    """
+    global _env_allocator_registered
+    import onnxruntime as ort
+
+    with _ENV_ALLOCATOR_LOCK:
+        if _env_allocator_registered:
+            return True
+        try:
+            memory_info = ort.OrtMemoryInfo("Cpu", ort.OrtAllocatorType.ORT_ARENA_ALLOCATOR, 0,
+                                            ort.OrtMemType.DEFAULT)
+            ort.create_and_register_allocator(memory_info, None)
+        except Exception as e:
+            logger.warning(f"Could not register a shared CPU allocator: {e}")
+            return False
+        _env_allocator_registered = True
+        return True
+
+
+class SharedWeights:
+    """
+    Process-wide store of model initializers, deduplicated by content.
+
+    Every initializer is loaded once into an OrtValue and handed to sessions
+    through SessionOptions.add_initializer, so N sessions (or several
+    variants of one model that keep most weights unchanged) reference the
+    same buffers instead of each deserializing its own copy.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # digest -> (array, OrtValue); the array owns the memory the OrtValue points to
+        self._values: Dict[str, Any] = {}
+        self._by_model: Dict[str, Dict[str, str]] = {}
+
+    @staticmethod
+    def _digest(array: np.ndarray) -> str:
+        h = hashlib.sha1()
+        h.update(f"{array.dtype.str}{array.shape}".encode("utf-8"))
+        h.update(np.ascontiguousarray(array).data)
+        return h.hexdigest()
+
+    def initializers_for(self, model_path: str) -> Dict[str, Any]:
+        """Return {initializer name: shared OrtValue} for the main graph of a model."""
+        with self._lock:
+            if model_path not in self._by_model:
+                self._by_model[model_path] = self._load(model_path)
+            return {name: self._values[digest][1] for name, digest in self._by_model[model_path].items()}
+
+    def _load(self, model_path: str) -> Dict[str, str]:
+        if model_path.endswith(ORT_FORMAT_SUFFIX):
+            raise ValueError(f"Cannot read initializers from an ORT format model: {model_path}")
+        try:
+            import onnx
+            from onnx import numpy_helper
+            import onnxruntime as ort
+        except ImportError:
+            logger.error("onnx is not installed.")
+            raise ImportError("onnx dependency missing.")
+
+        model = onnx.load(model_path)
+        names = {}
+        reused = 0
+        for init in model.graph.initializer:
+            array = numpy_helper.to_array(init)
+            if array.dtype == object or array.size == 0:
+                continue
+            digest = self._digest(array)
+            if digest in self._values:
+                reused += 1
+            else:
+                array = np.ascontiguousarray(array)
+                self._values[digest] = (array, ort.OrtValue.ortvalue_from_numpy(array))
+            names[init.name] = digest
+        logger.info(f"Shared {len(names)} initializers of {model_path} ({reused} already resident)")
+        return names
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "tensors": len(self._values),
+                "bytes": sum(array.nbytes for array, _value in self._values.values()),
+                "models": len(self._by_model),
+            }
+
+
+# Process-wide default store, shared by every pool
+shared_weights = SharedWeights()
+
+
+class SessionPool:
+    """
+    Service to hand out ORT sessions of one model to concurrent callers.
+
+    The pool grows lazily up to `size` sessions. Callers borrow a session
+    for one run and return it; a run that fails for a reason other than
+    bad input triggers a probe, and sessions that fail the probe are
+    dropped and replaced. All sessions share their initializers (see
+    SharedWeights) and, optionally, one environment-level CPU arena.
+    """
+
+    def __init__(self,
+                 model_path: str,
+                 size: int = 2,
+                 providers: Optional[List[str]] = None,
+                 intra_op_num_threads: int = 0,
+                 share_weights: bool = True,
+                 use_env_allocators: bool = True,
+                 disable_prepacking: bool = False,
+                 health_check_interval: float = 0.0,
+                 weights: Optional[SharedWeights] = None):
+        """
+        Args:
+            model_path: Path to the .onnx model (saved profiles and optimized artifacts apply).
+            size: Maximum number of sessions.
+            providers: ORT execution providers (CPU by default).
+            intra_op_num_threads: ORT threads per operator per session (0 keeps the profile/default).
+            share_weights: Feed every session the same initializer buffers.
+            use_env_allocators: Allocate activations from one process-wide arena.
+            disable_prepacking: Skip per-session weight prepacking. The Python API does
+                not expose a shared PrepackedWeightsContainer, so each session otherwise
+                keeps its own prepacked copy of MatMul/Conv weights; disabling it trades
+                some kernel speed for strictly shared weight memory.
+            health_check_interval: Seconds between background probes of idle sessions (0 = off).
+            weights: Initializer store (the process-wide one by default).
+        """
+        try:
+            import onnxruntime  # noqa: F401
+        except ImportError:
+            logger.error("onnxruntime is not installed.")
+            raise ImportError("onnxruntime dependency missing.")
+
+        if size < 1:
+            raise ValueError("Session pool size must be at least 1.")
+
+        self.model_path = model_path
+        self.size = size
+        self.providers = providers or ["CPUExecutionProvider"]
+        self.session_path, self.profile = resolve_session_source(model_path, self.providers)
+        if share_weights and self.session_path.endswith(ORT_FORMAT_SUFFIX):
+            # onnx cannot parse the flatbuffer; the optimized ONNX artifact holds the same graph
+            optimized = os.path.splitext(model_path)[0] + OPTIMIZED_SUFFIX
+            if os.path.exists(optimized):
+                self.session_path = optimized
+            else:
+                self.session_path, self.profile = resolve_session_source(model_path, self.providers,
+                                                                         prefer_optimized=False)
+            logger.info(f"Sharing weights, so sessions load {self.session_path} instead of the .ort model")
+        if intra_op_num_threads:
+            self.profile = {**(self.profile or {}), "intra_op_num_threads": intra_op_num_threads}
+        self.use_env_allocators = use_env_allocators and register_env_allocator()
+        self.disable_prepacking = disable_prepacking
+        self.weights = weights or shared_weights
+        self._initializers = self.weights.initializers_for(self.session_path) if share_weights else {}
+
+        self._idle: "queue.Queue[Any]" = queue.Queue()
+        self._lock = threading.Lock()
+        # Signalled whenever a session goes idle or a slot frees up
+        self._available = threading.Condition(self._lock)
+        self._created = 0
+        self._stats = {"runs": 0, "waits": 0, "replaced": 0, "probes": 0}
+        self._closed = threading.Event()
+
+        # The first session is created eagerly so load errors surface here
+        self._created = 1
+        self.primary = self._create()
+        self._idle.put(self.primary)
+        self._probe_feed = synthetic_feed(
+            [(i.name, list(i.shape), ORT_TO_NUMPY.get(i.type, np.float32)) for i in self.primary.get_inputs()],
+            batch_size=1, seq_len=4)
+        if not self.probe(self.primary):
+            # Synthetic inputs cannot drive every model (e.g. decoders with past state);
+            # without a feed the model accepts, probes would drop healthy sessions
+            logger.warning(f"Synthetic probe does not run on {model_path}; session health checks are off")
+            self._probe_feed = None
+
+        self._checker: Optional[threading.Thread] = None
+        if health_check_interval > 0 and self._probe_feed is not None:
+            self._checker = threading.Thread(target=self._check_loop, args=(health_check_interval,),
+                                             name="session-pool-health", daemon=True)
+            self._checker.start()
+        logger.info(f"Session pool for {model_path}: up to {size} sessions, "
+                    f"{len(self._initializers)} shared initializers")
+
+    def _options(self):
+        options = build_session_options(self.profile)
+        for name, value in self._initializers.items():
+            options.add_initializer(name, value)
+        if self.use_env_allocators:
+            options.add_session_config_entry("session.use_env_allocators", "1")
+        if self.disable_prepacking:
+            options.add_session_config_entry("session.disable_prepacking", "1")
+        return options
+
+    def _create(self):
+        """Create a session for a slot the caller has already reserved in `_created`."""
+        import onnxruntime as ort
+
+        try:
+            return ort.InferenceSession(self.session_path, sess_options=self._options(), providers=self.providers)
+        except Exception:
+            with self._available:
+                self._created -= 1
+                self._available.notify()
+            raise
+
+    def acquire(self, timeout: Optional[float] = None):
+        """Borrow a session, creating one while the pool is below its size."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        waited = False
+        with self._available:
+            while True:
+                if self._closed.is_set():
+                    raise RuntimeError("Session pool is closed.")
+                try:
+                    return self._idle.get_nowait()
+                except queue.Empty:
+                    pass
+                if self._created < self.size:
+                    # Reserve the slot before creating, so concurrent callers cannot overshoot size
+                    self._created += 1
+                    break
+                if not waited:
+                    self._stats["waits"] += 1
+                    waited = True
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise RuntimeError(f"No session available within {timeout}s.")
+                self._available.wait(remaining)
+        return self._create()
+
+    def release(self, session, healthy: bool = True):
+        """Return a borrowed session; unhealthy sessions are discarded and replaced by the next caller."""
+        with self._available:
+            if healthy and not self._closed.is_set():
+                self._idle.put(session)
+            else:
+                # Frees the slot; a waiting caller wakes up and creates the replacement
+                self._created -= 1
+                if not healthy:
+                    self._stats["replaced"] += 1
+            self._available.notify()
+        if not healthy:
+            logger.warning(f"Dropped an unhealthy session of {self.model_path}")
+
+    @contextmanager
+    def session(self, timeout: Optional[float] = None):
+        session = self.acquire(timeout)
+        healthy = True
+        try:
+            yield session
+        except Exception as e:
+            # Invalid feeds are the caller's fault; anything else gets the session probed
+            if not isinstance(e, ValueError) and type(e).__name__ != "InvalidArgument":
+                healthy = self.probe(session)
+            raise
+        finally:
+            self.release(session, healthy)
+
+    def run(self, feeds: Dict[str, np.ndarray], output_names: Optional[List[str]] = None) -> Dict[str, np.ndarray]:
+        """Run the model on a pooled session; safe to call from many threads."""
+        with self.session() as session:
+            names = output_names or [o.name for o in session.get_outputs()]
+            outputs = session.run(names, feeds)
+        with self._lock:
+            self._stats["runs"] += 1
+        return dict(zip(names, outputs))
+
+    def probe(self, session) -> bool:
+        """Run a tiny synthetic input through a session (always healthy when probing is off)."""
+        if self._probe_feed is None:
+            return True
+        with self._lock:
+            self._stats["probes"] += 1
+        try:
+            session.run(None, self._probe_feed)
+            return True
+        except Exception as e:
+            logger.warning(f"Session probe failed for {self.model_path}: {e}")
+            return False
+
+    def health_check(self) -> Dict[str, int]:
+        """Probe every idle session and replace the ones that fail."""
+        checked = []
+        while True:
+            try:
+                checked.append(self._idle.get_nowait())
+            except queue.Empty:
+                break
+        failed = 0
+        for session in checked:
+            healthy = self.probe(session)
+            failed += not healthy
+            self.release(session, healthy)
+        return {"checked": len(checked), "failed": failed}
+
+    def _check_loop(self, interval: float):
+        while not self._closed.wait(interval):
+            result = self.health_check()
+            if result["failed"]:
+                logger.warning(f"Health check replaced {result['failed']} session(s) of {self.model_path}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._stats,
+                "size": self.size,
+                "sessions": self._created,
+                "idle": self._idle.qsize(),
+                "in_use": self._created - self._idle.qsize(),
+                "shared_initializers": len(self._initializers),
+                "shared_weights": self.weights.stats(),
+            }
+
+    def close(self):
+        self._closed.set()
+        if self._checker is not None:
+            self._checker.join(timeout=5)
+        while True:
+            try:
+                self._idle.get_nowait()
+            except queue.Empty:
+                break
+        with self._available:
+            self._created = 0
+            # Blocked callers wake up and see the pool is closed
+            self._available.notify_all()
@@ -0,0 +1,491 @@
+import copy
+import logging
+import os
+from typing import Optional, Dict, List, Tuple, Any, Callable
+
+import torch
+from torch import nn
+
+from services.convert_service import ConvertOnnxModel
+from services.prune_service import PruneModel
+from services.instrumentation import tracer
+from services.planner_service import planned_batch_size
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+TRAIN_MODES = ("qat", "lora")
+
+# Projection names adapted by default in LoRA mode (attention and MLP of
+# Llama/Qwen, BERT and GPT-2 style blocks)
+LORA_TARGETS = (
+    "q_proj", "k_proj", "v_proj", "o_proj", "gate_proj", "up_proj", "down_proj",
+    "query", "key", "value", "dense", "c_attn", "c_proj", "c_fc", "fc1", "fc2", "out_proj",
+)
+
+# ONNX QuantizeLinear only accepts these int8 ranges; symmetric weights use [-127, 127]
+# for the scale (like onnxruntime.quantization) and never reach -128.
+INT8_MIN, INT8_MAX = -128, 127
+
+
+class FakeQuantize(nn.Module):
+    """
+    Simulated int8 quantization matching ONNX Runtime's QDQ semantics.
+
+    Activations are per-tensor asymmetric with an EMA of the observed
+    min/max; weights are per-channel symmetric (zero point 0) and observed
+    from their current values on every step. Exported with the legacy
+    exporter, each instance becomes a QuantizeLinear/DequantizeLinear pair.
+    """
+
+    def __init__(self, axis: Optional[int] = None, symmetric: bool = False, momentum: float = 0.01):
+        super().__init__()
+        self.axis = axis
+        self.symmetric = symmetric
+        self.momentum = momentum
+        self.observe = True
+        self.enabled = False
+        self.frozen = False
+        self.register_buffer("min_val", torch.tensor([]))
+        self.register_buffer("max_val", torch.tensor([]))
+        self.register_buffer("scale", torch.tensor([]))
+        self.register_buffer("zero_point", torch.tensor([], dtype=torch.int32))
+
+    @torch.no_grad()
+    def _update(self, x: torch.Tensor):
+        if self.axis is None:
+            lo, hi = x.min().reshape(1), x.max().reshape(1)
+        else:
+            flat = x.transpose(0, self.axis).reshape(x.shape[self.axis], -1)
+            lo, hi = flat.min(dim=1).values, flat.max(dim=1).values
+        if self.min_val.numel() == 0 or self.axis is not None:
+            # Weights track their current values; activations start from the first batch
+            self.min_val, self.max_val = lo.float(), hi.float()
+        else:
+            self.min_val.lerp_(lo.float(), self.momentum)
+            self.max_val.lerp_(hi.float(), self.momentum)
+
+    def qparams(self) -> Tuple[torch.Tensor, torch.Tensor]:
+        """(scale, zero_point) from the observed range, 0-dim for per-tensor; the range always includes 0."""
+        lo = torch.clamp(self.min_val, max=0.0)
+        hi = torch.clamp(self.max_val, min=0.0)
+        if self.symmetric:
+            scale = torch.clamp(torch.maximum(-lo, hi) / INT8_MAX, min=1e-8)
+            zero_point = torch.zeros_like(scale, dtype=torch.int32)
+        else:
+            scale = torch.clamp((hi - lo) / (INT8_MAX - INT8_MIN), min=1e-8)
+            zero_point = torch.clamp(torch.round(INT8_MIN - lo / scale), INT8_MIN, INT8_MAX).to(torch.int32)
+        if self.axis is None:
+            return scale[0], zero_point[0]
+        return scale, zero_point
+
+    def freeze(self):
+        """Fix the current scale/zero point so export sees constants."""
+        with torch.no_grad():
+            self.scale, self.zero_point = self.qparams()
+        self.observe = False
+        self.frozen = True
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        if self.observe or self.min_val.numel() == 0:
+            self._update(x)
+        if not self.enabled:
+            return x
+        scale, zero_point = (self.scale, self.zero_point) if self.frozen else self.qparams()
+        if self.axis is None:
+            return torch.fake_quantize_per_tensor_affine(x, scale, zero_point, INT8_MIN, INT8_MAX)
+        return torch.fake_quantize_per_channel_affine(x, scale, zero_point, self.axis, INT8_MIN, INT8_MAX)
+
+
+class QuantWrapper(nn.Module):
+    """
+    Runs a Linear/Conv/Conv1D layer on fake-quantized input, weight and output.
+
+    The wrapped layer keeps its parameters, so the optimizer trains them
+    through the straight-through estimator of the fake-quant ops.
+    """
+
+    def __init__(self, layer: nn.Module, weight_axis: int, quantize_output: bool = True):
+        super().__init__()
+        self.layer = layer
+        self.input_quant = FakeQuantize()
+        self.weight_quant = FakeQuantize(axis=weight_axis, symmetric=True)
+        self.output_quant = FakeQuantize() if quantize_output else None
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        layer = self.layer
+        x = self.input_quant(x)
+        weight = self.weight_quant(layer.weight)
+        if isinstance(layer, nn.Linear):
+            out = nn.functional.linear(x, weight, layer.bias)
+        elif isinstance(layer, (nn.Conv1d, nn.Conv2d, nn.Conv3d)):
+            out = layer._conv_forward(x, weight, layer.bias)
+        else:
+            # transformers Conv1D: weight is [in, out]
+            out = torch.addmm(layer.bias, x.reshape(-1, x.shape[-1]), weight)
+            out = out.reshape(*x.shape[:-1], weight.shape[-1])
+        return self.output_quant(out) if self.output_quant is not None else out
+
+
+class LoRALinear(nn.Module):
+    """
+    Frozen Linear/Conv1D layer plus a trainable low-rank update (LoRA).
+
+    y = base(x) + (alpha / r) * x A^T B^T, with B zero-initialized so
+    training starts from the base model. merge() folds the update into the
+    base weight and returns the plain layer.
+    """
+
+    def __init__(self, layer: nn.Module, rank: int = 8, alpha: float = 16.0, dropout: float = 0.0):
+        super().__init__()
+        self.layer = layer
+        # transformers Conv1D stores its weight as [in, out]
+        self.transposed = not isinstance(layer, nn.Linear)
+        out_features, in_features = layer.weight.shape[::-1] if self.transposed else layer.weight.shape
+        for p in layer.parameters():
+            p.requires_grad_(False)
+        self.lora_a = nn.Parameter(torch.empty(rank, in_features, dtype=layer.weight.dtype))
+        self.lora_b = nn.Parameter(torch.zeros(out_features, rank, dtype=layer.weight.dtype))
+        nn.init.kaiming_uniform_(self.lora_a, a=5 ** 0.5)
+        self.scaling = alpha / rank
+        self.dropout = nn.Dropout(dropout) if dropout > 0 else nn.Identity()
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        update = nn.functional.linear(nn.functional.linear(self.dropout(x), self.lora_a), self.lora_b)
+        return self.layer(x) + update * self.scaling
+
+    @torch.no_grad()
+    def merge(self) -> nn.Module:
+        delta = (self.lora_b @ self.lora_a) * self.scaling
+        self.layer.weight += delta.t() if self.transposed else delta
+        for p in self.layer.parameters():
+            p.requires_grad_(True)
+        return self.layer
+
+
+def _replace_module(model: nn.Module, name: str, module: nn.Module):
+    parent_name, _, attr = name.rpartition(".")
+    parent = model.get_submodule(parent_name) if parent_name else model
+    if attr.isdigit() and isinstance(parent, (nn.Sequential, nn.ModuleList)):
+        parent[int(attr)] = module
+    else:
+        setattr(parent, attr, module)
+
+
+class TrainModel:
+    """
+    Service to fine-tune eager PyTorch models before ONNX export.
+
+    Modes:
+    - qat: quantization-aware training. Linear/Conv layers are wrapped with
+      fake-quant ops matching ORT's QDQ scheme (per-channel int8 weights,
+      per-tensor int8 activations), the model is fine-tuned, and a QDQ ONNX
+      model is exported whose scales come from training instead of a
+      calibration run.
+    - lora: low-rank adapters on the attention/MLP projections are trained
+      while every base weight stays frozen (optimizer state only for the
+      adapters); before export the adapters are merged into the base
+      weights, so the ONNX graph is the plain architecture.
+    """
+
+    def __init__(self):
+        self.last_report: Dict[str, Any] = {}
+
+    def train(self,
+              input_path: str,
+              output_path: str,
+              mode: str = "qat",
+              data_path: Optional[str] = None,
+              input_shapes: Optional[str] = None,
+              steps: int = 200,
+              lr: float = 1e-5,
+              batch_size: int = 8,
+              calibration_steps: int = 16,
+              freeze_after: float = 0.8,
+              exclude: Optional[List[str]] = None,
+              lora_rank: int = 8,
+              lora_alpha: float = 16.0,
+              lora_dropout: float = 0.0,
+              lora_targets: Optional[List[str]] = None,
+              opset_version: int = 17,
+              exporter: str = "legacy",
+              dynamic: bool = False,
+              progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None) -> bool:
+        """
+        Fine-tune a PyTorch model and export it to ONNX.
+
+        Args:
+            input_path: Eager PyTorch model saved with torch.save (TorchScript cannot be retrained).
+            output_path: Destination .onnx path.
+            mode: Training mode; see TRAIN_MODES.
+            data_path: .pt/.npy/.npz training inputs (first axis = samples). An array or key named
+                'labels' is used as classification targets. Without it, qat distills the original
+                model's outputs and lora trains next-token prediction on the first (token id) input.
+            input_shapes: Input shapes for export when no data is given (e.g. "int64[1,128]").
+            steps: Optimizer steps.
+            lr: AdamW learning rate.
+            batch_size: Samples per step (0 = the model's planned training batch size, else 8).
+            calibration_steps: Forward passes that initialize activation ranges before
+                fake quantization is switched on.
+            freeze_after: Fraction of steps after which observed ranges stop moving, so
+                the weights adapt to the final scales.
+            exclude: Module name substrings left untouched (e.g. ["lm_head"]).
+            lora_rank: Rank r of the adapters.
+            lora_alpha: Adapter scaling numerator (update scaled by alpha / r).
+            lora_dropout: Dropout on the adapter input.
+            lora_targets: Module names (last path component) that get adapters; LORA_TARGETS by default.
+            opset_version: ONNX opset (qat needs at least 13 for per-channel QDQ).
+            exporter: ConvertOnnxModel exporter for lora ('legacy', 'dynamo', 'auto'); qat always
+                uses the legacy exporter, which translates fake-quant ops to QDQ.
+            dynamic: Export with dynamic batch/sequence dimensions.
+            progress_callback: Called with {"step", "steps", "loss"} after every step.
+
+        Returns:
+            True if the model was trained and exported.
+        """
+        if mode not in TRAIN_MODES:
+            raise ValueError(f"Unknown training mode: {mode}. Expected one of {TRAIN_MODES}")
+        if not os.path.exists(input_path):
+            logger.error(f"Input file not found: {input_path}")
+            raise FileNotFoundError(f"Input file not found: {input_path}")
+
+        converter = ConvertOnnxModel()
+        with tracer.span("train", mode=mode, input_path=input_path, output_path=output_path):
+            with tracer.span("load"):
+                model = converter._load_pytorch_model(input_path)
+            if isinstance(model, torch.jit.ScriptModule):
+                raise ValueError("Training requires an eager PyTorch model, not TorchScript.")
+
+            if not batch_size:
+                batch_size = planned_batch_size(input_path, "training") or 8
+                logger.info(f"Training batch size: {batch_size}")
+            batches, labels = self._load_batches(data_path, batch_size)
+            if batches:
+                dummy_input = tuple(t[:1] for t in batches[0])
+            else:
+                model.eval()
+                dummy_input = converter.prepare_dummy_input(model, input_shapes)
+                batches = [PruneModel()._load_samples(model, dummy_input, None)[0]]
+
+            report: Dict[str, Any] = {"mode": mode, "steps": steps, "batches": len(batches)}
+            if mode == "qat":
+                teacher = copy.deepcopy(model).eval() if labels is None else None
+                report.update(self._train_qat(model, teacher, batches, labels, steps, lr, calibration_steps,
+                                              freeze_after, exclude or [], progress_callback))
+                opset_version = max(opset_version, 13)
+                exporter = "legacy"
+            else:
+                report.update(self._train_lora(model, batches, labels, steps, lr, lora_rank, lora_alpha,
+                                               lora_dropout, lora_targets or list(LORA_TARGETS), exclude or [],
+                                               progress_callback))
+                # Merged before export: serving sees the plain architecture
+                report["merged_layers"] = self.merge_lora(model)
+                report["adapter_path"] = os.path.splitext(output_path)[0] + ".lora.pt"
+                torch.save(report.pop("adapters"), report["adapter_path"])
+
+            model.eval()
+            with tracer.span("export"):
+                converter.export_loaded(model, dummy_input, output_path, opset_version, exporter, dynamic)
+            report.update(converter.last_report)
+            report["onnx_max_abs_diff"] = self._compare_onnx(model, output_path, dummy_input)
+
+        self.last_report = report
+        logger.info(f"Training finished ({mode}): {output_path}")
+        return True
+
+    # ------------------------------------------------------------------
+    # Data
+    # ------------------------------------------------------------------
+
+    def _load_batches(self, data_path: Optional[str],
+                      batch_size: int) -> Tuple[List[Tuple[torch.Tensor, ...]], Optional[List[torch.Tensor]]]:
+        """Split a sample file into input batches (and label batches when present)."""
+        if not data_path:
+            logger.warning("No training data provided; fine-tuning on synthetic inputs (rough proxy only).")
+            return [], None
+        if not os.path.exists(data_path):
+            raise FileNotFoundError(f"Training data not found: {data_path}")
+
+        if data_path.endswith((".npy", ".npz")):
+            import numpy as np
+            data = np.load(data_path)
+            named = {k: torch.from_numpy(data[k]) for k in data.files} if hasattr(data, "files") else {"0": torch.from_numpy(data)}
+        else:
+            loaded = torch.load(data_path, map_location="cpu")
+            if isinstance(loaded, dict):
+                named = dict(loaded)
+            else:
+                items = list(loaded) if isinstance(loaded, (list, tuple)) else [loaded]
+                named = {str(i): t for i, t in enumerate(items)}
+
+        label_tensor = named.pop("labels", None)
+        inputs = list(named.values())
+        if not inputs:
+            raise ValueError(f"No input arrays in {data_path}")
+        rows = inputs[0].shape[0]
+        batches = [tuple(t[i:i + batch_size] for t in inputs) for i in range(0, rows, batch_size)]
+        labels = None
+        if label_tensor is not None:
+            labels = [label_tensor[i:i + batch_size].long() for i in range(0, rows, batch_size)]
+        return batches, labels
+
+    # ------------------------------------------------------------------
+    # Quantization-aware training
+    # ------------------------------------------------------------------
+
+    def _quantizable(self, module: nn.Module) -> Optional[int]:
+        """Per-channel axis of the output channels, or None if the layer is not quantized."""
+        if isinstance(module, (nn.Linear, nn.Conv1d, nn.Conv2d, nn.Conv3d)):
+            return 0
+        if type(module).__name__ == "Conv1D" and hasattr(module, "nf"):
+            return 1
+        return None
+
+    def prepare_qat(self, model: nn.Module, exclude: List[str]) -> List[str]:
+        """Wrap every quantizable layer in place; returns the wrapped module names."""
+        targets = []
+        for name, module in model.named_modules():
+            axis = self._quantizable(module)
+            if axis is None or any(pattern in name for pattern in exclude):
+                continue
+            targets.append((name, module, axis))
+
+        for name, module, axis in targets:
+            _replace_module(model, name, QuantWrapper(module, axis))
+        return [name for name, _module, _axis in targets]
+
+    @staticmethod
+    def _fake_quants(model: nn.Module) -> List[FakeQuantize]:
+        return [m for m in model.modules() if isinstance(m, FakeQuantize)]
+
+    def _loss(self, model, teacher, batch, labels) -> torch.Tensor:
+        output = PruneModel._primary_output(model(*batch)).float()
+        if labels is not None:
+            return nn.functional.cross_entropy(output.reshape(-1, output.shape[-1]), labels.reshape(-1))
+        if teacher is None:
+            # Language modeling: position t predicts token t + 1 of the first input
+            input_ids = batch[0]
+            if input_ids.is_floating_point() or output.ndim != 3 or output.shape[:2] != input_ids.shape[:2]:
+                raise ValueError("Without labels, fine-tuning needs a causal LM (token ids in, logits out).")
+            return nn.functional.cross_entropy(output[:, :-1].reshape(-1, output.shape[-1]),
+                                               input_ids[:, 1:].reshape(-1).long())
+        with torch.no_grad():
+            target = PruneModel._primary_output(teacher(*batch)).float()
+        return nn.functional.mse_loss(output, target)
+
+    def _train_qat(self, model, teacher, batches, labels, steps, lr, calibration_steps, freeze_after,
+                   exclude, progress_callback) -> Dict[str, Any]:
+        wrapped = self.prepare_qat(model, exclude)
+        if not wrapped:
+            raise ValueError("No Linear/Conv layers to quantize.")
+        quants = self._fake_quants(model)
+        logger.info(f"QAT: fake-quantizing {len(wrapped)} layers")
+
+        # Range initialization: observe activations in float before simulating int8
+        with tracer.span("qat_calibrate"), torch.no_grad():
+            model.eval()
+            for i in range(max(1, calibration_steps)):
+                model(*batches[i % len(batches)])
+        for q in quants:
+            q.enabled = True
+
+        freeze_step = int(steps * freeze_after)
+
+        def freeze_ranges(step: int):
+            if step == freeze_step:
+                for q in quants:
+                    if q.axis is None:
+                        q.observe = False
+
+        with tracer.span("qat_finetune", steps=steps):
+            loss_value = self._finetune(model, teacher, batches, labels, steps, lr, progress_callback, freeze_ranges)
+        for q in quants:
+            q.freeze()
+        return {"quantized_layers": len(wrapped), "fake_quant_ops": len(quants), "final_loss": loss_value}
+
+    def _finetune(self, model, teacher, batches, labels, steps, lr, progress_callback,
+                  before_step: Optional[Callable[[int], None]] = None) -> float:
+        """AdamW over the trainable parameters only; returns the last loss."""
+        params = [p for p in model.parameters() if p.requires_grad and p.is_floating_point()]
+        optimizer = torch.optim.AdamW(params, lr=lr)
+        loss_value = 0.0
+        model.train()
+        for step in range(steps):
+            if before_step:
+                before_step(step)
+            i = step % len(batches)
+            loss = self._loss(model, teacher, batches[i], labels[i] if labels is not None else None)
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            loss_value = float(loss)
+            if progress_callback:
+                progress_callback({"step": step + 1, "steps": steps, "loss": loss_value})
+            logger.debug(f"Train step {step + 1}/{steps}: loss={loss_value:.6f}")
+        model.eval()
+        return loss_value
+
+    # ------------------------------------------------------------------
+    # LoRA
+    # ------------------------------------------------------------------
+
+    def prepare_lora(self, model: nn.Module, targets: List[str], exclude: List[str],
+                     rank: int = 8, alpha: float = 16.0, dropout: float = 0.0) -> List[str]:
+        """Freeze the model and attach adapters to matching projections; returns the adapted names."""
+        for p in model.parameters():
+            p.requires_grad_(False)
+        matches = []
+        for name, module in model.named_modules():
+            adaptable = isinstance(module, nn.Linear) or (type(module).__name__ == "Conv1D" and hasattr(module, "nf"))
+            if adaptable and name.rpartition(".")[2] in targets and not any(p in name for p in exclude):
+                matches.append((name, module))
+        for name, module in matches:
+            _replace_module(model, name, LoRALinear(module, rank, alpha, dropout))
+        return [name for name, _module in matches]
+
+    def merge_lora(self, model: nn.Module) -> int:
+        """Fold every adapter into its base weight and restore the original modules."""
+        adapters = [(name, m) for name, m in model.named_modules() if isinstance(m, LoRALinear)]
+        for name, adapter in adapters:
+            _replace_module(model, name, adapter.merge())
+        return len(adapters)
+
+    def _train_lora(self, model, batches, labels, steps, lr, rank, alpha, dropout, targets, exclude,
+                    progress_callback) -> Dict[str, Any]:
+        total = sum(p.numel() for p in model.parameters())
+        adapted = self.prepare_lora(model, targets, exclude, rank, alpha, dropout)
+        if not adapted:
+            raise ValueError(f"No Linear layers named {targets} to adapt.")
+        trainable = sum(p.numel() for p in model.parameters() if p.requires_grad)
+        logger.info(f"LoRA: {len(adapted)} adapters (r={rank}), {trainable:,} trainable of {total:,} parameters")
+
+        with tracer.span("lora_finetune", steps=steps, trainable=trainable):
+            loss_value = self._finetune(model, None, batches, labels, steps, lr, progress_callback)
+        return {
+            "adapted_layers": len(adapted),
+            "trainable_params": trainable,
+            "total_params": total,
+            # AdamW keeps two fp32 moments per trainable parameter
+            "optimizer_state_bytes": 2 * 4 * trainable,
+            "final_loss": loss_value,
+            "adapters": {k: v.detach().clone() for k, v in model.state_dict().items() if ".lora_" in k},
+        }
+
+    def _compare_onnx(self, model: nn.Module, output_path: str, dummy_input: Tuple[torch.Tensor, ...]) -> Optional[float]:
+        """Max abs difference between the fake-quant model and the exported QDQ model, if ORT is available."""
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            return None
+        try:
+            session = ort.InferenceSession(output_path, providers=["CPUExecutionProvider"])
+            feeds = {i.name: t.numpy() for i, t in zip(session.get_inputs(), dummy_input)}
+            onnx_out = session.run(None, feeds)[0]
+            with torch.no_grad():
+                torch_out = PruneModel._primary_output(model(*dummy_input)).float().numpy()
+            diff = float(abs(onnx_out.astype("float32") - torch_out).max())
+            logger.info(f"Exported QDQ model vs. fake-quant PyTorch: max abs diff {diff:.6f}")
+            return diff
+        except Exception as e:
+            logger.warning(f"Could not compare the exported model with PyTorch: {e}")
+            return None
@@ -2,7 +2,8 @@ import logging
 import os
 from typing import Optional
 from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTModelForSequenceClassification
-from transformers import AutoConfig
+from transformers import AutoConfig, AutoTokenizer
+from services.instrumentation import tracer
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -43,14 +44,24 @@ class TransformersService:
             
             logger.info(f"Detected/Using task: {task}")
             
-            if task == "feature-extraction":
-                model = ORTModelForFeatureExtraction.from_pretrained(model_id, export=True)
-            elif task == "text-classification":
-                 model = ORTModelForSequenceClassification.from_pretrained(model_id, export=True)
-            else:
-                model = ORTModelForFeatureExtraction.from_pretrained(model_id, export=True)
-
-            model.save_pretrained(export_dir) 
+            with tracer.span("hf_export", model_id=model_id, task=task):
+                # Download, trace and ONNX export all happen inside from_pretrained(export=True)
+                with tracer.span("download_export"):
+                    if task == "feature-extraction":
+                        model = ORTModelForFeatureExtraction.from_pretrained(model_id, export=True)
+                    elif task == "text-classification":
+                         model = ORTModelForSequenceClassification.from_pretrained(model_id, export=True)
+                    else:
+                        model = ORTModelForFeatureExtraction.from_pretrained(model_id, export=True)
+
+                with tracer.span("save"):
+                    model.save_pretrained(export_dir) 
+
+                    # Save the tokenizer alongside so the exported model can be consumed directly
+                    try:
+                        AutoTokenizer.from_pretrained(model_id).save_pretrained(export_dir)
+                    except Exception as e:
+                        logger.warning(f"Could not save tokenizer for {model_id}: {str(e)}")
 
             logger.info(f"Successfully converted {model_id}")
             return True
@@ -0,0 +1,295 @@
+import json
+import logging
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Rows scored per block during brute-force search; bounds temporary memory.
+SEARCH_BLOCK_ROWS = 65536
+
+
+class VectorStore:
+    """
+    Compact vector index for embeddings.
+
+    Vectors live in one contiguous float32/float16 matrix, memory-mapped from
+    disk when a directory is given, so collections of millions of vectors can
+    be searched without loading them fully into RAM. Search is vectorized
+    brute-force top-k by default; `build_ivf` adds an IVF-style coarse
+    partitioning that only scores the `nprobe` closest partitions.
+
+    Metrics: 'cosine' (vectors are normalized on add) or 'ip' (inner product).
+    """
+
+    def __init__(self,
+                 dim: int,
+                 path: Optional[str] = None,
+                 dtype: str = "float32",
+                 metric: str = "cosine",
+                 initial_capacity: int = 1024):
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"Unsupported dtype: {dtype}")
+        if metric not in ("cosine", "ip"):
+            raise ValueError(f"Unsupported metric: {metric}")
+
+        self.dim = dim
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.metric = metric
+        self.count = 0
+        self.centroids: Optional[np.ndarray] = None
+        self._ivf_order: Optional[np.ndarray] = None
+        self._ivf_offsets: Optional[np.ndarray] = None
+
+        if path:
+            os.makedirs(path, exist_ok=True)
+        self.vectors = self._allocate("vectors", (initial_capacity, dim), self.dtype)
+        self.ids = self._allocate("ids", (initial_capacity,), np.dtype(np.int64))
+        self.assignments: Optional[np.ndarray] = None
+
+    # ------------------------------------------------------------------
+    # Storage
+    # ------------------------------------------------------------------
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, f"{name}.npy")
+
+    def _allocate(self, name, shape, dtype, existing: Optional[np.ndarray] = None) -> np.ndarray:
+        if not self.path:
+            array = np.zeros(shape, dtype=dtype)
+            if existing is not None:
+                array[:len(existing)] = existing
+            return array
+
+        # Grow through a temporary file so the old map stays valid while copying.
+        target = self._file(name)
+        tmp = target + ".tmp" if existing is not None else target
+        array = np.lib.format.open_memmap(tmp, mode="w+", dtype=dtype, shape=shape)
+        if existing is not None:
+            array[:len(existing)] = existing
+            array.flush()
+            del existing
+            os.replace(tmp, target)
+            array = np.lib.format.open_memmap(target, mode="r+")
+        return array
+
+    def _reserve(self, extra: int):
+        needed = self.count + extra
+        capacity = self.vectors.shape[0]
+        if needed <= capacity:
+            return
+        # Stores saved or loaded empty have zero capacity, which doubling never grows
+        capacity = max(capacity, 1)
+        while capacity < needed:
+            capacity *= 2
+        self.vectors = self._allocate("vectors", (capacity, self.dim), self.dtype, self.vectors[:self.count])
+        self.ids = self._allocate("ids", (capacity,), np.dtype(np.int64), self.ids[:self.count])
+        if self.assignments is not None:
+            self.assignments = self._allocate("assignments", (capacity,), np.dtype(np.int32), self.assignments[:self.count])
+
+    def __len__(self) -> int:
+        return self.count
+
+    # ------------------------------------------------------------------
+    # Adding and searching
+    # ------------------------------------------------------------------
+
+    def _prepare(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected vectors of dim {self.dim}, got {vectors.shape[1]}")
+        if self.metric == "cosine":
+            vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors
+
+    def add(self, vectors: np.ndarray, ids: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Append vectors (incremental; an existing IVF index is kept up to date).
+
+        Returns:
+            The ids of the added vectors (sequential when not given).
+        """
+        vectors = self._prepare(vectors)
+        n = len(vectors)
+        if ids is None:
+            ids = np.arange(self.count, self.count + n, dtype=np.int64)
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(ids) != n:
+            raise ValueError("ids and vectors must have the same length")
+
+        self._reserve(n)
+        self.vectors[self.count:self.count + n] = vectors.astype(self.dtype)
+        self.ids[self.count:self.count + n] = ids
+        if self.centroids is not None:
+            self.assignments[self.count:self.count + n] = self._assign(vectors)
+            self._ivf_order = None  # rebuilt lazily on the next search
+        self.count += n
+        return ids
+
+    def search(self, queries: np.ndarray, k: int = 10, nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the top-k most similar vectors.
+
+        Args:
+            queries: [n, dim] or [dim] query vectors.
+            k: Number of results per query.
+            nprobe: Partitions to scan when an IVF index exists (None = brute force).
+
+        Returns:
+            (scores [n, k], ids [n, k]); missing results have id -1.
+        """
+        queries = self._prepare(queries)
+        k = min(k, self.count)
+        if k == 0:
+            return np.zeros((len(queries), 0), np.float32), np.zeros((len(queries), 0), np.int64)
+
+        if nprobe and self.centroids is not None:
+            return self._search_ivf(queries, k, nprobe)
+
+        best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        best_rows = np.full((len(queries), k), -1, dtype=np.int64)
+        for start in range(0, self.count, SEARCH_BLOCK_ROWS):
+            block = np.asarray(self.vectors[start:min(start + SEARCH_BLOCK_ROWS, self.count)], dtype=np.float32)
+            scores = queries @ block.T
+            rows = np.broadcast_to(np.arange(start, start + len(block)), scores.shape)
+            best_scores, best_rows = self._merge_top_k(best_scores, best_rows, scores, rows, k)
+        return best_scores, self._rows_to_ids(best_rows)
+
+    @staticmethod
+    def _merge_top_k(best_scores, best_rows, scores, rows, k):
+        scores = np.concatenate([best_scores, scores], axis=1)
+        rows = np.concatenate([best_rows, rows], axis=1)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        return np.take_along_axis(top_scores, order, axis=1), np.take_along_axis(np.take_along_axis(rows, top, axis=1), order, axis=1)
+
+    def _rows_to_ids(self, rows: np.ndarray) -> np.ndarray:
+        ids = np.where(rows >= 0, self.ids[np.maximum(rows, 0)], -1)
+        return ids.astype(np.int64)
+
+    # ------------------------------------------------------------------
+    # IVF coarse index
+    # ------------------------------------------------------------------
+
+    def build_ivf(self, n_lists: Optional[int] = None, iterations: int = 10, train_size: int = 100000, seed: int = 0):
+        """
+        Train coarse centroids with k-means on a sample and partition all vectors.
+
+        Args:
+            n_lists: Number of partitions (defaults to ~sqrt(N)).
+            iterations: k-means iterations.
+            train_size: Maximum number of vectors sampled for training.
+        """
+        if self.count == 0:
+            raise ValueError("Cannot build an IVF index on an empty store.")
+        n_lists = n_lists or max(1, int(np.sqrt(self.count)))
+        n_lists = min(n_lists, self.count)
+
+        rng = np.random.default_rng(seed)
+        sample_rows = np.sort(rng.choice(self.count, size=min(train_size, self.count), replace=False))
+        sample = np.asarray(self.vectors[sample_rows], dtype=np.float32)
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=n_lists)[:, None]
+            empty = counts[:, 0] == 0
+            centroids = np.where(empty[:, None], centroids, sums / np.maximum(counts, 1))
+            if self.metric == "cosine":
+                centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+
+        self.centroids = centroids.astype(np.float32)
+        self.assignments = self._allocate("assignments", (self.vectors.shape[0],), np.dtype(np.int32))
+        for start in range(0, self.count, SEARCH_BLOCK_ROWS):
+            stop = min(start + SEARCH_BLOCK_ROWS, self.count)
+            self.assignments[start:stop] = self._assign(np.asarray(self.vectors[start:stop], dtype=np.float32))
+        self._ivf_order = None
+        logger.info(f"Built IVF index with {n_lists} lists over {self.count} vectors")
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        return np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32)
+
+    def _ensure_ivf_order(self):
+        if self._ivf_order is None:
+            assignments = np.asarray(self.assignments[:self.count])
+            self._ivf_order = np.argsort(assignments, kind="stable")
+            counts = np.bincount(assignments, minlength=len(self.centroids))
+            self._ivf_offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    def _search_ivf(self, queries, k, nprobe):
+        self._ensure_ivf_order()
+        nprobe = min(nprobe, len(self.centroids))
+        probes = np.argsort(-(queries @ self.centroids.T), axis=1)[:, :nprobe]
+
+        all_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        all_rows = np.full((len(queries), k), -1, dtype=np.int64)
+        for qi, lists in enumerate(probes):
+            rows = np.concatenate([self._ivf_order[self._ivf_offsets[l]:self._ivf_offsets[l + 1]] for l in lists])
+            if len(rows) == 0:
+                continue
+            rows.sort()  # sequential access into the memory map
+            scores = np.asarray(self.vectors[rows], dtype=np.float32) @ queries[qi]
+            top = min(k, len(rows))
+            idx = np.argpartition(-scores, top - 1)[:top]
+            idx = idx[np.argsort(-scores[idx])]
+            all_scores[qi, :top] = scores[idx]
+            all_rows[qi, :top] = rows[idx]
+        return all_scores, self._rows_to_ids(all_rows)
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def save(self, path: Optional[str] = None):
+        """Persist the store; in-memory stores are written to `path`."""
+        target = path or self.path
+        if not target:
+            raise ValueError("A path is required to save an in-memory store.")
+        os.makedirs(target, exist_ok=True)
+
+        if target != self.path:
+            np.save(os.path.join(target, "vectors.npy"), np.asarray(self.vectors[:self.count]))
+            np.save(os.path.join(target, "ids.npy"), np.asarray(self.ids[:self.count]))
+            if self.assignments is not None:
+                np.save(os.path.join(target, "assignments.npy"), np.asarray(self.assignments[:self.count]))
+        else:
+            for array in (self.vectors, self.ids, self.assignments):
+                if isinstance(array, np.memmap):
+                    array.flush()
+
+        if self.centroids is not None:
+            np.save(os.path.join(target, "centroids.npy"), self.centroids)
+        meta = {"dim": self.dim, "dtype": self.dtype.name, "metric": self.metric, "count": self.count}
+        with open(os.path.join(target, "meta.json"), "w") as f:
+            json.dump(meta, f, indent=2)
+        logger.info(f"Saved vector store ({self.count} vectors) to {target}")
+
+    @classmethod
+    def load(cls, path: str, mode: str = "r+") -> "VectorStore":
+        """Open a saved store memory-mapped (use mode='r' for read-only)."""
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            meta = json.load(f)
+
+        store = cls.__new__(cls)
+        store.dim = meta["dim"]
+        store.path = path
+        store.dtype = np.dtype(meta["dtype"])
+        store.metric = meta["metric"]
+        store.count = meta["count"]
+        store.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode=mode)
+        store.ids = np.load(os.path.join(path, "ids.npy"), mmap_mode=mode)
+
+        centroids = os.path.join(path, "centroids.npy")
+        assignments = os.path.join(path, "assignments.npy")
+        store.centroids = np.load(centroids) if os.path.exists(centroids) else None
+        store.assignments = np.load(assignments, mmap_mode=mode) if store.centroids is not None else None
+        store._ivf_order = None
+        store._ivf_offsets = None
+        return store
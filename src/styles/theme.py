@@ -180,3 +180,24 @@ CHECKBOX_STYLE = f"""
         image: url(none); /* We don't have an image, relying on color */
     }}
 """
+
+TABLE_STYLE = f"""
+    QTableWidget {{
+        background-color: {INPUT_BG};
+        color: {TEXT_COLOR};
+        border: 1px solid {BORDER_COLOR};
+        border-radius: 4px;
+        gridline-color: {BORDER_COLOR};
+    }}
+    QHeaderView::section {{
+        background-color: {PANEL_BG};
+        color: {TEXT_SECONDARY};
+        border: none;
+        border-bottom: 1px solid {BORDER_COLOR};
+        padding: 6px;
+        font-weight: bold;
+    }}
+    QTableWidget::item:selected {{
+        background-color: {ACCENT_BLUE};
+    }}
+"""
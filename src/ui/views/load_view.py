@@ -1,18 +1,30 @@
+import os
+import numpy as np
 from PyQt6.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QLabel, QFrame, 
-    QLineEdit, QPushButton, QTextEdit, QFileDialog
+    QLineEdit, QPushButton, QTextEdit, QFileDialog, QComboBox
 )
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, QThread, pyqtSignal
 from src.styles.theme import (
     OPTIMIZE_VIEW_STYLE, CARD_STYLE, GROUP_TITLE_STYLE, 
     INPUT_STYLE, BUTTON_PRIMARY_STYLE, TEXT_SECONDARY, 
     ACCENT_BLUE, INPUT_BG
 )
+from services.inference_server import InferenceServer
+from services.inference_service import InferenceService
+from services.generation_service import GenerationService
+from services.bulk_inference_service import BulkInference, BULK_TASKS
 
 class LoadView(QWidget):
     def __init__(self):
         super().__init__()
         self.setStyleSheet(OPTIMIZE_VIEW_STYLE)
+
+        # State
+        self.server = None
+        self.inference = None
+        self.generator = None
+        self.bulk_worker = None
         
         # Main Layout
         main_layout = QVBoxLayout(self)
@@ -39,6 +51,13 @@ class LoadView(QWidget):
         file_row.addWidget(self.file_input, 1)
         file_row.addWidget(browse_btn)
         load_layout.addLayout(file_row)
+
+        # Optional draft decoder for speculative decoding
+        draft_row = QHBoxLayout()
+        self.draft_input = self.create_labeled_input(draft_row, "Draft Model (optional, decoders only)", "")
+        self.draft_input.setPlaceholderText("Small .onnx decoder sharing the tokenizer")
+        self.draft_tokens_input = self.create_labeled_input(draft_row, "Draft Tokens", "4")
+        load_layout.addLayout(draft_row)
         
         load_btn = QPushButton("LOAD MODEL")
         load_btn.setCursor(Qt.CursorShape.PointingHandCursor)
@@ -86,6 +105,70 @@ class LoadView(QWidget):
         test_layout.addWidget(self.test_output)
         
         main_layout.addWidget(test_card)
+
+        # 3. Serve Section
+        serve_card, serve_layout = self.create_card()
+        serve_layout.addWidget(self.create_group_title("Serve Model (Local)"))
+
+        serve_row = QHBoxLayout()
+        self.port_input = self.create_labeled_input(serve_row, "Port", "8080")
+        self.max_batch_input = self.create_labeled_input(serve_row, "Max Batch Size", "8")
+        self.max_latency_input = self.create_labeled_input(serve_row, "Max Latency (ms)", "5")
+        serve_layout.addLayout(serve_row)
+
+        self.serve_btn = QPushButton("START SERVER")
+        self.serve_btn.setCursor(Qt.CursorShape.PointingHandCursor)
+        self.serve_btn.setStyleSheet(BUTTON_PRIMARY_STYLE)
+        self.serve_btn.clicked.connect(self.toggle_server)
+        serve_layout.addWidget(self.serve_btn)
+
+        self.serve_status = QLabel("Status: Server stopped")
+        self.serve_status.setStyleSheet(f"color: {TEXT_SECONDARY}; font-size: 12px;")
+        serve_layout.addWidget(self.serve_status)
+
+        main_layout.addWidget(serve_card)
+
+        # 4. Bulk Inference Section
+        bulk_card, bulk_layout = self.create_card()
+        bulk_layout.addWidget(self.create_group_title("Bulk Inference (JSONL)"))
+
+        bulk_file_row = QHBoxLayout()
+        self.bulk_input = self.create_labeled_input(bulk_file_row, "Input JSONL", "")
+        self.bulk_input.setPlaceholderText('One record per line, e.g. {"id": 1, "text": "..."}')
+        bulk_browse_btn = QPushButton("Browse")
+        bulk_browse_btn.setCursor(Qt.CursorShape.PointingHandCursor)
+        bulk_browse_btn.setStyleSheet(f"background-color: {ACCENT_BLUE}; color: white; border: none; padding: 5px 10px; border-radius: 4px;")
+        bulk_browse_btn.clicked.connect(self.browse_bulk_input)
+        bulk_file_row.addWidget(bulk_browse_btn, 0, Qt.AlignmentFlag.AlignBottom)
+        self.bulk_output = self.create_labeled_input(bulk_file_row, "Output JSONL", "")
+        bulk_layout.addLayout(bulk_file_row)
+
+        bulk_row = QHBoxLayout()
+        task_col = QVBoxLayout()
+        task_label = QLabel("Task")
+        task_label.setStyleSheet(f"color: {TEXT_SECONDARY}; font-size: 12px;")
+        self.bulk_task_combo = QComboBox()
+        self.bulk_task_combo.addItems(list(BULK_TASKS))
+        self.bulk_task_combo.setStyleSheet(INPUT_STYLE)
+        task_col.addWidget(task_label)
+        task_col.addWidget(self.bulk_task_combo)
+        bulk_row.addLayout(task_col, 1)
+        self.bulk_workers_input = self.create_labeled_input(bulk_row, "Workers (0 = auto)", "0")
+        self.bulk_threads_input = self.create_labeled_input(bulk_row, "Threads / Worker (0 = auto)", "0")
+        self.bulk_chunk_input = self.create_labeled_input(bulk_row, "Chunk Size", "256")
+        bulk_layout.addLayout(bulk_row)
+
+        self.bulk_btn = QPushButton("RUN BULK JOB")
+        self.bulk_btn.setCursor(Qt.CursorShape.PointingHandCursor)
+        self.bulk_btn.setStyleSheet(BUTTON_PRIMARY_STYLE)
+        self.bulk_btn.clicked.connect(self.run_bulk)
+        bulk_layout.addWidget(self.bulk_btn)
+
+        self.bulk_status = QLabel("Status: Idle (interrupted jobs resume from their checkpoint)")
+        self.bulk_status.setStyleSheet(f"color: {TEXT_SECONDARY}; font-size: 12px;")
+        bulk_layout.addWidget(self.bulk_status)
+
+        main_layout.addWidget(bulk_card)
         main_layout.addStretch()
 
     def create_card(self):
@@ -101,22 +184,186 @@ class LoadView(QWidget):
         label.setStyleSheet(GROUP_TITLE_STYLE)
         return label
 
+    def create_labeled_input(self, row, text, default):
+        col = QVBoxLayout()
+        label = QLabel(text)
+        label.setStyleSheet(f"color: {TEXT_SECONDARY}; font-size: 12px;")
+        edit = QLineEdit(default)
+        edit.setStyleSheet(INPUT_STYLE)
+        col.addWidget(label)
+        col.addWidget(edit)
+        row.addLayout(col, 1)
+        return edit
+
     def browse_model_file(self):
         file_path, _ = QFileDialog.getOpenFileName(self, "Select Model File", "", "Model Files (*.pt *.pth *.onnx *.pb *.h5)")
         if file_path:
             self.file_input.setText(file_path)
 
     def load_model(self):
-        # Mock load logic
-        if self.file_input.text():
-            self.load_status.setText(f"Status: Model loaded from {self.file_input.text()}")
-        else:
+        model_path = self.file_input.text()
+        if not model_path:
             self.load_status.setText("Status: Error - No file selected")
+            return
+        if not model_path.endswith(".onnx"):
+            self.load_status.setText("Status: Error - Only .onnx models can be tested")
+            return
+
+        self.inference = None
+        self.generator = None
+        try:
+            service = InferenceService()
+            service.load(model_path)
+            if GenerationService.is_decoder(service.session):
+                self.generator = GenerationService()
+                # Reuse the session loaded above instead of building a second one
+                self.generator.attach(service)
+                kind = "decoder (generation)"
+                draft_path = self.draft_input.text().strip()
+                if draft_path:
+                    self.generator.load_draft(draft_path)
+                    kind += " + draft"
+            else:
+                self.inference = service
+                kind = "encoder/classifier"
+            self.load_status.setText(f"Status: Loaded {kind} model from {model_path}")
+        except Exception as e:
+            self.load_status.setText(f"Status: Error - {str(e)}")
 
     def run_inference(self):
-        # Mock inference logic
         input_text = self.test_input.toPlainText()
-        if input_text:
-            self.test_output.setText(f"Simulated output for: '{input_text}'")
-        else:
+        if not input_text:
             self.test_output.setText("Please enter input text.")
+            return
+        if self.inference is None and self.generator is None:
+            self.test_output.setText("Please load a model first.")
+            return
+
+        try:
+            if self.generator is not None:
+                num_draft = int(self.draft_tokens_input.text() or 0) if self.generator.draft is not None else 0
+                if self.generator.tokenizer is None:
+                    prompt_ids = [int(t) for t in input_text.replace(",", " ").split()]
+                    result = self.generator.generate(prompt_ids, num_draft_tokens=num_draft)
+                    text = " ".join(str(t) for t in result["tokens"])
+                else:
+                    prompt_ids = self.generator.tokenizer(input_text)["input_ids"]
+                    result = self.generator.generate(prompt_ids, eos_token_id=self.generator.tokenizer.eos_token_id,
+                                                     num_draft_tokens=num_draft)
+                    text = self.generator.tokenizer.decode(result["tokens"], skip_special_tokens=True)
+                stats = (f"{len(result['tokens'])} tokens, "
+                         f"TTFT {result['time_to_first_token_ms']:.1f} ms, "
+                         f"{result['tokens_per_second']:.1f} tokens/s")
+                if "acceptance_rate" in result:
+                    stats += f", draft acceptance {result['acceptance_rate']:.0%}"
+                self.test_output.setText(f"{text}\n\n[{stats}]")
+                return
+
+            feeds = self.inference.feeds_from_text(input_text)
+            # IOBinding path: outputs are views into reused buffers, so format them right away.
+            outputs = self.inference.run_bound(feeds)
+            lines = []
+            for name, value in outputs.items():
+                preview = np.array2string(value.ravel()[:8], precision=4, separator=", ")
+                lines.append(f"{name} {list(value.shape)}: {preview}{' ...' if value.size > 8 else ''}")
+            self.test_output.setText("\n".join(lines))
+        except Exception as e:
+            self.test_output.setText(f"Error: {str(e)}")
+
+    def toggle_server(self):
+        if self.server is not None:
+            self.server.stop()
+            self.server = None
+            self.serve_btn.setText("START SERVER")
+            self.serve_status.setText("Status: Server stopped")
+            return
+
+        model_path = self.file_input.text()
+        if not model_path.endswith(".onnx"):
+            self.serve_status.setText("Status: Error - Select an .onnx model to serve")
+            return
+
+        try:
+            name = os.path.splitext(os.path.basename(model_path))[0]
+            self.server = InferenceServer(
+                {name: model_path},
+                port=int(self.port_input.text()),
+                max_batch_size=int(self.max_batch_input.text()),
+                max_latency_ms=float(self.max_latency_input.text()),
+            )
+            self.server.start()
+            self.serve_btn.setText("STOP SERVER")
+            self.serve_status.setText(f"Status: Serving '{name}' at {self.server.address}/v1/models/{name}/infer")
+        except Exception as e:
+            self.server = None
+            self.serve_status.setText(f"Status: Error - {str(e)}")
+
+    class BulkWorker(QThread):
+        progress_signal = pyqtSignal(dict)
+        finished_signal = pyqtSignal(bool, object)
+
+        def __init__(self, kwargs):
+            super().__init__()
+            self.kwargs = kwargs
+
+        def run(self):
+            try:
+                summary = BulkInference().run(progress_callback=self.progress_signal.emit, **self.kwargs)
+                self.finished_signal.emit(True, summary)
+            except Exception as e:
+                self.finished_signal.emit(False, str(e))
+
+    def browse_bulk_input(self):
+        file_path, _ = QFileDialog.getOpenFileName(self, "Select Input JSONL", "", "JSON Lines (*.jsonl *.json)")
+        if file_path:
+            self.bulk_input.setText(file_path)
+            if not self.bulk_output.text():
+                self.bulk_output.setText(os.path.splitext(file_path)[0] + ".results.jsonl")
+
+    def run_bulk(self):
+        if self.bulk_worker is not None and self.bulk_worker.isRunning():
+            self.bulk_status.setText("Status: A bulk job is already running")
+            return
+        model_path = self.file_input.text()
+        input_path = self.bulk_input.text()
+        output_path = self.bulk_output.text()
+        if not model_path or not input_path or not output_path:
+            self.bulk_status.setText("Status: Error - Select a model, an input and an output file")
+            return
+
+        try:
+            kwargs = {
+                "input_path": input_path,
+                "output_path": output_path,
+                "model_path": model_path,
+                "task": self.bulk_task_combo.currentText(),
+                "workers": int(self.bulk_workers_input.text() or 0),
+                "threads_per_worker": int(self.bulk_threads_input.text() or 0),
+                "chunk_size": int(self.bulk_chunk_input.text() or 256),
+            }
+        except ValueError:
+            self.bulk_status.setText("Status: Error - Workers, threads and chunk size must be integers")
+            return
+
+        self.bulk_btn.setEnabled(False)
+        self.bulk_status.setText("Status: Starting workers...")
+        self.bulk_worker = self.BulkWorker(kwargs)
+        self.bulk_worker.progress_signal.connect(self.on_bulk_progress)
+        self.bulk_worker.finished_signal.connect(self.on_bulk_finished)
+        self.bulk_worker.start()
+
+    def on_bulk_progress(self, progress):
+        self.bulk_status.setText(
+            f"Status: {progress['records']} records ({progress['fraction']:.1%}), "
+            f"{progress['errors']} errors, {progress['records_per_second']:.1f} records/s"
+        )
+
+    def on_bulk_finished(self, success, result):
+        self.bulk_btn.setEnabled(True)
+        if success:
+            self.bulk_status.setText(
+                f"Status: Done - {result['records']} records, {result['errors']} errors "
+                f"(resumed from line {result['resumed_from']})"
+            )
+        else:
+            self.bulk_status.setText(f"Status: Error - {result}")
@@ -2,20 +2,25 @@ from PyQt6.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QLabel, QFrame, 
     QComboBox, QLineEdit, QPushButton, QRadioButton, 
     QApplication, QProgressBar, QCheckBox, QStackedLayout,
-    QFileDialog
+    QFileDialog, QTableWidget, QTableWidgetItem, QHeaderView
 )
 
-from PyQt6.QtCore import Qt, QThread, pyqtSignal
+from PyQt6.QtCore import Qt, QObject, QThread, pyqtSignal
 from src.styles.theme import (
     OPTIMIZE_VIEW_STYLE, CARD_STYLE, GROUP_TITLE_STYLE, 
     INPUT_STYLE, BUTTON_PRIMARY_STYLE, UPLOAD_WIDGET_STYLE, 
     TAB_BUTTON_STYLE, CHECKBOX_STYLE, TEXT_COLOR, TEXT_SECONDARY, ACCENT_BLUE,
-    PANEL_BG, BORDER_COLOR
+    PANEL_BG, BORDER_COLOR, TABLE_STYLE
 )
 from styles.theme import INPUT_BG 
 from services.convert_service import ConvertOnnxModel
 from services.quantize_service import QuantizeModel
 from services.transformers_service import TransformersService
+from services.ort_export_service import OptimizedModelExporter
+from services.benchmark_service import BenchmarkModel
+from services.profiling_service import OpProfiler
+from services.analyzer_service import ModelAnalyzer
+from services.instrumentation import tracer, format_event
 
 class OptimizeView(QWidget):
     def __init__(self):
@@ -26,10 +31,24 @@ class OptimizeView(QWidget):
         self.converter = ConvertOnnxModel()
         self.quantizer = QuantizeModel()
         self.transformers_service = TransformersService()
+        self.ort_exporter = OptimizedModelExporter()
+        self.benchmarker = BenchmarkModel()
+        self.op_profiler = OpProfiler()
+        self.analyzer = ModelAnalyzer()
         
         # State
         self.start_model_path = None
         self.calib_data_path = None
+        self.last_op_report = None
+        self.last_analysis = None
+        self.trace_label = None
+        self.task_worker = None
+        self.hf_worker = None
+
+        # Stage events arrive on worker threads; the bridge hands them to the GUI thread
+        self.trace_bridge = self.TraceBridge()
+        self.trace_bridge.event_signal.connect(self.on_trace_event)
+        self.unsubscribe_trace = tracer.subscribe(self.trace_bridge.event_signal.emit)
         
         # Main Layout: Vertical (Tabs on top, Content below)
         main_layout = QVBoxLayout(self)
@@ -44,9 +63,11 @@ class OptimizeView(QWidget):
         
         self.btn_convert = self.create_tab_button("Convert to ONNX", True)
         self.btn_quantize = self.create_tab_button("Quantize ONNX", False)
+        self.btn_benchmark = self.create_tab_button("Benchmark & Profile", False)
         
         self.tab_layout.addWidget(self.btn_convert)
         self.tab_layout.addWidget(self.btn_quantize)
+        self.tab_layout.addWidget(self.btn_benchmark)
         self.tab_layout.addStretch() # Push tabs to the left
         
         main_layout.addLayout(self.tab_layout)
@@ -61,12 +82,17 @@ class OptimizeView(QWidget):
         # Panel 2: Quantize
         self.quantize_panel = self.create_quantize_panel()
         self.stack.addWidget(self.quantize_panel)
+
+        # Panel 3: Benchmark & Profile
+        self.benchmark_panel = self.create_benchmark_panel()
+        self.stack.addWidget(self.benchmark_panel)
         
         main_layout.addLayout(self.stack)
         
         # Connect Tabs
         self.btn_convert.clicked.connect(lambda: self.switch_tab(0))
         self.btn_quantize.clicked.connect(lambda: self.switch_tab(1))
+        self.btn_benchmark.clicked.connect(lambda: self.switch_tab(2))
 
     def create_tab_button(self, text, active):
         btn = QPushButton(text)
@@ -82,6 +108,7 @@ class OptimizeView(QWidget):
         self.stack.setCurrentIndex(index)
         self.btn_convert.setChecked(index == 0)
         self.btn_quantize.setChecked(index == 1)
+        self.btn_benchmark.setChecked(index == 2)
 
     def create_card(self):
         card = QFrame()
@@ -96,6 +123,27 @@ class OptimizeView(QWidget):
         label.setStyleSheet(GROUP_TITLE_STYLE)
         return label
 
+    def create_ort_save_check(self):
+        check = QCheckBox("Save pre-optimized ORT model (fast cold start)")
+        check.setCursor(Qt.CursorShape.PointingHandCursor)
+        check.setStyleSheet(CHECKBOX_STYLE)
+        return check
+
+    def save_optimized_artifacts(self, model_path):
+        manifest = self.ort_exporter.export(model_path, save_ort_format=True)
+        return ", ".join(manifest["artifacts"].values())
+
+    def create_labeled_input(self, row, text, default):
+        col = QVBoxLayout()
+        label = QLabel(text)
+        label.setStyleSheet(f"color: {TEXT_SECONDARY}; font-size: 12px;")
+        edit = QLineEdit(default)
+        edit.setStyleSheet(INPUT_STYLE)
+        col.addWidget(label)
+        col.addWidget(edit)
+        row.addLayout(col, 1)
+        return edit
+
     def create_upload_widget(self, text, subtext, icon_text="↑", callback=None): 
         widget = QFrame()
         widget.setStyleSheet(UPLOAD_WIDGET_STYLE)
@@ -213,8 +261,19 @@ class OptimizeView(QWidget):
         opset_layout.addWidget(opset_label)
         opset_layout.addWidget(self.opset_combo)
         
+        # Exporter
+        exporter_layout = QVBoxLayout()
+        exporter_label = QLabel("Exporter")
+        exporter_label.setStyleSheet(f"color: {TEXT_SECONDARY}; font-size: 12px;")
+        self.exporter_combo = QComboBox()
+        self.exporter_combo.addItems(["Legacy (TorchScript)", "Dynamo (torch.export)", "Auto"])
+        self.exporter_combo.setStyleSheet(INPUT_STYLE)
+        exporter_layout.addWidget(exporter_label)
+        exporter_layout.addWidget(self.exporter_combo)
+
         # row1.addLayout(shape_layout, 2)
         row1.addLayout(opset_layout, 1)
+        row1.addLayout(exporter_layout, 1)
         l2.addLayout(row1)
         
         # Buttons Row
@@ -225,7 +284,35 @@ class OptimizeView(QWidget):
         self.opt_check.setStyleSheet(CHECKBOX_STYLE)
          
         row2.addWidget(self.opt_check)
+
+        self.dynamic_check = QCheckBox("Dynamic Batch/Sequence")
+        self.dynamic_check.setCursor(Qt.CursorShape.PointingHandCursor)
+        self.dynamic_check.setStyleSheet(CHECKBOX_STYLE)
+        row2.addWidget(self.dynamic_check)
         l2.addLayout(row2)
+
+        # Structured Pruning (PyTorch only)
+        self.prune_check = QCheckBox("Structured Pruning (before export)")
+        self.prune_check.setCursor(Qt.CursorShape.PointingHandCursor)
+        self.prune_check.setStyleSheet(CHECKBOX_STYLE)
+        l2.addWidget(self.prune_check)
+
+        prune_row = QHBoxLayout()
+        self.prune_heads_input = self.create_labeled_input(prune_row, "Head Ratio", "0.25")
+        self.prune_mlp_input = self.create_labeled_input(prune_row, "MLP Ratio", "0.3")
+        self.prune_layers_input = self.create_labeled_input(prune_row, "Drop Layers", "0")
+        self.prune_steps_input = self.create_labeled_input(prune_row, "Recovery Steps", "0")
+
+        importance_layout = QVBoxLayout()
+        importance_label = QLabel("Importance")
+        importance_label.setStyleSheet(f"color: {TEXT_SECONDARY}; font-size: 12px;")
+        self.prune_importance_combo = QComboBox()
+        self.prune_importance_combo.addItems(["Magnitude", "Activation"])
+        self.prune_importance_combo.setStyleSheet(INPUT_STYLE)
+        importance_layout.addWidget(importance_label)
+        importance_layout.addWidget(self.prune_importance_combo)
+        prune_row.addLayout(importance_layout, 1)
+        l2.addLayout(prune_row)
         torch_layout.addWidget(card2)
         
         # 3. Action & Output Card
@@ -247,6 +334,9 @@ class OptimizeView(QWidget):
         file_layout.addWidget(self.file_input_convert, 1)
         file_layout.addWidget(browse_out_btn)
         l3.addLayout(file_layout)
+
+        self.ort_save_check_convert = self.create_ort_save_check()
+        l3.addWidget(self.ort_save_check_convert)
         
         # Convert Button
         convert_btn = QPushButton("CONVERT MODEL")
@@ -329,6 +419,40 @@ class OptimizeView(QWidget):
 
 
 
+    class TraceBridge(QObject):
+        event_signal = pyqtSignal(dict)
+
+    class TaskWorker(QThread):
+        finished_signal = pyqtSignal(bool, object)
+
+        def __init__(self, fn):
+            super().__init__()
+            self.fn = fn
+
+        def run(self):
+            try:
+                self.finished_signal.emit(True, self.fn())
+            except Exception as e:
+                self.finished_signal.emit(False, str(e))
+
+    def on_trace_event(self, event):
+        if self.trace_label is not None:
+            self.trace_label.setText(f"Status: {format_event(event)}")
+
+    def task_running(self):
+        # One traced task at a time: workers share trace_label, and rebinding a
+        # running QThread lets it be destroyed mid-run
+        return any(w is not None and w.isRunning() for w in (self.task_worker, self.hf_worker))
+
+    def start_traced_task(self, label, fn, callback):
+        if self.task_running():
+            label.setText("Status: Another task is already running")
+            return
+        self.trace_label = label
+        self.task_worker = self.TaskWorker(fn)
+        self.task_worker.finished_signal.connect(callback)
+        self.task_worker.start()
+
     class HFConversionWorker(QThread):
         finished_signal = pyqtSignal(bool, str)
 
@@ -355,6 +479,9 @@ class OptimizeView(QWidget):
         if not model_id:
             self.status_label_hf.setText("Status: Error - Model ID required")
             return
+        if self.task_running():
+            self.status_label_hf.setText("Status: Another task is already running")
+            return
             
         self.status_label_hf.setText(f"Status: Downloading and converting {model_id}...")
         
@@ -363,11 +490,13 @@ class OptimizeView(QWidget):
         self.hf_output_file.setEnabled(False)
         
         # Create and start worker thread
+        self.trace_label = self.status_label_hf
         self.hf_worker = self.HFConversionWorker(self.transformers_service, model_id, output_file)
         self.hf_worker.finished_signal.connect(self.on_hf_conversion_finished)
         self.hf_worker.start()
 
     def on_hf_conversion_finished(self, success, message):
+        self.trace_label = None
         self.status_label_hf.setText(message)
         # Re-enable inputs
         self.hf_model_id.setEnabled(True)
@@ -433,6 +562,8 @@ class OptimizeView(QWidget):
         self.method_combo.setStyleSheet(INPUT_STYLE)
         method_layout.addWidget(method_label)
         method_layout.addWidget(self.method_combo)
+        # 0 = onnxruntime's single-process calibrator
+        self.calib_workers_input = self.create_labeled_input(method_layout, "Calibration Workers (0 = single process)", "0")
         method_layout.addStretch()
         
         calib_layout.addWidget(self.upload_widget_calib, 1)
@@ -484,6 +615,9 @@ class OptimizeView(QWidget):
         out_row.addWidget(out_lbl)
         out_row.addWidget(self.out_edt_quant, 1)
         l5.addLayout(out_row)
+
+        self.ort_save_check_quant = self.create_ort_save_check()
+        l5.addWidget(self.ort_save_check_quant)
         
         # Quantize Button
         quant_btn = QPushButton("QUANTIZE")
@@ -501,6 +635,220 @@ class OptimizeView(QWidget):
         layout.addStretch()
         return container
 
+    class BenchmarkWorker(QThread):
+        finished_signal = pyqtSignal(bool, object)
+
+        def __init__(self, service: BenchmarkModel, model_path, batch_size, seq_len, profile_ops):
+            super().__init__()
+            self.service = service
+            self.model_path = model_path
+            self.batch_size = batch_size
+            self.seq_len = seq_len
+            self.profile_ops = profile_ops
+
+        def run(self):
+            try:
+                result = self.service.benchmark(
+                    self.model_path,
+                    batch_size=self.batch_size,
+                    seq_len=self.seq_len,
+                    profile_ops=self.profile_ops
+                )
+                self.finished_signal.emit(True, result)
+            except Exception as e:
+                self.finished_signal.emit(False, str(e))
+
+    def create_benchmark_panel(self):
+        container = QWidget()
+        layout = QVBoxLayout(container)
+        layout.setContentsMargins(0, 20, 0, 0)
+        layout.setSpacing(15)
+
+        # 1. Model & Settings
+        card1, l1 = self.create_card()
+        l1.addWidget(self.create_group_title("Model & Settings"))
+
+        input_row = QHBoxLayout()
+        input_label = QLabel("ONNX Model")
+        input_label.setStyleSheet(f"color: {TEXT_SECONDARY};")
+        self.input_edit_bench = QLineEdit("bert_model.onnx")
+        self.input_edit_bench.setStyleSheet(INPUT_STYLE)
+        browse_btn = QPushButton("Browse")
+        browse_btn.setCursor(Qt.CursorShape.PointingHandCursor)
+        browse_btn.setStyleSheet(f"background-color: {ACCENT_BLUE}; color: white; border: none; padding: 5px 10px; border-radius: 4px;")
+        browse_btn.clicked.connect(lambda: self.open_file_dialog(self.input_edit_bench))
+        input_row.addWidget(input_label)
+        input_row.addWidget(self.input_edit_bench, 1)
+        input_row.addWidget(browse_btn)
+        l1.addLayout(input_row)
+
+        settings_row = QHBoxLayout()
+        self.bench_batch_input = self.create_labeled_input(settings_row, "Batch Size", "1")
+        self.bench_seq_input = self.create_labeled_input(settings_row, "Sequence Length", "128")
+        l1.addLayout(settings_row)
+
+        self.profile_ops_check = QCheckBox("Profile Operators (hot-op report)")
+        self.profile_ops_check.setChecked(True)
+        self.profile_ops_check.setCursor(Qt.CursorShape.PointingHandCursor)
+        self.profile_ops_check.setStyleSheet(CHECKBOX_STYLE)
+        l1.addWidget(self.profile_ops_check)
+
+        bench_btn = QPushButton("RUN BENCHMARK")
+        bench_btn.setCursor(Qt.CursorShape.PointingHandCursor)
+        bench_btn.setStyleSheet(BUTTON_PRIMARY_STYLE)
+        bench_btn.clicked.connect(self.run_benchmark)
+        l1.addWidget(bench_btn)
+
+        self.status_label_bench = QLabel("Status: Ready to benchmark")
+        self.status_label_bench.setStyleSheet(f"color: {TEXT_SECONDARY}; font-size: 12px;")
+        self.status_label_bench.setWordWrap(True)
+        l1.addWidget(self.status_label_bench)
+        layout.addWidget(card1)
+
+        # 2. Hot-op Table
+        card2, l2 = self.create_card()
+        l2.addWidget(self.create_group_title("Hot Operators"))
+
+        self.op_table = QTableWidget(0, 5)
+        self.op_table.setHorizontalHeaderLabels(["Op Type", "Calls", "Total (ms)", "Avg (us)", "% Time"])
+        self.op_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        self.op_table.verticalHeader().setVisible(False)
+        self.op_table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.op_table.setStyleSheet(TABLE_STYLE)
+        self.op_table.setMinimumHeight(220)
+        l2.addWidget(self.op_table)
+
+        export_btn = QPushButton("Export Report")
+        export_btn.setCursor(Qt.CursorShape.PointingHandCursor)
+        export_btn.setStyleSheet(f"background-color: {ACCENT_BLUE}; color: white; border: none; padding: 5px 10px; border-radius: 4px;")
+        export_btn.clicked.connect(self.export_op_report)
+        l2.addWidget(export_btn)
+        layout.addWidget(card2)
+
+        # 3. Static Analysis (no model run)
+        card3, l3 = self.create_card()
+        l3.addWidget(self.create_group_title("Static Analysis"))
+
+        analyze_btn = QPushButton("ANALYZE GRAPH")
+        analyze_btn.setCursor(Qt.CursorShape.PointingHandCursor)
+        analyze_btn.setStyleSheet(BUTTON_PRIMARY_STYLE)
+        analyze_btn.clicked.connect(self.run_analysis)
+        l3.addWidget(analyze_btn)
+
+        self.status_label_analysis = QLabel("Status: FLOPs, parameters and peak activation memory per op type")
+        self.status_label_analysis.setStyleSheet(f"color: {TEXT_SECONDARY}; font-size: 12px;")
+        self.status_label_analysis.setWordWrap(True)
+        l3.addWidget(self.status_label_analysis)
+
+        self.analysis_table = QTableWidget(0, 5)
+        self.analysis_table.setHorizontalHeaderLabels(["Op Type", "Count", "GFLOPs", "Params (MB)", "% FLOPs"])
+        self.analysis_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        self.analysis_table.verticalHeader().setVisible(False)
+        self.analysis_table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.analysis_table.setStyleSheet(TABLE_STYLE)
+        self.analysis_table.setMinimumHeight(220)
+        l3.addWidget(self.analysis_table)
+
+        export_analysis_btn = QPushButton("Export Analysis")
+        export_analysis_btn.setCursor(Qt.CursorShape.PointingHandCursor)
+        export_analysis_btn.setStyleSheet(f"background-color: {ACCENT_BLUE}; color: white; border: none; padding: 5px 10px; border-radius: 4px;")
+        export_analysis_btn.clicked.connect(self.export_analysis)
+        l3.addWidget(export_analysis_btn)
+        layout.addWidget(card3)
+
+        layout.addStretch()
+        return container
+
+    def run_analysis(self):
+        model_path = self.input_edit_bench.text()
+        try:
+            batch_size = int(self.bench_batch_input.text())
+            seq_len = int(self.bench_seq_input.text())
+        except ValueError:
+            self.status_label_analysis.setText("Status: Error - Batch size and sequence length must be integers")
+            return
+
+        self.status_label_analysis.setText(f"Status: Analyzing {model_path}...")
+        self.start_traced_task(self.status_label_analysis,
+                               lambda: self.analyzer.analyze(model_path, batch_size, seq_len),
+                               self.on_analysis_finished)
+
+    def on_analysis_finished(self, success, result):
+        self.trace_label = None
+        if not success:
+            self.status_label_analysis.setText(f"Status: Error - {result}")
+            return
+
+        self.last_analysis = result
+        self.status_label_analysis.setText(
+            f"Status: {result['flops'] / 1e9:.2f} GFLOPs, {result['params'] / 1e6:.1f}M params "
+            f"({result['param_bytes'] / (1024 * 1024):.1f} MB), peak activations "
+            f"{result['peak_activation_bytes'] / (1024 * 1024):.1f} MB"
+        )
+        rows = result["by_op_type"]
+        self.analysis_table.setRowCount(len(rows))
+        for i, r in enumerate(rows):
+            values = [r["op_type"], str(r["count"]), f"{r['flops'] / 1e9:.3f}",
+                      f"{r['param_bytes'] / (1024 * 1024):.2f}", f"{r['percent']:.1f}"]
+            for j, value in enumerate(values):
+                self.analysis_table.setItem(i, j, QTableWidgetItem(value))
+
+    def export_analysis(self):
+        if not self.last_analysis:
+            self.status_label_analysis.setText("Status: Error - Analyze a model first")
+            return
+        file_path, _ = QFileDialog.getSaveFileName(self, "Export Analysis", "analysis.json", "JSON (*.json)")
+        if file_path:
+            self.analyzer.export(self.last_analysis, file_path)
+            self.status_label_analysis.setText(f"Status: Analysis exported to {file_path}")
+
+    def run_benchmark(self):
+        model_path = self.input_edit_bench.text()
+        try:
+            batch_size = int(self.bench_batch_input.text())
+            seq_len = int(self.bench_seq_input.text())
+        except ValueError:
+            self.status_label_bench.setText("Status: Error - Batch size and sequence length must be integers")
+            return
+
+        self.status_label_bench.setText(f"Status: Benchmarking {model_path}...")
+        self.bench_worker = self.BenchmarkWorker(
+            self.benchmarker, model_path, batch_size, seq_len, self.profile_ops_check.isChecked()
+        )
+        self.bench_worker.finished_signal.connect(self.on_benchmark_finished)
+        self.bench_worker.start()
+
+    def on_benchmark_finished(self, success, result):
+        if not success:
+            self.status_label_bench.setText(f"Status: Error - {result}")
+            return
+
+        message = (f"Status: p50 {result['latency_p50_ms']:.2f} ms, p95 {result['latency_p95_ms']:.2f} ms, "
+                   f"{result['throughput']:.1f} samples/s")
+        report = result.get("op_report")
+        if report:
+            message += f" | Q/DQ overhead {report['quantization_overhead_pct']:.1f}%"
+            self.show_op_table(report["by_op_type"])
+        self.last_op_report = report
+        self.status_label_bench.setText(message)
+
+    def show_op_table(self, rows):
+        self.op_table.setRowCount(len(rows))
+        for i, r in enumerate(rows):
+            values = [r["op_type"], str(r["calls"]), f"{r['total_us'] / 1000:.2f}",
+                      f"{r['avg_us']:.1f}", f"{r['percent']:.1f}"]
+            for j, value in enumerate(values):
+                self.op_table.setItem(i, j, QTableWidgetItem(value))
+
+    def export_op_report(self):
+        if not self.last_op_report:
+            self.status_label_bench.setText("Status: Error - Run a profiled benchmark first")
+            return
+        file_path, _ = QFileDialog.getSaveFileName(self, "Export Hot-op Report", "hot_ops.csv", "Reports (*.csv *.json)")
+        if file_path:
+            self.op_profiler.export(self.last_op_report, file_path)
+            self.status_label_bench.setText(f"Status: Report exported to {file_path}")
+
     def select_source_model(self):
         file_path, _ = QFileDialog.getOpenFileName(self, "Select Source Model", "", "Model Files (*.pt *.pth *.pb *.h5)")
         if file_path:
@@ -512,7 +860,7 @@ class OptimizeView(QWidget):
             layout.itemAt(1).widget().setText(f"{filename} - Selected")
 
     def select_calib_data(self):
-        file_path, _ = QFileDialog.getOpenFileName(self, "Select Calibration Data", "", "Data Files (*.npy *.json *.txt)")
+        file_path, _ = QFileDialog.getOpenFileName(self, "Select Calibration Data", "", "Data Files (*.npy *.npz *.json *.txt)")
         if file_path:
             self.calib_data_path = file_path
             layout = self.upload_widget_calib.layout()
@@ -529,24 +877,56 @@ class OptimizeView(QWidget):
         shapes = self.shape_input.text()
         opset = int(self.opset_combo.currentText().split()[0])
         optimize = self.opt_check.isChecked()
+        exporter = self.exporter_combo.currentText().split()[0].lower()
+        dynamic = self.dynamic_check.isChecked()
         
         self.status_label_convert.setText("Status: Converting...")
-        # Since logic might be blocking, ideally use QThread. For now, calling directly.
         try:
+            prune_options = None
+            if self.prune_check.isChecked():
+                prune_options = {
+                    "head_ratio": float(self.prune_heads_input.text() or 0),
+                    "mlp_ratio": float(self.prune_mlp_input.text() or 0),
+                    "layers_to_drop": int(self.prune_layers_input.text() or 0),
+                    "finetune_steps": int(self.prune_steps_input.text() or 0),
+                    "importance": self.prune_importance_combo.currentText().lower(),
+                }
+        except ValueError as e:
+            self.status_label_convert.setText(f"Status: Error - {str(e)}")
+            return
+
+        def task():
             success = self.converter.convert(
                 self.start_model_path,
                 output_path,
                 framework,
                 shapes,
                 opset,
-                optimize
+                optimize,
+                prune_options,
+                exporter,
+                dynamic
             )
-            if success:
-                self.status_label_convert.setText(f"Status: Success - Saved to {output_path}")
-            else:
-                self.status_label_convert.setText("Status: Failed")
-        except Exception as e:
-            self.status_label_convert.setText(f"Status: Error - {str(e)}")
+            if not success:
+                return None
+            message = f"Status: Success - Saved to {output_path}"
+            if self.converter.last_report.get("exporter"):
+                message += f" [{self.converter.last_report['exporter']} exporter]"
+            compaction = self.converter.last_report.get("compaction")
+            if compaction:
+                message += f" [{compaction['bytes_saved'] / (1024 * 1024):.1f} MB saved]"
+            if self.ort_save_check_convert.isChecked() and output_path.endswith(".onnx"):
+                message += f" (+ {self.save_optimized_artifacts(output_path)})"
+            return message
+
+        self.start_traced_task(self.status_label_convert, task, self.on_conversion_finished)
+
+    def on_conversion_finished(self, success, result):
+        self.trace_label = None
+        if not success:
+            self.status_label_convert.setText(f"Status: Error - {result}")
+        else:
+            self.status_label_convert.setText(result or "Status: Failed")
 
     def run_quantization(self):
         input_model = self.input_edit_quant.text()
@@ -555,9 +935,15 @@ class OptimizeView(QWidget):
         calib_method = self.method_combo.currentText()
         quant_type = "QDQ" if self.type_qdq.isChecked() else "INT8"
         per_channel = self.per_channel_check.isChecked()
+        try:
+            calib_workers = int(self.calib_workers_input.text() or 0)
+        except ValueError:
+            self.status_label_quant.setText("Status: Error - Calibration workers must be an integer")
+            return
         
         self.status_label_quant.setText("Status: Quantizing...")
-        try:
+
+        def task():
             success = self.quantizer.quantize(
                 input_model,
                 output_model,
@@ -565,12 +951,21 @@ class OptimizeView(QWidget):
                 calib_method,
                 quant_type,
                 per_channel,
-                self.calib_data_path
+                self.calib_data_path,
+                calib_workers
             )
-            if success:
-                self.status_label_quant.setText("Status: Success - Quantized model saved")
-            else:
-                self.status_label_quant.setText("Status: Failed")
-        except Exception as e:
-            self.status_label_quant.setText(f"Status: Error - {str(e)}")
-            print(f"Quantization Failed: {e}")
+            if not success:
+                return None
+            message = "Status: Success - Quantized model saved"
+            if self.ort_save_check_quant.isChecked():
+                message += f" (+ {self.save_optimized_artifacts(output_model)})"
+            return message
+
+        self.start_traced_task(self.status_label_quant, task, self.on_quantization_finished)
+
+    def on_quantization_finished(self, success, result):
+        self.trace_label = None
+        if not success:
+            self.status_label_quant.setText(f"Status: Error - {result}")
+        else:
+            self.status_label_quant.setText(result or "Status: Failed")
@@ -1,12 +1,218 @@
-from PyQt6.QtWidgets import QWidget, QVBoxLayout, QLabel
-from PyQt6.QtCore import Qt
-from src.styles.theme import VIEW_LABEL_STYLE
+import os
+from PyQt6.QtWidgets import (
+    QWidget, QVBoxLayout, QHBoxLayout, QLabel, QFrame,
+    QLineEdit, QPushButton, QFileDialog, QComboBox, QProgressBar
+)
+from PyQt6.QtCore import Qt, QThread, pyqtSignal
+from src.styles.theme import (
+    OPTIMIZE_VIEW_STYLE, CARD_STYLE, GROUP_TITLE_STYLE,
+    INPUT_STYLE, BUTTON_PRIMARY_STYLE, TEXT_SECONDARY, ACCENT_BLUE
+)
+from services.train_service import TrainModel, TRAIN_MODES
 
 class TrainView(QWidget):
     def __init__(self):
         super().__init__()
-        layout = QVBoxLayout(self)
-        label = QLabel("Hello Train")
-        label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-        label.setStyleSheet(VIEW_LABEL_STYLE)
-        layout.addWidget(label)
+        self.setStyleSheet(OPTIMIZE_VIEW_STYLE)
+
+        # State
+        self.train_worker = None
+
+        # Main Layout
+        main_layout = QVBoxLayout(self)
+        main_layout.setSpacing(20)
+        main_layout.setContentsMargins(20, 20, 20, 20)
+
+        # 1. Model & Data Section
+        files_card, files_layout = self.create_card()
+        files_layout.addWidget(self.create_group_title("Model & Data"))
+
+        model_row = QHBoxLayout()
+        self.model_input = self.create_labeled_input(model_row, "PyTorch Model (.pt / .pth)", "")
+        self.model_input.setPlaceholderText("Eager model saved with torch.save")
+        model_row.addWidget(self.create_browse_button(self.browse_model_file), 0, Qt.AlignmentFlag.AlignBottom)
+        files_layout.addLayout(model_row)
+
+        data_row = QHBoxLayout()
+        self.data_input = self.create_labeled_input(data_row, "Training Data (.pt / .npy / .npz, optional)", "")
+        self.data_input.setPlaceholderText("Inputs (first axis = samples); a 'labels' entry enables a supervised loss")
+        data_row.addWidget(self.create_browse_button(self.browse_data_file), 0, Qt.AlignmentFlag.AlignBottom)
+        files_layout.addLayout(data_row)
+
+        output_row = QHBoxLayout()
+        self.output_input = self.create_labeled_input(output_row, "Output ONNX", "")
+        self.shapes_input = self.create_labeled_input(output_row, "Input Shapes (without data)", "")
+        self.shapes_input.setPlaceholderText("e.g. int64[1,128]")
+        files_layout.addLayout(output_row)
+
+        main_layout.addWidget(files_card)
+
+        # 2. Training Section
+        train_card, train_layout = self.create_card()
+        train_layout.addWidget(self.create_group_title("Fine-Tuning (QAT / LoRA)"))
+
+        settings_row = QHBoxLayout()
+        mode_col = QVBoxLayout()
+        mode_label = QLabel("Mode")
+        mode_label.setStyleSheet(f"color: {TEXT_SECONDARY}; font-size: 12px;")
+        self.mode_combo = QComboBox()
+        self.mode_combo.addItems(list(TRAIN_MODES))
+        self.mode_combo.setStyleSheet(INPUT_STYLE)
+        mode_col.addWidget(mode_label)
+        mode_col.addWidget(self.mode_combo)
+        settings_row.addLayout(mode_col, 1)
+        self.steps_input = self.create_labeled_input(settings_row, "Steps", "200")
+        self.lr_input = self.create_labeled_input(settings_row, "Learning Rate", "1e-5")
+        self.batch_input = self.create_labeled_input(settings_row, "Batch Size", "8")
+        train_layout.addLayout(settings_row)
+
+        qat_row = QHBoxLayout()
+        self.calib_steps_input = self.create_labeled_input(qat_row, "QAT Range Init Steps", "16")
+        self.exclude_input = self.create_labeled_input(qat_row, "Skip Modules (comma separated)", "")
+        self.exclude_input.setPlaceholderText("e.g. lm_head, classifier")
+        self.opset_input = self.create_labeled_input(qat_row, "Opset", "17")
+        train_layout.addLayout(qat_row)
+
+        lora_row = QHBoxLayout()
+        self.lora_rank_input = self.create_labeled_input(lora_row, "LoRA Rank", "8")
+        self.lora_alpha_input = self.create_labeled_input(lora_row, "LoRA Alpha", "16")
+        self.lora_targets_input = self.create_labeled_input(lora_row, "LoRA Targets (comma separated)", "")
+        self.lora_targets_input.setPlaceholderText("Default: attention and MLP projections")
+        train_layout.addLayout(lora_row)
+
+        self.train_btn = QPushButton("TRAIN & EXPORT")
+        self.train_btn.setCursor(Qt.CursorShape.PointingHandCursor)
+        self.train_btn.setStyleSheet(BUTTON_PRIMARY_STYLE)
+        self.train_btn.clicked.connect(self.run_training)
+        train_layout.addWidget(self.train_btn)
+
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setValue(0)
+        train_layout.addWidget(self.progress_bar)
+
+        self.train_status = QLabel("Status: Idle")
+        self.train_status.setStyleSheet(f"color: {TEXT_SECONDARY}; font-size: 12px;")
+        self.train_status.setWordWrap(True)
+        train_layout.addWidget(self.train_status)
+
+        main_layout.addWidget(train_card)
+        main_layout.addStretch()
+
+    def create_card(self):
+        card = QFrame()
+        card.setStyleSheet(CARD_STYLE)
+        layout = QVBoxLayout(card)
+        layout.setSpacing(15)
+        layout.setContentsMargins(15, 15, 15, 15)
+        return card, layout
+
+    def create_group_title(self, text):
+        label = QLabel(text)
+        label.setStyleSheet(GROUP_TITLE_STYLE)
+        return label
+
+    def create_labeled_input(self, row, text, default):
+        col = QVBoxLayout()
+        label = QLabel(text)
+        label.setStyleSheet(f"color: {TEXT_SECONDARY}; font-size: 12px;")
+        edit = QLineEdit(default)
+        edit.setStyleSheet(INPUT_STYLE)
+        col.addWidget(label)
+        col.addWidget(edit)
+        row.addLayout(col, 1)
+        return edit
+
+    def create_browse_button(self, slot):
+        btn = QPushButton("Browse")
+        btn.setCursor(Qt.CursorShape.PointingHandCursor)
+        btn.setStyleSheet(f"background-color: {ACCENT_BLUE}; color: white; border: none; padding: 5px 10px; border-radius: 4px;")
+        btn.clicked.connect(slot)
+        return btn
+
+    def browse_model_file(self):
+        file_path, _ = QFileDialog.getOpenFileName(self, "Select PyTorch Model", "", "PyTorch Models (*.pt *.pth)")
+        if file_path:
+            self.model_input.setText(file_path)
+            if not self.output_input.text():
+                self.output_input.setText(f"{os.path.splitext(file_path)[0]}.{self.mode_combo.currentText()}.onnx")
+
+    def browse_data_file(self):
+        file_path, _ = QFileDialog.getOpenFileName(self, "Select Training Data", "", "Sample Data (*.pt *.npy *.npz)")
+        if file_path:
+            self.data_input.setText(file_path)
+
+    class TrainWorker(QThread):
+        progress_signal = pyqtSignal(dict)
+        finished_signal = pyqtSignal(bool, object)
+
+        def __init__(self, kwargs):
+            super().__init__()
+            self.kwargs = kwargs
+
+        def run(self):
+            try:
+                trainer = TrainModel()
+                trainer.train(progress_callback=self.progress_signal.emit, **self.kwargs)
+                self.finished_signal.emit(True, trainer.last_report)
+            except Exception as e:
+                self.finished_signal.emit(False, str(e))
+
+    def run_training(self):
+        if self.train_worker is not None and self.train_worker.isRunning():
+            self.train_status.setText("Status: Training is already running")
+            return
+        model_path = self.model_input.text()
+        output_path = self.output_input.text()
+        if not model_path or not output_path:
+            self.train_status.setText("Status: Error - Select a model and an output path")
+            return
+
+        try:
+            kwargs = {
+                "input_path": model_path,
+                "output_path": output_path,
+                "mode": self.mode_combo.currentText(),
+                "data_path": self.data_input.text() or None,
+                "input_shapes": self.shapes_input.text() or None,
+                "steps": int(self.steps_input.text()),
+                "lr": float(self.lr_input.text()),
+                "batch_size": int(self.batch_input.text()),
+                "calibration_steps": int(self.calib_steps_input.text() or 0),
+                "exclude": [p.strip() for p in self.exclude_input.text().split(",") if p.strip()],
+                "lora_rank": int(self.lora_rank_input.text() or 8),
+                "lora_alpha": float(self.lora_alpha_input.text() or 16),
+                "lora_targets": [p.strip() for p in self.lora_targets_input.text().split(",") if p.strip()] or None,
+                "opset_version": int(self.opset_input.text() or 17),
+            }
+        except ValueError:
+            self.train_status.setText("Status: Error - Steps, batch size, rank and opset must be integers, LR a number")
+            return
+
+        self.train_btn.setEnabled(False)
+        self.progress_bar.setValue(0)
+        self.train_status.setText("Status: Loading model...")
+        self.train_worker = self.TrainWorker(kwargs)
+        self.train_worker.progress_signal.connect(self.on_train_progress)
+        self.train_worker.finished_signal.connect(self.on_train_finished)
+        self.train_worker.start()
+
+    def on_train_progress(self, progress):
+        self.progress_bar.setValue(int(100 * progress["step"] / max(1, progress["steps"])))
+        self.train_status.setText(f"Status: Step {progress['step']}/{progress['steps']}, loss {progress['loss']:.6f}")
+
+    def on_train_finished(self, success, result):
+        self.train_btn.setEnabled(True)
+        if not success:
+            self.train_status.setText(f"Status: Error - {result}")
+            return
+        self.progress_bar.setValue(100)
+        if result["mode"] == "lora":
+            summary = (f"{result['adapted_layers']} adapters merged, {result['trainable_params']:,} of "
+                       f"{result['total_params']:,} parameters trained")
+        else:
+            summary = f"{result['quantized_layers']} layers quantized"
+        status = f"Status: Done - {summary}, final loss {result['final_loss']:.6f} -> {result.get('output_path')}"
+        if result.get("onnx_max_abs_diff") is not None:
+            status += f" (ONNX vs. PyTorch max diff {result['onnx_max_abs_diff']:.4g})"
+        self.train_status.setText(status)